@@ -2,36 +2,62 @@
 """Main Flask entrypoint.
 
 Run with:
+  (venv) python tools/migrate.py   # once per deploy: indexes
   (venv) python app.py
+
+Building the app does not touch MongoDB: the shared client in utils/db.py
+connects on the first query, so `app:app` imports in milliseconds and tests
+can call create_app() without a database.
 """
 
 from flask import Flask, jsonify
 from flask_cors import CORS
-from utils.db import db, users
 from routes.auth import auth_bp
+from routes.metrics import metrics_bp
+from routes.admin import admin_bp
+from utils import compression
+from utils import consistency
 import os
 
-app = Flask(__name__)
 
-# Configure CORS using an environment variable so you can set the allowed
-# frontend origins in the Azure settings without changing code. If
-# `FRONTEND_ORIGINS` is not set, fallback to allowing all origins (useful
-# for local testing). Provide a comma-separated list for multiple origins.
-frontend_origins = os.environ.get("FRONTEND_ORIGINS", "").strip()
-if frontend_origins:
-  origins = [o.strip() for o in frontend_origins.split(",") if o.strip()]
-  CORS(app, resources={r"/*": {"origins": origins}}, supports_credentials=True)
-else:
-  # No specific origins configured: allow all (default). In production it's
-  # better to set FRONTEND_ORIGINS to the exact origin(s) of your frontend.
-  CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+def create_app():
+  app = Flask(__name__)
+  # JSON bodies are parsed in memory; large vaults go through PUT /vault/blob,
+  # which streams and has its own limit (VAULT_MAX_BYTES)
+  app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_REQUEST_BYTES", 16 * 1024 * 1024))
+
+  # Configure CORS using an environment variable so you can set the allowed
+  # frontend origins in the Azure settings without changing code. If
+  # `FRONTEND_ORIGINS` is not set, fallback to allowing all origins (useful
+  # for local testing). Provide a comma-separated list for multiple origins.
+  frontend_origins = os.environ.get("FRONTEND_ORIGINS", "").strip()
+  if frontend_origins:
+    origins = [o.strip() for o in frontend_origins.split(",") if o.strip()]
+    CORS(app, resources={r"/*": {"origins": origins}}, supports_credentials=True, expose_headers=["ETag", consistency.READ_AFTER_HEADER])
+  else:
+    # No specific origins configured: allow all (default). In production it's
+    # better to set FRONTEND_ORIGINS to the exact origin(s) of your frontend.
+    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True, expose_headers=["ETag", consistency.READ_AFTER_HEADER])
+
+  app.register_blueprint(auth_bp)
+  app.register_blueprint(metrics_bp)
+  app.register_blueprint(admin_bp)
+  compression.init_app(app)
+  consistency.init_app(app)
+
+  @app.errorhandler(413)
+  def too_large(_e):
+    return jsonify({"status": "error", "message": "Request body too large"}), 413
+
+  @app.route("/")
+  def home():
+    return "Flask backend running with MongoDB!"
 
-app.register_blueprint(auth_bp)
+  return app
 
 
-@app.route("/")
-def home():
-  return "Flask backend running with MongoDB!"
+# gunicorn entry point (app:app)
+app = create_app()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+# asgi.py
+"""Asyncio entrypoint, next to app.py.
+
+Run with:
+  (venv) python tools/migrate.py   # once per deploy: indexes
+  (venv) hypercorn -c file:hypercorn.conf.py asgi:app
+
+The hot routes are async handlers (routes/aio.py): challenge, verify,
+one-shot login and epoch, logout, GET/POST /vault and the plain entries. One
+event loop then keeps many logins and vault reads in flight while it waits
+on Mongo (pymongo's AsyncMongoClient, utils/adb.py) and on the verification
+pool, with no thread per request. Every other route, and every CORS
+preflight, is passed unchanged to the Flask app from app.py on the loop's
+thread pool. Those are the admin endpoints, metrics, register, backup,
+/auth/verify/batch and /vault/blob. hypercorn's WSGI adapter reads a request
+body in full before calling Flask, so PUT /vault/blob holds the upload in
+memory here (up to VAULT_MAX_BYTES). Causally consistent reads (X-Read-After,
+MONGO_READ_*) are a Flask-only feature; the async routes read from the primary.
+"""
+
+import os
+
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from app import app as flask_app
+from routes.aio import aio_bp
+from utils import adb, blobstore, compression, consistency, verify_pool
+
+
+def _cors(app):
+  """Same CORS headers as flask-cors gives app.py (FRONTEND_ORIGINS, credentials)."""
+  origins = [o.strip() for o in os.environ.get("FRONTEND_ORIGINS", "").split(",") if o.strip()]
+  expose = ", ".join(["ETag", consistency.READ_AFTER_HEADER])
+
+  @app.after_request
+  async def add_cors_headers(response):
+    origin = request.headers.get("Origin")
+    if origin and (not origins or origin in origins):
+      response.headers["Access-Control-Allow-Origin"] = origin
+      response.headers["Access-Control-Expose-Headers"] = expose
+      response.headers["Access-Control-Allow-Credentials"] = "true"
+      if origins:
+        response.vary.add("Origin")
+    return response
+
+
+def create_async_app():
+  app = Quart(__name__)
+  app.config["MAX_CONTENT_LENGTH"] = flask_app.config["MAX_CONTENT_LENGTH"]
+  app.register_blueprint(aio_bp)
+  _cors(app)
+  compression.init_async_app(app)
+
+  @app.errorhandler(413)
+  async def too_large(_e):
+    return jsonify({"status": "error", "message": "Request body too large"}), 413
+
+  @app.before_serving
+  async def start_verify_pool():
+    # spawning the pool blocks; do it before the first request rather than inside one
+    await adb.run_blocking(verify_pool.start)
+
+  return app
+
+
+def _never_empty(wsgi_app):
+  """hypercorn's WSGI adapter sends the status line along with the first body
+  chunk, so a response without one (a preflight, a 304, HEAD) would never
+  start. Yield an empty chunk for those."""
+  def app(environ, start_response):
+    body = wsgi_app(environ, start_response)
+    try:
+      empty = True
+      for chunk in body:
+        empty = False
+        yield chunk
+      if empty:
+        yield b""
+    finally:
+      if hasattr(body, "close"):
+        body.close()
+  return app
+
+
+class Dispatcher:
+  """ASGI app: HTTP requests the async app has a handler for go to it, the
+  rest to the Flask app. Lifespan events go to the async app."""
+
+  def __init__(self, async_app, wsgi_app):
+    self.async_app = async_app
+    self.wsgi = AsyncioWSGIMiddleware(_never_empty(wsgi_app), max_body_size=blobstore.VAULT_MAX_BYTES)
+    self._routes = async_app.url_map.bind("localhost")
+
+  def handles(self, method, path):
+    if method == "OPTIONS":
+      return False
+    try:
+      self._routes.match(path, method=method)
+    except HTTPException:
+      return False
+    return True
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] == "http" and not self.handles(scope["method"], scope["path"]):
+      await self.wsgi(scope, receive, send)
+    else:
+      await self.async_app(scope, receive, send)
+
+
+async_app = create_async_app()
+
+# hypercorn entry point (asgi:app)
+app = Dispatcher(async_app, flask_app)
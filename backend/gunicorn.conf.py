@@ -0,0 +1,58 @@
+"""Gunicorn settings, read with `gunicorn -c gunicorn.conf.py app:app` (see Dockerfile).
+
+GUNICORN_THREADS=1 keeps the plain sync workers. Above 1, each worker is a
+gthread worker that serves that many requests at once. Requests mostly wait
+on Mongo/SQLite, GridFS streams and the verification pool, so one process
+then overlaps many vault reads and writes. The per-process state is safe to
+share between threads: caches are lock-striped (CACHE_STRIPES), a login
+challenge is consumed with one atomic call, and the Mongo pool, audit writer
+and verification pool are shared. tools/stress_challenges.py checks that a
+challenge cannot be spent twice under contention.
+
+When raising GUNICORN_THREADS, keep MONGO_MAX_POOL_SIZE at least that high
+so threads do not queue for a connection (MONGO_WAIT_QUEUE_TIMEOUT_MS).
+
+VERIFY_POOL_WORKERS/VERIFY_QUEUE_MAX default by worker class; see utils/verify_pool.py.
+
+GUNICORN_PRELOAD=true imports the app once in the master and forks the
+workers from it. The master also builds the curve tables and warms the user
+cache, then freezes its heap, so the workers share all of it (utils/preload.py).
+Each worker then starts its verification pool before taking requests. Code
+changes then need a full restart, not a HUP. tools/bench_startup.py compares
+worker memory and time to first login with and without preload.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("GUNICORN_WORKERS", "3"))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+worker_class = "gthread" if threads > 1 else "sync"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# idle keep-alive connections hold a gthread slot only while waiting for the next request
+keepalive = 5
+
+# set before the workers import utils.verify_pool; blank or unset means "by worker class"
+if not os.getenv("VERIFY_POOL_WORKERS"):
+    os.environ["VERIFY_POOL_WORKERS"] = "2" if threads > 1 else "0"
+if not os.getenv("VERIFY_QUEUE_MAX"):
+    os.environ["VERIFY_QUEUE_MAX"] = str(max(1, threads // 2))
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").strip().lower() in ("1", "true", "yes")
+
+
+def when_ready(server):
+    # master, after the preloaded import and before the first fork
+    if preload_app:
+        from utils import preload
+        preload.warm(log=server.log.info)
+
+
+def post_worker_init(worker):
+    if preload_app:
+        from utils import preload
+        preload.start_worker()
@@ -0,0 +1,17 @@
+"""Hypercorn settings for the asyncio entrypoint, read with
+`hypercorn -c file:hypercorn.conf.py asgi:app` (see asgi.py and Dockerfile).
+
+Each worker process runs one event loop. The async routes need no thread per
+request, so one worker holds many concurrent logins and vault reads; size
+HYPERCORN_WORKERS by CPU cores rather than by expected concurrency. Keep
+MONGO_MAX_POOL_SIZE at least as high as the requests a worker should have
+waiting on Mongo at once. Routes served by the Flask app share the loop's
+default thread pool (min(32, cores + 4) threads).
+"""
+
+import os
+
+bind = [f"0.0.0.0:{os.getenv('PORT', '5000')}"]
+workers = int(os.getenv("HYPERCORN_WORKERS", "3"))
+worker_class = "asyncio"
+keep_alive_timeout = 5
@@ -0,0 +1,80 @@
+import json
+import os
+import secrets
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from utils import audit_rollups
+from utils.audit_query import parse_time
+from utils.user_import import import_users
+
+admin_bp = Blueprint("admin", __name__)
+
+# Bearer token for the /admin endpoints; they are disabled (404) while it is unset.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Upper bound on one import upload (the body is streamed, never held in memory)
+ADMIN_IMPORT_MAX_BYTES = int(os.getenv("ADMIN_IMPORT_MAX_BYTES", str(1024 * 1024 * 1024)))
+# buckets returned by /admin/stats/audit when no `since` is given
+STATS_DEFAULT_BUCKETS = 60
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"status": "error", "message": "Not found"}), 404
+        auth_header = request.headers.get("Authorization", "")
+        if not secrets.compare_digest(auth_header, f"Bearer {ADMIN_TOKEN}"):
+            return jsonify({"status": "error", "message": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@admin_bp.route("/admin/users/import", methods=["POST"])
+@admin_required
+def import_users_ndjson():
+    """
+    Bulk-register users from an NDJSON body, one /auth/register record per line.
+    Streams back NDJSON: one result per record, then {"summary": {...}}.
+    """
+    request.max_content_length = ADMIN_IMPORT_MAX_BYTES
+    source = request.args.get("source") or request.remote_addr
+
+    def generate():
+        counts = {"created": 0, "error": 0}
+        for result in import_users(request.stream, source=source):
+            counts[result["status"]] += 1
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"summary": counts}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@admin_bp.route("/admin/stats/audit", methods=["GET"])
+@admin_required
+def audit_stats():
+    """
+    Event counts per minute or hour from the audit rollups.
+    Query: ?granularity=minute|hour&since=ISO&until=ISO&event=LOGIN_SUCCESS&event=...&user=alice
+    Defaults to the last 60 buckets, every event type, all users.
+    """
+    granularity = request.args.get("granularity", "minute")
+    if granularity not in audit_rollups.GRANULARITIES:
+        return jsonify({"status": "error", "message": "granularity must be minute or hour"}), 400
+    try:
+        until = parse_time(request.args.get("until")) or datetime.utcnow()
+        since = parse_time(request.args.get("since")) or until - STATS_DEFAULT_BUCKETS * audit_rollups.GRANULARITIES[granularity][1]
+        stats = audit_rollups.series(granularity, since, until,
+                                     event_types=request.args.getlist("event") or None,
+                                     username=request.args.get("user"))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    return jsonify({
+        "status": "success",
+        "granularity": granularity,
+        "buckets": [bucket.isoformat() + "Z" for bucket in stats["buckets"]],
+        "series": stats["series"],
+        "totals": stats["totals"],
+    })
@@ -0,0 +1,254 @@
+# routes/aio.py
+"""
+Async versions of the hot auth and vault routes, served by asgi.py.
+
+Same paths, bodies, statuses and headers as their routes/auth.py twins: the
+request parsing, validation and response shaping are routes/auth.py's
+helpers, and only the awaited I/O is written here. Lookups and writes go
+through the utils *_async functions (utils/adb.py), proofs through
+verify_pool.verify_async, and chunked vault blobs are streamed from storage
+on worker threads. The challenge replay cache, user cache and session cache
+are the ones the Flask routes use.
+"""
+import time
+from functools import wraps
+
+from quart import Blueprint, request
+
+from routes.auth import (VAULT_WRITE_ERRORS, used_challenges, _batch_applied, _batch_operations,
+                         _bearer_token, _challenge_issued, _charged_usernames, _check_login, _check_proof,
+                         _client_ip, _decode_proof, _entries_page, _entries_query, _entry_arg, _entry_deleted,
+                         _entry_saved, _epoch_response, _error, _logged_in, _logged_out, _login_failed,
+                         _rejected, _retry_after, _session_payload, _session_token, _too_many_requests,
+                         _unauthorized, _vault_blob_arg, _vault_response, _vault_write_failed, _vault_written)
+from utils import adb, user_repo, vault, verify_pool
+from utils import entries as entries_store
+from utils.logger import log_event
+from utils.metrics import start_trace
+from utils.ratelimit import RATE_LIMIT_BACKEND
+from utils.sessions import create_session_async, resolve_session_async, revoke_session_async
+
+aio_bp = Blueprint("aio", __name__)
+
+
+def rate_limited(view):
+    """routes.auth.rate_limited for async views. Only the in-memory counters
+    are checked on the event loop; a mongo or sqlite store is hit from a thread."""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        usernames = _charged_usernames(request.args, await request.get_json(silent=True))
+        if RATE_LIMIT_BACKEND == "memory":
+            retry_after = _retry_after(_client_ip(request), usernames)
+        else:
+            retry_after = await adb.run_blocking(_retry_after, _client_ip(request), usernames)
+        if retry_after:
+            return _too_many_requests(retry_after)
+        return await view(*args, **kwargs)
+    return wrapper
+
+
+async def _username():
+    body = await request.get_json(silent=True) if request.method in ("POST", "PUT", "PATCH") else None
+    token = _session_token(request, lambda: body or {})
+    if not token:
+        return None
+    return await resolve_session_async(token)
+
+
+async def _in_threads(chunks):
+    """Iterate a blocking chunk iterator on worker threads."""
+    done = object()
+    while True:
+        chunk = await adb.run_blocking(next, chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+@aio_bp.route("/auth/challenge", methods=["POST"])
+@rate_limited
+async def generate_challenge():
+    data = await request.get_json()
+    return _challenge_issued(await user_repo.get_auth_async(data.get("username")))
+
+
+async def _start_session(proof, trace, if_none_match=None):
+    """routes.auth._start_session, awaiting the session insert and vault read."""
+    username = proof["username"]
+    if not used_challenges.consume(proof["challenge_key"], proof["challenge"]["exp"]):
+        return None
+    with trace.stage("session_insert"):
+        token = await create_session_async(username, challenge_key=proof["challenge_key"],
+                                           challenge_exp=proof["challenge"]["exp"])
+    if token is None:
+        return None
+
+    with trace.stage("audit_write"):
+        log_event("LOGIN_SUCCESS", username=username, details="EC Schnorr proof verified successfully.")
+
+    with trace.stage("vault_read"):
+        stored = await vault.read_vault_async(proof["user"]["username_norm"])
+    return _session_payload(token, stored, if_none_match)
+
+
+async def _login_with(check, data, username, trace):
+    """routes.auth._login_with; `check` is _check_proof or _check_login."""
+    try:
+        claim, error = check(data)
+        if not error:
+            with trace.stage("user_lookup"):
+                user = await user_repo.get_auth_async(claim[0])
+            proof, error = _decode_proof(claim, user, trace)
+        if error:
+            return _rejected(error, trace)
+
+        with trace.stage("scalar_mult"):
+            valid = await verify_pool.verify_async(proof["Y"], proof["R"], proof["e"], proof["s"])
+
+        if valid:
+            started = await _start_session(proof, trace, if_none_match=request.headers.get("If-None-Match"))
+            return _logged_in(started, trace, stream=_in_threads)
+        else:
+            trace.finish("invalid_proof")
+            return _error("Invalid proof", 400)
+
+    except Exception as e:
+        return _login_failed(e, username, trace)
+
+
+@aio_bp.route("/auth/verify", methods=["POST"])
+@rate_limited
+async def verify_proof():
+    trace = start_trace("verify")
+
+    data = await request.get_json()
+    username = data.get("username")
+
+    try:
+        with trace.stage("audit_write"):
+            log_event("VERIFY_ATTEMPT", username=username, details=f"challenge_id={data.get('challenge_id')}")
+    except Exception:
+        pass
+
+    return await _login_with(_check_proof, data, username, trace)
+
+
+@aio_bp.route("/auth/epoch", methods=["GET"])
+async def login_epoch():
+    return _epoch_response(time.time())
+
+
+@aio_bp.route("/auth/login", methods=["POST"])
+@rate_limited
+async def login_one_shot():
+    trace = start_trace("login")
+
+    data = await request.get_json(silent=True) or {}
+    username = data.get("username")
+
+    try:
+        with trace.stage("audit_write"):
+            log_event("LOGIN_ATTEMPT", username=username, details=f"epoch={data.get('epoch')} ts={data.get('ts')}")
+    except Exception:
+        pass
+
+    return await _login_with(_check_login, data, username, trace)
+
+
+@aio_bp.route("/vault", methods=["GET"])
+async def get_vault():
+    username = await _username()
+    if not username:
+        return _unauthorized()
+
+    stored = await vault.read_vault_async(username.strip().lower())
+    return _vault_response(stored, request.headers.get("If-None-Match"), stream=_in_threads)
+
+
+@aio_bp.route("/vault", methods=["POST"])
+async def update_vault():
+    username = await _username()
+    if not username:
+        return _unauthorized()
+
+    vault_blob, error = _vault_blob_arg(await request.get_json())
+    if error:
+        return error
+
+    try:
+        version = await vault.write_vault_async(username.strip().lower(), vault_blob,
+                                                if_match=request.headers.get("If-Match"))
+    except VAULT_WRITE_ERRORS as e:
+        return _vault_write_failed(username, e)
+    return _vault_written(username, version, "User updated vault.")
+
+
+@aio_bp.route("/vault/entries", methods=["GET"])
+async def get_plain_entries():
+    username = await _username()
+    if not username:
+        return _unauthorized()
+
+    query, error = _entries_query(request.args)
+    if error:
+        return error
+    try:
+        return _entries_page(await entries_store.list_entries_async(username.strip().lower(), **query))
+    except ValueError as e:
+        return _error(str(e), 400)
+
+
+@aio_bp.route("/vault/entries", methods=["POST"])
+async def add_plain_entry():
+    username = await _username()
+    if not username:
+        return _unauthorized()
+
+    entry, error = _entry_arg(await request.get_json() or {})
+    if error:
+        return error
+
+    try:
+        await entries_store.save_entry_async(username.strip().lower(), entry)
+        return _entry_saved(username, entry)
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@aio_bp.route("/vault/entries/batch", methods=["POST"])
+async def batch_plain_entries():
+    username = await _username()
+    if not username:
+        return _unauthorized()
+
+    operations, error = _batch_operations(await request.get_json(silent=True) or {})
+    if error:
+        return error
+
+    try:
+        results = await entries_store.apply_batch_async(username.strip().lower(), operations)
+    except Exception as e:
+        return _error(str(e), 500)
+    return _batch_applied(username, results)
+
+
+@aio_bp.route("/vault/entries/<entry_id>", methods=["DELETE"])
+async def delete_plain_entry(entry_id):
+    username = await _username()
+    if not username:
+        return _unauthorized()
+
+    try:
+        return _entry_deleted(username, entry_id,
+                              await entries_store.delete_entry_async(username.strip().lower(), entry_id))
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@aio_bp.route("/auth/logout", methods=["POST"])
+async def logout():
+    token = _bearer_token(request)
+    if not token:
+        return _error("Missing token", 400)
+    await revoke_session_async(token)
+    return _logged_out()
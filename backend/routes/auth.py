@@ -1,63 +1,109 @@
 # routes/auth.py
 from utils.logger import log_event
-import psutil
+from utils.metrics import start_trace
 
-import secrets
-from flask import Blueprint, request, jsonify
-from utils.db import users, sessions as sessions_collection
+import json
+import time
+from flask import Blueprint, Response, current_app, request, jsonify
 from datetime import datetime
+import os
 import uuid
-import random
-from datetime import  timedelta
-from flask import request
-from ecdsa import SECP256k1, VerifyingKey
+from collections import Counter
+from functools import wraps
 from binascii import unhexlify
+from utils import schnorr
+from utils import entries as entries_store
+from utils import vault
+from utils import blobstore
+from utils.compression import negotiate as negotiate_encoding
+from utils import user_repo
+from utils import verify_pool
+from utils.cache import ReplayCache, Striped
+from utils.ratelimit import Limit, limiter
+from utils.challenge_token import (issue_challenge, open_challenge, mac_key, current_epoch, open_login,
+                                   login_key, InvalidChallenge, LOGIN_WINDOW)
+from utils.sessions import create_session, resolve_session, revoke_session, SessionUnavailable
 
-# in-memory cache fallback
-sessions = {}
-# SESSION_TTL = 900  time duration
-
-challenges = {}
 CHALLENGE_TTL = 120
+# Challenges are signed tokens, so any worker can check them. This cache
+# remembers which ones (and which one-shot proofs) were spent; the
+# spent_challenges collection (keyed by challenge) catches one spent on another worker.
+used_challenges = Striped(ReplayCache, int(os.getenv("CHALLENGE_REPLAY_CACHE_SIZE", "100000")))
+
+# a verified proof whose session could not be stored; the client logs in again
+SESSION_UNAVAILABLE = "Session store unavailable, log in again shortly"
 
-login_attempts = {}
-MAX_ATTEMPTS = 5
-BLOCK_DURATION = timedelta(minutes=15)
+# upper bound on proofs accepted by /auth/verify/batch in one request
+VERIFY_BATCH_MAX = int(os.getenv("VERIFY_BATCH_MAX", "256"))
+# upper bound on operations accepted by /vault/entries/batch in one request
+ENTRIES_BATCH_MAX = int(os.getenv("ENTRIES_BATCH_MAX", "10000"))
+
+# Per-client and per-username limits ("count/seconds") on the unauthenticated auth endpoints
+IP_LIMIT = Limit.parse("ip", os.getenv("RATE_LIMIT_IP", "60/60"))
+USERNAME_LIMIT = Limit.parse("username", os.getenv("RATE_LIMIT_USERNAME", "20/60"))
+# number of reverse proxies in front of the app that append to X-Forwarded-For
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
 
 auth_bp = Blueprint("auth", __name__)
 
 
-def find_user_by_username(username):
-    """Return (user_doc, username_norm) or (None, username_norm).
-    Tries normalized lookup first, then legacy lookup by original username.
-    If legacy doc is found, patch it with username_norm for future queries.
-    """
-    if not isinstance(username, str):
-        return None, None
-    username_norm = username.strip().lower()
-    user = users.find_one({"username_norm": username_norm})
-    if user:
-        return user, username_norm
+def _client_ip(req):
+    """Client address of a Flask or Quart request."""
+    forwarded = [h.strip() for h in req.headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+    if TRUSTED_PROXIES and len(forwarded) >= TRUSTED_PROXIES:
+        # the address our outermost trusted proxy saw; anything left of it is client-supplied
+        return forwarded[-TRUSTED_PROXIES]
+    return req.remote_addr
+
+
+def _charged_usernames(args, body):
+    """Usernames a request is charged for: one per proof of a batch
+    (/auth/verify/batch), else the request's own (None when it has none)."""
+    body = body if isinstance(body, dict) else {}
+    if isinstance(body.get("proofs"), list):
+        return [p.get("username") if isinstance(p, dict) else None for p in body["proofs"]]
+    return [args.get("username") or body.get("username")]
+
+
+def _retry_after(ip, usernames):
+    """Count one hit per entry of `usernames` against the IP limit and each
+    username's limit. Returns 0 if allowed, else seconds to wait."""
+    retry_after = limiter.hit(IP_LIMIT, ip, amount=max(len(usernames), 1))
+    counts = Counter(u.strip().lower() for u in usernames if isinstance(u, str))
+    for username, n in counts.items():
+        if retry_after:
+            break
+        retry_after = limiter.hit(USERNAME_LIMIT, username, amount=n)
+    return retry_after
+
+
+def rate_limited(view):
+    """Reject the request with 429 before any lookup or curve math once the
+    client IP or a requested username is over its limit. A batch of proofs
+    costs one hit per proof."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        retry_after = _retry_after(_client_ip(request),
+                                   _charged_usernames(request.args, request.get_json(silent=True)))
+        if retry_after:
+            return _too_many_requests(retry_after)
+        return view(*args, **kwargs)
+    return wrapper
 
-    # fallback to legacy username field
-    user = users.find_one({"username": username})
-    if user:
-        try:
-            users.update_one({"_id": user.get("_id")}, {"$set": {"username_norm": username_norm}})
-        except Exception:
-            pass
-        return user, username_norm
 
-    return None, username_norm
+def get_username_from_token():
+    token = _session_token(request, lambda: request.get_json(silent=True) or {})
+    if not token:
+        return None
 
+    # Cached lookup with idle/absolute expiry (see utils/sessions.py)
+    return resolve_session(token)
 
 
-def get_username_from_token():
+def _session_token(request, body):
+    """The session token sent with a Flask or Quart request; `body` returns its parsed JSON."""
     # Try Authorization: Bearer <token>
-    auth_header = request.headers.get("Authorization")
-    token = None
-    if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header.split()[1]
+    token = _bearer_token(request)
 
     # Fallback to a custom header
     if not token:
@@ -70,36 +116,165 @@ def get_username_from_token():
     # Fallback to JSON body (useful for some clients)
     if not token and request.method in ("POST", "PUT", "PATCH"):
         try:
-            data = request.get_json(silent=True) or {}
-            token = data.get("session_token")
+            token = body().get("session_token")
         except Exception:
             token = None
 
     # Fallback to cookies
     if not token:
         token = request.cookies.get("session_token")
+    return token
 
-    if not token:
-        return None
 
-    # First check in-memory cache
-    session = sessions.get(token)
-    if not session:
-        # Fallback to persistent sessions collection
-        try:
-            doc = sessions_collection.find_one({"token": token})
-            if doc:
-                session = {"username": doc.get("username")}
-                # refresh in-memory cache
-                sessions[token] = session
-        except Exception:
-            session = None
+# The helpers below parse requests and shape responses for both the Flask
+# routes here and their asyncio twins in routes/aio.py. They return plain view
+# return values ((body, status, headers) with a dict or chunk iterator body),
+# which Flask and Quart turn into the same response.
+
+def _error(message, status, headers=None):
+    return {"status": "error", "message": message}, status, headers or {}
+
+
+def _unauthorized():
+    return _error("Invalid or expired token", 401)
+
+
+def _too_many_requests(retry_after):
+    """429 with Retry-After for a rate-limited client."""
+    return _error("Too many requests, retry later", 429, {"Retry-After": str(retry_after)})
+
+
+def _blob_response(payload, field, inline_value=None, ref=None, headers=None, stream=iter):
+    """JSON response of `payload` plus `field`, whose value is streamed from
+    chunked storage when `ref` is given (constant memory at any blob size).
+    `stream` wraps the blocking chunk iterator (routes.aio reads it on worker threads)."""
+    if ref is None:
+        return dict(payload, **{field: inline_value}), 200, headers or {}
+    return (stream(blobstore.json_envelope(payload, field, ref=ref)), 200,
+            dict(headers or {}, **{"Content-Type": "application/json"}))
+
+
+def _vault_headers(version):
+    """ETag of a vault response; clients must revalidate rather than reuse a cached vault."""
+    return {"ETag": vault.etag(version), "Cache-Control": "private, no-cache"}
+
+
+def _with_vault_etag(response, version):
+    response.headers.update(_vault_headers(version))
+    return response
+
+
+def _vault_response(stored, if_none_match, stream=iter):
+    """GET /vault response for read_vault's result."""
+    if stored is None:
+        return _error("User not found", 404)
+    vault_blob, version, ref = stored
+    if vault.matches(if_none_match, version):
+        return "", 304, _vault_headers(version)
+    payload = {"status": "success", "vault_version": version}
+    return _blob_response(payload, "vault_blob", vault_blob, ref, _vault_headers(version), stream)
+
 
-    if not session:
+def _vault_blob_arg(data):
+    """vault_blob of a POST /vault body. Returns (vault_blob, None) or (None, error response)."""
+    vault_blob = data.get("vault_blob")
+    if not vault_blob:
+        return None, _error("Missing vault_blob", 400)
+    return vault_blob, None
+
+
+# what vault.write_vault* raise for a write the client can fix
+VAULT_WRITE_ERRORS = (blobstore.BlobTooLarge, ValueError, vault.VaultConflict)
+
+
+def _vault_write_failed(username, error):
+    """Response to one of VAULT_WRITE_ERRORS."""
+    if isinstance(error, blobstore.BlobTooLarge):
+        return _error(str(error), 413)
+    if isinstance(error, vault.VaultConflict):
+        log_event("VAULT_CONFLICT", username=username,
+                  details=f"Stale vault write rejected (current v{error.current_version})")
+        return ({"status": "error", "message": str(error), "vault_version": error.current_version}, 409,
+                _vault_headers(error.current_version))
+    return _error(str(error), 400)
+
+
+def _vault_written(username, version, details):
+    """Response to a vault write that returned `version` (None: no such user)."""
+    if version is None:
+        return _error("User not found", 404)
+    log_event("VAULT_UPDATE", username=username, details=details)
+    return ({"status": "success", "message": "Vault updated successfully", "vault_version": version}, 200,
+            _vault_headers(version))
+
+
+def _entries_query(args):
+    """list_entries keyword arguments for GET /vault/entries query params.
+    Returns (kwargs, None) or (None, error response)."""
+    order = args.get("order", "asc")
+    if order not in ("asc", "desc"):
+        return None, _error("order must be asc or desc", 400)
+    try:
+        limit = int(args.get("limit", entries_store.PAGE_DEFAULT))
+    except ValueError:
+        return None, _error("Invalid limit", 400)
+    return {
+        "limit": min(max(limit, 1), entries_store.PAGE_MAX),
+        "cursor": args.get("cursor"),
+        "q": args.get("q"),
+        "field": args.get("field"),
+        "match": args.get("match", "prefix"),
+        "sort": args.get("sort", "created"),
+        "descending": order == "desc",
+    }, None
+
+
+def _entries_page(page):
+    entries, next_cursor = page
+    return {"status": "success", "entries": entries, "next_cursor": next_cursor}
+
+
+def _normalize_entry(entry):
+    """Ensure an id and created_at."""
+    if not entry.get("id"):
+        entry["id"] = str(uuid.uuid4())
+    entry.setdefault("created_at", datetime.utcnow().isoformat())
+    return entry
+
+
+def _entry_arg(data):
+    """The entry of a POST /vault/entries body, normalized.
+    Returns (entry, None) or (None, error response)."""
+    entry = data.get("entry") or data
+    if not isinstance(entry, dict):
+        return None, _error("Entry must be an object", 400)
+    return _normalize_entry(entry), None
+
+
+def _entry_saved(username, entry):
+    log_event("PLAIN_ENTRY_ADD", username=username, details=f"Added plain entry {entry.get('id')}")
+    return {"status": "success", "message": "Entry saved"}, 201
+
+
+def _entry_deleted(username, entry_id, deleted):
+    if not deleted:
+        # Nothing removed
+        return {"status": "success", "message": "Entry not found"}, 200
+    log_event("PLAIN_ENTRY_DELETE", username=username, details=f"Deleted plain entry {entry_id}")
+    return {"status": "success", "message": "Entry deleted"}, 200
+
+
+def _bearer_token(req):
+    """Token of a Flask or Quart request's Authorization: Bearer header, or None."""
+    auth_header = req.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
         return None
+    return auth_header.split()[1]
 
-    # Sessions are persistent until explicit logout. Do not expire automatically.
-    return session.get("username")
+
+def _logged_out():
+    log_event("LOGOUT", details="User logged out")
+    return {"status": "success", "message": "Logged out"}
 
 
 
@@ -122,7 +297,7 @@ def register():
     username_norm = username.strip().lower()
 
     # Check if username already exists (normalized)
-    if users.find_one({"username_norm": username_norm}):
+    if user_repo.exists(username_norm):
         return jsonify({"status": "error", "message": "Username already exists"}), 400
 
     # Prepare user record
@@ -132,24 +307,39 @@ def register():
         "publicY": data["publicY"], # ec public key hex/base64
         "salt_kdf": data["salt_kdf"], #base64
         "kdf_params": data["kdf_params"], #pbkdf2 params
-        # optional encrypted backup blob (client-side encrypted private key)
-        "encrypted_backup": data.get("encrypted_backup", None),
-        "vault_blob": data.get("vault_blob", None),
+        "vault_version": 1 if data.get("vault_blob") else 0,
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow()
     }
 
+    refs = []
     try:
-        users.insert_one(user_doc)
+        # optional encrypted backup blob (client-side encrypted private key) and vault;
+        # large ones go to chunked storage (utils/blobstore.py)
+        for field in ("encrypted_backup", "vault_blob"):
+            inline, ref = blobstore.store_value(data.get(field), metadata={"username_norm": username_norm, "field": field})
+            user_doc[field] = inline
+            if ref is not None:
+                user_doc[field + "_ref"] = ref
+                refs.append(ref)
+
+        user_repo.insert_user(user_doc)
         log_event("REGISTER", username=username, details="New user registered.")
         return jsonify({"status": "success", "message": "User registered successfully"})
-    
+
+    except blobstore.BlobTooLarge as e:
+        for ref in refs:
+            blobstore.delete(ref)
+        return jsonify({"status": "error", "message": str(e)}), 413
     except Exception as e:
+        for ref in refs:
+            blobstore.delete(ref)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
 
 @auth_bp.route("/auth/backup", methods=["GET"])
+@rate_limited
 def get_encrypted_backup():
     """Return the encrypted backup blob and KDF params for a username.
     Query param: ?username=alice
@@ -159,20 +349,24 @@ def get_encrypted_backup():
     if not username:
         return jsonify({"status": "error", "message": "username required"}), 400
 
-    user, _ = find_user_by_username(username)
+    user = user_repo.get_backup(username)
     if not user:
         return jsonify({"status": "error", "message": "User not found"}), 404
 
-    return jsonify({
+    payload = {
         "status": "success",
-        "encrypted_backup": user.get("encrypted_backup"),
         "salt_kdf": user.get("salt_kdf"),
         "kdf_params": user.get("kdf_params")
-    })
+    }
+    if user.get("encrypted_backup_ref"):
+        return _blob_response(payload, "encrypted_backup", ref=user["encrypted_backup_ref"])
+    payload["encrypted_backup"] = user.get("encrypted_backup")
+    return jsonify(payload)
 
 
 
 @auth_bp.route("/auth/save-vault", methods=["POST"])
+@rate_limited
 def save_vault_unauthed():
     """Save an encrypted vault_blob for a username.
 
@@ -187,17 +381,21 @@ def save_vault_unauthed():
     if not username or not vault_blob:
         return jsonify({"status": "error", "message": "username and vault_blob required"}), 400
 
-    user, username_norm = find_user_by_username(username)
-    if not user:
-        return jsonify({"status": "error", "message": "User not found"}), 404
-
     try:
-        users.update_one({"username_norm": username_norm}, {"$set": {"vault_blob": vault_blob, "updated_at": datetime.utcnow()}}, upsert=False)
+        version = vault.write_vault(user_repo.normalize(username), vault_blob, if_match=request.headers.get("If-Match"))
+        if version is None:
+            return jsonify({"status": "error", "message": "User not found"}), 404
         try:
             log_event("VAULT_SAVE", username=username, details="Vault saved via setup API")
         except Exception:
             pass
-        return jsonify({"status": "success", "message": "Vault saved"})
+        return _with_vault_etag(jsonify({"status": "success", "message": "Vault saved", "vault_version": version}), version)
+    except blobstore.BlobTooLarge as e:
+        return jsonify({"status": "error", "message": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except vault.VaultConflict as e:
+        return _with_vault_etag(jsonify({"status": "error", "message": str(e), "vault_version": e.current_version}), e.current_version), 409
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -206,6 +404,7 @@ def save_vault_unauthed():
 
 
 @auth_bp.route("/auth/challenge", methods=["POST"])
+@rate_limited
 def generate_challenge():
     """
     Generates a Schnorr challenge for login
@@ -215,151 +414,411 @@ def generate_challenge():
     data = request.get_json()
     username = data.get("username")
 
-    # Check if user exists (normalized lookup with legacy fallback)
-    user, username_norm = find_user_by_username(username)
-    if not user:
-        return jsonify({"status": "error", "message": "User not found"}), 404
+    # Check if user exists (cached login metadata, see utils/user_repo.py)
+    user = user_repo.get_auth(username)
+    return _challenge_issued(user)
 
-    # Generate random challenge
-    c = random.randint(1, 2**32) 
-    challenge_id = str(uuid.uuid4())
-    now = datetime.utcnow()
-    expires_at = now + timedelta(seconds=CHALLENGE_TTL)
 
-    # Store challenge in memory (store normalized username to avoid mismatch)
-    challenges[challenge_id] = {
-        "username_norm": username_norm,
-        "c": c,
-        "issued_at": now,
-        "expires_at": expires_at,
-        "used": False
-    }
+def _challenge_issued(user):
+    """/auth/challenge response for the looked-up user (None if unknown)."""
+    if not user:
+        return _error("User not found", 404)
+
+    # Issue a signed challenge token (bound to the normalized username); nothing is stored server-side
+    challenge_id, c, expires_at = issue_challenge(user["username_norm"], CHALLENGE_TTL)
 
     # include KDF params so clients without localStorage can derive the root key
-    return jsonify({
+    return {
         "status": "success",
         "challenge_id": challenge_id,
         "c": c,
-        "expires_at": expires_at.isoformat(),
+        "expires_at": datetime.utcfromtimestamp(expires_at).isoformat(),
         "salt_kdf": user.get("salt_kdf"),
         "kdf_params": user.get("kdf_params")
-    })
+    }
+
+
+
+
+
+def _load_proof(data, trace):
+    """Validate one { username, challenge_id, R, s } submission against the
+    stored user and challenge, and decode its points.
+    Returns (proof, None) on success or (None, (message, http_status)).
+    Point decoding errors propagate so callers can report them as verification errors.
+    """
+    return _with_user(_check_proof(data), trace)
+
+
+def _with_user(checked, trace):
+    claim, error = checked
+    if error:
+        return None, error
+    # Fetch login metadata (cached, with the public key already decoded)
+    with trace.stage("user_lookup"):
+        user = user_repo.get_auth(claim[0])
+    return _decode_proof(claim, user, trace)
+
+
+def _check_proof(data):
+    """The database-free part of _load_proof. Returns
+    ((username, challenge, challenge_key, R_bytes, s_int), None) or (None, error)."""
+    username = data.get("username")
+    challenge_id = data.get("challenge_id")
+    R_hex = data.get("R")  # client nonce (compressed)
+    s_hex = data.get("s")  # hex string
+
+    # Basic validation
+    if not all([username, challenge_id, R_hex, s_hex]):
+        return None, ("Missing fields", 400)
+
+    try:
+        s_int = int(s_hex, 16)
+    except (TypeError, ValueError):
+        return None, ("Invalid s value", 400)
+
+    # Check the challenge token before touching the database
+    try:
+        challenge = open_challenge(challenge_id)
+    except InvalidChallenge as e:
+        return None, (str(e), 400)
+    challenge_key = mac_key(challenge_id)
+    if (not isinstance(username, str) or challenge["u"] != username.strip().lower()
+            or used_challenges.seen(challenge_key, challenge["exp"])):
+        return None, ("Invalid or used challenge", 400)
+
+    return (username, challenge, challenge_key, unhexlify(R_hex), s_int), None
+
+
+def _load_login(data, trace):
+    """Like _load_proof, for a one-shot { username, epoch, ts, R, s } login
+    whose challenge is derived from the published epoch (see /auth/epoch).
+    """
+    return _with_user(_check_login(data), trace)
+
+
+def _check_login(data):
+    """The database-free part of _load_login, returning like _check_proof."""
+    username = data.get("username")
+    R_hex = data.get("R")
+    s_hex = data.get("s")
+
+    if not all([username, data.get("epoch"), data.get("ts"), R_hex, s_hex]) or not isinstance(username, str):
+        return None, ("Missing fields", 400)
+
+    try:
+        s_int = int(s_hex, 16)
+    except (TypeError, ValueError):
+        return None, ("Invalid s value", 400)
+
+    try:
+        challenge = open_login(data["epoch"], data["ts"], username.strip().lower())
+    except InvalidChallenge as e:
+        return None, (str(e), 400)
+    R_bytes = unhexlify(R_hex)
+    challenge_key = login_key(challenge, R_bytes)
+    if used_challenges.seen(challenge_key, challenge["exp"]):
+        return None, ("Proof already used", 400)
+
+    return (username, challenge, challenge_key, R_bytes, s_int), None
+
+
+def _decode_proof(claim, user, trace):
+    """Decode a proof whose challenge already checked out, for the looked-up user."""
+    username, challenge, challenge_key, R_bytes, s_int = claim
+    if not user:
+        return None, ("User not found", 404)
+
+    with trace.stage("key_decode"):
+        # Decode client nonce R (compressed or uncompressed)
+        Y_bytes, Y_point = user["Y_bytes"], user["Y_point"]
+        if Y_point is None:
+            # stored key is malformed: re-decode to surface the error
+            Y_bytes = unhexlify(user["publicY"])
+            Y_point = schnorr.decode_point(Y_bytes)
+        R_point = schnorr.decode_point(R_bytes)
+
+    with trace.stage("challenge_hash"):
+        # Recompute c exactly as frontend: SHA256(challenge || R || Y)
+        e_int = schnorr.challenge_scalar(challenge["c"], R_bytes, Y_bytes)
+
+    return {
+        "username": username,
+        "user": user,
+        "challenge": challenge,
+        "challenge_key": challenge_key,
+        "Y": Y_point,
+        "R": R_point,
+        "e": e_int,
+        "s": s_int,
+    }, None
+
+
+def _start_session(proof, trace, if_none_match=None):
+    """Consume the proof's challenge, open a session and log the login.
+    Returns (payload, vault_blob_ref) for the client, or None if the
+    challenge was spent concurrently (here or on another worker). Raises
+    SessionUnavailable if the session could not be stored. A vault kept
+    in chunked storage is not in the payload; the caller streams it from
+    vault_blob_ref. The vault is left out entirely (vault_not_modified) when
+    `if_none_match` already names the stored vault version.
+    """
+    username = proof["username"]
+    # Mark challenge used (atomic within this worker)
+    if not used_challenges.consume(proof["challenge_key"], proof["challenge"]["exp"]):
+        return None
+    # Persist session; spent_challenges rejects a challenge already spent elsewhere
+    with trace.stage("session_insert"):
+        token = create_session(username, challenge_key=proof["challenge_key"], challenge_exp=proof["challenge"]["exp"])
+    if token is None:
+        return None
+
+    # Log successful ZKP verification
+    with trace.stage("audit_write"):
+        log_event("LOGIN_SUCCESS", username=username, details="EC Schnorr proof verified successfully.")
+
+    with trace.stage("vault_read"):
+        stored = vault.read_vault(proof["user"]["username_norm"])
+    return _session_payload(token, stored, if_none_match)
+
+
+def _session_payload(token, stored, if_none_match):
+    """(payload, vault_blob_ref) of a login, `stored` being read_vault's result."""
+    vault_blob, version, ref = stored or (None, 0, None)
+    unchanged = bool(if_none_match) and vault.matches(if_none_match, version)
+    payload = {
+        "status": "success",
+        "message": "Login verified",
+        "vault_version": version,
+        "vault_not_modified": unchanged,
+        "session_token": token
+    }
+    if unchanged or ref is None:
+        payload["vault_blob"] = None if unchanged else vault_blob
+        return payload, None
+    return payload, ref
+
+
+def _overloaded(error):
+    """503 with Retry-After for a proof shed by the verification pool."""
+    return _error("Server busy, retry shortly", 503, {"Retry-After": str(error.retry_after)})
+
+
+def _session_unavailable():
+    """503 for a verified proof whose session could not be stored (no token issued)."""
+    return _error(SESSION_UNAVAILABLE, 503)
+
+
+def _rejected(error, trace):
+    """Response to a proof turned down before verification; `error` is (message, http_status)."""
+    message, status = error
+    trace.finish("rejected")
+    return _error(message, status)
 
 
+def _logged_in(started, trace, stream=iter):
+    """/auth/verify response for a valid proof, `started` being _start_session's result."""
+    if started is None:
+        return _rejected(("Invalid or used challenge", 400), trace)
+    payload, ref = started
+    trace.finish("success")
+    return _blob_response(payload, "vault_blob", payload.pop("vault_blob", None), ref,
+                          _vault_headers(payload["vault_version"]), stream)
+
+
+def _login_failed(error, username, trace):
+    """Response to an exception raised while verifying a proof or opening its
+    session. Call it from the except block (the traceback is logged)."""
+    if isinstance(error, verify_pool.Overloaded):
+        trace.finish("shed")
+        return _overloaded(error)
+    _log_verify_error(username)
+    trace.finish("error")
+    if isinstance(error, SessionUnavailable):
+        return _session_unavailable()
+    return {"status": "error", "message": "Verification error", "detail": str(error)}, 500
+
+
+def _log_verify_error(username):
+    import traceback as _tb
+    tb = _tb.format_exc()
+
+    try:
+        log_event("VERIFY_ERROR", username=username, details=tb)
+    except Exception:
+        pass
 
+    try:
+        from utils import logger as _logger
+        _logger.logging.error(tb)
+    except Exception:
+        pass
 
 
 @auth_bp.route("/auth/verify", methods=["POST"])
+@rate_limited
 def verify_proof():
     """
     Verifies Schnorr proof from frontend.
     Expects JSON: { username, challenge_id, R, s }
     """
-    import hashlib, secrets
-    from ecdsa import SECP256k1, VerifyingKey
-    from binascii import unhexlify
+    trace = start_trace("verify")
 
     data = request.get_json()
     username = data.get("username")
-    challenge_id = data.get("challenge_id")
-    R_hex = data.get("R")  # client nonce (compressed)
-    s_hex = data.get("s")  # hex string
 
     # Log an attempt (minimal) to help debug occasional failures
     try:
-        log_event("VERIFY_ATTEMPT", username=username, details=f"challenge_id={challenge_id}")
+        with trace.stage("audit_write"):
+            log_event("VERIFY_ATTEMPT", username=username, details=f"challenge_id={data.get('challenge_id')}")
     except Exception:
         pass
 
-    # Basic validation
-    if not all([username, challenge_id, R_hex, s_hex]):
-        return jsonify({"status": "error", "message": "Missing fields"}), 400
+    return _login_with(_load_proof, data, username, trace)
+
 
+def _login_with(loader, data, username, trace):
+    """Load a proof with `loader`, verify it and open a session (the
+    /auth/verify response)."""
     try:
-        s_int = int(s_hex, 16)
-    except:
-        return jsonify({"status": "error", "message": "Invalid s value"}), 400
+        proof, error = loader(data, trace)
+        if error:
+            return _rejected(error, trace)
 
+        with trace.stage("scalar_mult"):
+            # EC Schnorr verification: s*G == R + c*Y (in the verification pool)
+            valid = verify_pool.verify(proof["Y"], proof["R"], proof["e"], proof["s"])
 
-    # Fetch user (normalized lookup) first to get username_norm
-    user, username_norm = find_user_by_username(username)
-    if not user:
-        return jsonify({"status": "error", "message": "User not found"}), 404
+        if valid:
+            return _logged_in(_start_session(proof, trace, if_none_match=request.headers.get("If-None-Match")), trace)
+        else:
+            trace.finish("invalid_proof")
+            return _error("Invalid proof", 400)
 
-    # Fetch challenge and validate against normalized username
-    challenge = challenges.get(challenge_id)
-    if not challenge or challenge.get("username_norm") != username_norm or challenge["used"]:
-        return jsonify({"status": "error", "message": "Invalid or used challenge"}), 400
-    if datetime.utcnow() > challenge["expires_at"]:
-        return jsonify({"status": "error", "message": "Challenge expired"}), 400
+    except Exception as e:
+        return _login_failed(e, username, trace)
+
+
+@auth_bp.route("/auth/epoch", methods=["GET"])
+def login_epoch():
+    """
+    Publishes the epoch for one-shot logins (POST /auth/login).
+    Returns: { epoch, valid_until, server_time, window }
+    Clients prove against c = "<epoch>:<ts>:<username lowercased>" with
+    ts their unix time in seconds, corrected by server_time if their clock is off.
+    """
+    return _epoch_response(time.time())
+
+
+def _epoch_response(now):
+    epoch, valid_until = current_epoch(now)
+    body = {
+        "status": "success",
+        "epoch": epoch,
+        "valid_until": valid_until,
+        "server_time": int(now),
+        "window": LOGIN_WINDOW,
+    }
+    # identical for every client until the epoch rolls over
+    return body, 200, {"Cache-Control": f"public, max-age={max(0, int(valid_until - now))}"}
+
+
+@auth_bp.route("/auth/login", methods=["POST"])
+@rate_limited
+def login_one_shot():
+    """
+    Verifies a non-interactive Schnorr proof in one round trip.
+    Expects JSON: { username, epoch, ts, R, s }
+    Returns the /auth/verify response. The two-step challenge/verify flow stays available.
+    """
+    trace = start_trace("login")
+
+    data = request.get_json(silent=True) or {}
+    username = data.get("username")
 
     try:
-        # Decode public key Y (compressed or uncompressed)
-        Y_bytes = unhexlify(user["publicY"])
-        Y_vk = VerifyingKey.from_string(Y_bytes, curve=SECP256k1)
-
-        # Decode R (client nonce) from compressed
-        R_bytes = unhexlify(R_hex)
-        R_vk = VerifyingKey.from_string(R_bytes, curve=SECP256k1)  # supports compressed
-    
-        # Recompute c exactly as frontend: SHA256(challenge || R || Y)
-        challenge_bytes = str(challenge["c"]).encode()  # original backend challenge integer
-        data_bytes = challenge_bytes + R_bytes + Y_bytes
-        c_int = int.from_bytes(hashlib.sha256(data_bytes).digest(), "big") % SECP256k1.order
-
-        # EC Schnorr verification: s*G == R + c*Y
-        G = SECP256k1.generator
-        cpu_before = psutil.cpu_percent(interval=None)
-        lhs = s_int * G
-        rhs = R_vk.pubkey.point + c_int * Y_vk.pubkey.point
-        
-        cpu_after = psutil.cpu_percent(interval=0.4)
-        cpu_usage = cpu_after - cpu_before if cpu_after >= cpu_before else cpu_after
-        print(f"🔹 CPU usage during proof verification: {cpu_usage:.2f}%")
-
-
-
-        if lhs == rhs:
-            # Mark challenge used
-            challenge["used"] = True
-            # Generate session token
-            token = secrets.token_hex(16)
-            sessions[token] = {"username": username}
-            # Persist session
-            try:
-                sessions_collection.insert_one({"token": token, "username": username, "created_at": datetime.utcnow()})
-            except Exception:
-                # if persistence fails, still allow in-memory session
-                pass
-
-            # Log successful ZKP verification
-            log_event("LOGIN_SUCCESS", username=username, details="EC Schnorr proof verified successfully.")
-
-            vault_blob = user.get("vault_blob", None)
-            return jsonify({
-                "status": "success",
-                "message": "Login verified",
-                "vault_blob": vault_blob,
-                "session_token": token
-            })
-        else:
-            return jsonify({"status": "error", "message": "Invalid proof"}), 400
+        with trace.stage("audit_write"):
+            log_event("LOGIN_ATTEMPT", username=username, details=f"epoch={data.get('epoch')} ts={data.get('ts')}")
+    except Exception:
+        pass
 
-    except Exception as e:
-        import traceback as _tb
-        tb = _tb.format_exc()
-       
+    return _login_with(_load_login, data, username, trace)
+
+
+
+@auth_bp.route("/auth/verify/batch", methods=["POST"])
+@rate_limited
+def verify_proof_batch():
+    """
+    Verifies many Schnorr proofs in one request (e.g. a gateway replaying logins after a deploy).
+    Expects JSON: { proofs: [ { username, challenge_id, R, s, if_none_match? }, ... ] }
+    Returns: { status, results } where results[i] is the /auth/verify response body for proofs[i].
+    Rate limited per proof: each one counts against the client IP and its username.
+    """
+    trace = start_trace("verify_batch")
+
+    data = request.get_json(silent=True) or {}
+    submitted = data.get("proofs")
+    if not isinstance(submitted, list) or not submitted:
+        return jsonify({"status": "error", "message": "proofs must be a non-empty list"}), 400
+    if len(submitted) > VERIFY_BATCH_MAX:
+        return jsonify({"status": "error", "message": f"At most {VERIFY_BATCH_MAX} proofs per batch"}), 413
+
+    try:
+        with trace.stage("audit_write"):
+            log_event("VERIFY_BATCH_ATTEMPT", details=f"proofs={len(submitted)}")
+    except Exception:
+        pass
+
+    results = [None] * len(submitted)
+    pending = []  # (index, proof)
+    claimed = set()
+    for i, item in enumerate(submitted):
+        if not isinstance(item, dict):
+            results[i] = {"status": "error", "message": "Missing fields"}
+            continue
         try:
-            log_event("VERIFY_ERROR", username=username, details=tb)
-        except Exception:
-            pass
-        
+            proof, error = _load_proof(item, trace)
+        except Exception as e:
+            _log_verify_error(item.get("username"))
+            results[i] = {"status": "error", "message": "Verification error", "detail": str(e)}
+            continue
+        # a challenge may only be spent once, even inside a single batch
+        if not error and item["challenge_id"] in claimed:
+            error = ("Invalid or used challenge", 400)
+        if error:
+            results[i] = {"status": "error", "message": error[0]}
+            continue
+        claimed.add(item["challenge_id"])
+        pending.append((i, proof))
+
+    try:
+        with trace.stage("scalar_mult"):
+            verdicts = verify_pool.batch_verify((p["Y"], p["R"], p["e"], p["s"]) for _, p in pending)
+    except verify_pool.Overloaded as e:
+        # nothing was consumed yet, so the whole batch can be retried as is
+        trace.finish("shed")
+        return _overloaded(e)
+
+    for (i, proof), valid in zip(pending, verdicts):
+        if not valid:
+            results[i] = {"status": "error", "message": "Invalid proof"}
+            continue
         try:
-            from utils import logger as _logger
-            _logger.logging.error(tb)
-        except Exception:
-            pass
-        return jsonify({"status": "error", "message": "Verification error", "detail": str(e)}), 500
+            started = _start_session(proof, trace, if_none_match=submitted[i].get("if_none_match"))
+            if started is not None and started[1] is not None:
+                # too large to inline in a batch; the client fetches it from GET /vault
+                started[0].update(vault_blob=None, vault_blob_chunked=True)
+            results[i] = started and started[0] or {"status": "error", "message": "Invalid or used challenge"}
+        except SessionUnavailable:
+            _log_verify_error(proof["username"])
+            results[i] = {"status": "error", "message": SESSION_UNAVAILABLE}
+        except Exception as e:
+            _log_verify_error(proof["username"])
+            results[i] = {"status": "error", "message": "Verification error", "detail": str(e)}
+
+    trace.finish("success")
+    return jsonify({"status": "success", "results": results})
 
 
 
@@ -369,16 +828,78 @@ def verify_proof():
 @auth_bp.route("/vault", methods=["GET"])
 def get_vault():
     """
-    Get the vault_blob for a user.
-    Expects query param: ?username=alice
+    Get the vault_blob for the authenticated user.
+    Sends an ETag; a matching If-None-Match gets 304 with no body.
     """
     username = get_username_from_token()
     if not username:
-        return jsonify({"status": "error", "message": "Invalid or expired token"}), 401
+        return _unauthorized()
 
-    user, _ = find_user_by_username(username)
-    vault_blob = user.get("vault_blob", None)
-    return jsonify({"status": "success", "vault_blob": vault_blob})
+    return _vault_response(vault.read_vault(username.strip().lower()), request.headers.get("If-None-Match"))
+
+
+
+@auth_bp.route("/vault/blob", methods=["GET"])
+def download_vault_blob():
+    """
+    Stream the bare vault_blob JSON (no envelope) for the authenticated user.
+    Same ETag / If-None-Match handling as GET /vault. A client accepting gzip
+    gets the stored compressed bytes as they are.
+    """
+    username = get_username_from_token()
+    if not username:
+        return _unauthorized()
+
+    stored = vault.read_vault(username.strip().lower())
+    if stored is None:
+        return jsonify({"status": "error", "message": "User not found"}), 404
+    vault_blob, version, ref = stored
+
+    if vault.matches(request.headers.get("If-None-Match"), version):
+        return _with_vault_etag(current_app.response_class(status=304), version)
+    if ref is None:
+        return _with_vault_etag(current_app.response_class(json.dumps(vault_blob), mimetype="application/json"), version)
+
+    if negotiate_encoding() == "gzip":
+        response = Response(blobstore.open_stream(ref, "gzip"), mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Content-Length"] = str(ref["stored"])
+        response.vary.add("Accept-Encoding")
+        _with_vault_etag(response, version)
+        response.headers["ETag"] = "W/" + response.headers["ETag"]
+        return response
+    response = Response(blobstore.open_stream(ref), mimetype="application/json")
+    response.headers["Content-Length"] = str(ref["size"])
+    return _with_vault_etag(response, version)
+
+
+
+@auth_bp.route("/vault/blob", methods=["PUT"])
+def upload_vault_blob():
+    """
+    Replace the vault_blob with the request body, streamed into chunked storage.
+    Body: the vault_blob JSON itself, optionally sent with Content-Encoding: gzip.
+    Same If-Match handling as POST /vault; 413 above VAULT_MAX_BYTES, 400 (and
+    nothing stored) unless the body is exactly one JSON value.
+    """
+    username = get_username_from_token()
+    if not username:
+        return _unauthorized()
+
+    encoding = (request.headers.get("Content-Encoding") or "identity").strip().lower()
+    if encoding not in ("identity", "gzip"):
+        return jsonify({"status": "error", "message": "Unsupported Content-Encoding"}), 415
+    # the body is never held in memory, so it may exceed the JSON request limit
+    request.max_content_length = blobstore.VAULT_MAX_BYTES
+    chunks = iter(lambda: request.stream.read(blobstore.CHUNK_SIZE), b"")
+
+    try:
+        version = vault.write_vault_stream(username.strip().lower(), chunks,
+                                           content_encoding=None if encoding == "identity" else encoding,
+                                           if_match=request.headers.get("If-Match"))
+    except VAULT_WRITE_ERRORS as e:
+        return _vault_write_failed(username, e)
+    return _vault_written(username, version, "User uploaded vault blob.")
 
 
 
@@ -387,20 +908,21 @@ def update_vault():
     """
     Update the vault_blob for a user.
     Expects JSON: { username, vault_blob: { iv, ciphertext, tag, version } }
+    With If-Match: "v<version>" the write only applies to that version (409 otherwise).
     """
     username = get_username_from_token()
     if not username:
-        return jsonify({"status": "error", "message": "Invalid or expired token"}), 401
+        return _unauthorized()
 
-    data = request.get_json()
-    vault_blob = data.get("vault_blob")
-    if not vault_blob:
-        return jsonify({"status": "error", "message": "Missing vault_blob"}), 400
-
-    users.update_one({"username_norm": username.strip().lower()}, {"$set": {"vault_blob": vault_blob, "updated_at": datetime.utcnow()}})
-    log_event("VAULT_UPDATE", username=username, details="User updated vault.")
+    vault_blob, error = _vault_blob_arg(request.get_json())
+    if error:
+        return error
 
-    return jsonify({"status": "success", "message": "Vault updated successfully"})
+    try:
+        version = vault.write_vault(username.strip().lower(), vault_blob, if_match=request.headers.get("If-Match"))
+    except VAULT_WRITE_ERRORS as e:
+        return _vault_write_failed(username, e)
+    return _vault_written(username, version, "User updated vault.")
 
 
 
@@ -408,82 +930,133 @@ def update_vault():
 @auth_bp.route("/vault/entries", methods=["GET"])
 def get_plain_entries():
     """
-    Return plaintext vault entries for the authenticated user.
+    Return plaintext vault entries for the authenticated user, one page at a time.
+    Query params: ?limit=100&cursor=<next_cursor from the previous page>
+      q=<text>&match=prefix|contains&field=title|url|tags (default: any of them)
+      sort=created|title|url&order=asc|desc
+    Only title (or name), url (or website) and tags (or category) are searched.
+    next_cursor is null on the last page; pass the same query with it.
     """
     username = get_username_from_token()
     if not username:
-        return jsonify({"status": "error", "message": "Invalid or expired token"}), 401
+        return _unauthorized()
 
-    user, _ = find_user_by_username(username)
-    entries = user.get("plain_entries", []) if user else []
-    return jsonify({"status": "success", "entries": entries})
+    query, error = _entries_query(request.args)
+    if error:
+        return error
+    try:
+        return _entries_page(entries_store.list_entries(username.strip().lower(), **query))
+    except ValueError as e:
+        return _error(str(e), 400)
 
 
 
 @auth_bp.route("/vault/entries", methods=["POST"])
 def add_plain_entry():
     """
-    Append a plaintext vault entry to the user's plain_entries array.
+    Save a plaintext vault entry (an entry with an existing id is replaced).
     Expects JSON body with the entry object (any fields). The server will attach a simple id and timestamp if not provided.
     """
     username = get_username_from_token()
     if not username:
-        return jsonify({"status": "error", "message": "Invalid or expired token"}), 401
+        return _unauthorized()
 
-    data = request.get_json() or {}
-    entry = data.get("entry") or data
+    entry, error = _entry_arg(request.get_json() or {})
+    if error:
+        return error
 
-    # Basic normalization: ensure an id and created_at
     try:
-        entry_id = entry.get("id") if isinstance(entry, dict) and entry.get("id") else str(uuid.uuid4())
-    except Exception:
-        entry_id = str(uuid.uuid4())
+        entries_store.save_entry(username.strip().lower(), entry)
+        return _entry_saved(username, entry)
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+
+def _batch_operation(item):
+    """Validate one /vault/entries/batch operation. Returns ((op, entry_or_id), None) or (None, message)."""
+    if not isinstance(item, dict) or item.get("op") not in entries_store.BATCH_OPS:
+        return None, "op must be one of " + ", ".join(entries_store.BATCH_OPS)
+    op = item["op"]
+    if op == "delete":
+        entry_id = item.get("id")
+        if entry_id in (None, "") or isinstance(entry_id, (bool, dict, list)):
+            return None, "id required"
+        return (op, entry_id), None
+    entry = item.get("entry")
+    if not isinstance(entry, dict):
+        return None, "Entry must be an object"
+    if op == "update" and not entry.get("id"):
+        return None, "entry.id required"
+    # same normalization as POST /vault/entries
+    return (op, _normalize_entry(entry)), None
+
+
+def _batch_operations(data):
+    """Validated operations of a /vault/entries/batch body.
+    Returns (operations, None) or (None, error response)."""
+    submitted = data.get("operations")
+    if not isinstance(submitted, list) or not submitted:
+        return None, _error("operations must be a non-empty list", 400)
+    if len(submitted) > ENTRIES_BATCH_MAX:
+        return None, _error(f"At most {ENTRIES_BATCH_MAX} operations per batch", 413)
+
+    # nothing is written unless every operation is well-formed
+    operations = []
+    for i, item in enumerate(submitted):
+        operation, error = _batch_operation(item)
+        if error:
+            return None, _error(f"operations[{i}]: {error}", 400)
+        operations.append(operation)
+    return operations, None
+
+
+def _batch_applied(username, results):
+    # one audit record for the whole batch
+    counts = Counter(result["status"] for result in results)
+    log_event("PLAIN_ENTRY_BATCH", username=username,
+              details="Applied entry batch: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    return {"status": "success", "results": results}
+
+
+@auth_bp.route("/vault/entries/batch", methods=["POST"])
+def batch_plain_entries():
+    """
+    Apply many plaintext entry changes in one request, in order.
+    Expects JSON: { operations: [ { op: "add"|"update", entry } | { op: "delete", id }, ... ] }
+    "add" behaves like POST /vault/entries, "update" only replaces an existing entry.
+    Returns: { status, results } where results[i] is { id, status } for operations[i],
+    status being created, updated, deleted or not_found (error/skipped if the write stopped there).
+    """
+    username = get_username_from_token()
+    if not username:
+        return _unauthorized()
 
-    entry.setdefault("id", entry_id)
-    entry.setdefault("created_at", datetime.utcnow().isoformat())
+    operations, error = _batch_operations(request.get_json(silent=True) or {})
+    if error:
+        return error
 
     try:
-        users.update_one({"username_norm": username.strip().lower()}, {"$push": {"plain_entries": entry}, "$set": {"updated_at": datetime.utcnow()}}, upsert=True)
-        log_event("PLAIN_ENTRY_ADD", username=username, details=f"Added plain entry {entry.get('id')}")
-        return jsonify({"status": "success", "message": "Entry saved"}), 201
+        results = entries_store.apply_batch(username.strip().lower(), operations)
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return _error(str(e), 500)
+    return _batch_applied(username, results)
 
 
 
 @auth_bp.route("/vault/entries/<entry_id>", methods=["DELETE"])
 def delete_plain_entry(entry_id):
     """
-    Delete a plaintext entry from the user's plain_entries array by id.
+    Delete a plaintext entry by id.
     """
     username = get_username_from_token()
     if not username:
-        return jsonify({"status": "error", "message": "Invalid or expired token"}), 401
+        return _unauthorized()
 
     try:
-        # Load current entries to handle potential type mismatches or nested id formats.
-        user, _ = find_user_by_username(username)
-        if not user:
-            return jsonify({"status": "error", "message": "User not found"}), 404
-
-        entries = user.get("plain_entries", []) or []
-
-        # Filter out entries whose id matches the provided entry_id (string compare of id field)
-        new_entries = [e for e in entries if str(e.get("id")) != str(entry_id)]
-
-        if len(new_entries) == len(entries):
-            # Nothing removed
-            return jsonify({"status": "success", "message": "Entry not found"}), 200
-
-        users.update_one(
-            {"username": username},
-            {"$set": {"plain_entries": new_entries, "updated_at": datetime.utcnow()}}
-        )
-        log_event("PLAIN_ENTRY_DELETE", username=username, details=f"Deleted plain entry {entry_id}")
-        return jsonify({"status": "success", "message": "Entry deleted"}), 200
-
+        return _entry_deleted(username, entry_id, entries_store.delete_entry(username.strip().lower(), entry_id))
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return _error(str(e), 500)
 
 
 
@@ -492,16 +1065,9 @@ def delete_plain_entry(entry_id):
 @auth_bp.route("/auth/logout", methods=["POST"])
 def logout():
     """Invalidate the session token (logout)."""
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return jsonify({"status": "error", "message": "Missing token"}), 400
-    token = auth_header.split()[1]
-    if token in sessions:
-        del sessions[token]
-    # remove persisted session
-    try:
-        sessions_collection.delete_one({"token": token})
-    except Exception:
-        pass
-    log_event("LOGOUT", details="User logged out")
-    return jsonify({"status": "success", "message": "Logged out"})
+    token = _bearer_token(request)
+    if not token:
+        return _error("Missing token", 400)
+    # remove persisted session and evict it from every worker's cache
+    revoke_session(token)
+    return _logged_out()
@@ -0,0 +1,20 @@
+import os
+import secrets
+
+from flask import Blueprint, Response, request, jsonify
+from utils.metrics import render_prometheus
+
+metrics_bp = Blueprint("metrics", __name__)
+
+# Optional bearer token so the metrics are not world-readable in production.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Expose this worker's metrics in the Prometheus text format."""
+    if METRICS_TOKEN:
+        auth_header = request.headers.get("Authorization", "")
+        if not secrets.compare_digest(auth_header, f"Bearer {METRICS_TOKEN}"):
+            return jsonify({"status": "error", "message": "Unauthorized"}), 401
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
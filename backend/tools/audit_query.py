@@ -0,0 +1,81 @@
+"""Query and export the audit log.
+
+Run from backend/:
+  python tools/audit_query.py query  [--since ISO] [--until ISO] [--user NAME] [--event TYPE ...] [--limit N] [--cursor TOKEN]
+  python tools/audit_query.py export [filters] [--format ndjson|csv] [--output FILE]
+  python tools/audit_query.py migrate-timestamps
+  python tools/audit_query.py ensure-indexes
+
+`query` prints one page plus the cursor for the next one. `export` streams
+every match in constant memory (stdout by default).
+"""
+
+import argparse
+import os
+import sys
+from pprint import pprint
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import audit_query
+from utils.db import audit_logs
+
+
+def add_filters(parser):
+    parser.add_argument('--since', help='inclusive start, ISO-8601 (UTC unless an offset is given)')
+    parser.add_argument('--until', help='exclusive end, ISO-8601')
+    parser.add_argument('--user', help='exact username')
+    parser.add_argument('--event', action='append', help='event type (repeatable)')
+    parser.add_argument('--desc', action='store_true', help='newest first')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query and export the audit log.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    q = sub.add_parser('query', help='print one page of events')
+    add_filters(q)
+    q.add_argument('--limit', type=int, default=30)
+    q.add_argument('--cursor', help='next_cursor printed by the previous page')
+
+    e = sub.add_parser('export', help='stream every matching event')
+    add_filters(e)
+    e.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    e.add_argument('--output', help='file to write (default: stdout)')
+    e.add_argument('--page-size', type=int, default=5000)
+
+    sub.add_parser('migrate-timestamps', help='convert legacy ISO-string timestamps to dates')
+    sub.add_parser('ensure-indexes', help='create the audit_logs indexes')
+
+    args = parser.parse_args()
+    # MONGO_URI, or the SQLite file with STORAGE_BACKEND=sqlite
+    cols = audit_logs
+
+    if args.command == 'ensure-indexes':
+        audit_query.ensure_indexes(cols)
+        print('Indexes ready')
+        return
+    if args.command == 'migrate-timestamps':
+        print('Converted', audit_query.migrate_string_timestamps(cols), 'timestamps')
+        return
+
+    query = audit_query.build_filter(args.since, args.until, args.user, args.event)
+    if args.command == 'query':
+        docs, next_cursor = audit_query.fetch_page(cols, query, args.limit, args.cursor, args.desc)
+        for doc in docs:
+            pprint(doc)
+        print('next_cursor:', next_cursor or '-')
+        return
+
+    events = audit_query.iter_events(cols, query, page_size=args.page_size, descending=args.desc)
+    writer = audit_query.write_csv if args.format == 'csv' else audit_query.write_ndjson
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as fp:
+            count = writer(events, fp)
+    else:
+        count = writer(events, sys.stdout)
+    print(f'Exported {count} events', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Expire raw audit events while keeping the rollup counters.
+
+Run from backend/, e.g. daily from cron:
+  python tools/audit_retention.py expire [--days 90] [--dry-run]
+Once, to count events logged before the rollups existed:
+  python tools/audit_retention.py backfill-rollups --until ISO [--since ISO]
+
+`expire` deletes audit_logs events older than --days (default
+AUDIT_RETENTION_DAYS). The per-minute and per-hour counters in audit_rollups
+are not touched, so /admin/stats/audit is unchanged. `backfill-rollups` adds
+counts, so run it over a given period once only, and set --until to when
+the rollups were deployed.
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import audit_rollups
+from utils.audit_query import parse_time
+from utils.db import audit_logs
+
+AUDIT_RETENTION_DAYS = float(os.getenv('AUDIT_RETENTION_DAYS', '90'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    e = sub.add_parser('expire', help='delete raw events older than the retention window')
+    e.add_argument('--days', type=float, default=AUDIT_RETENTION_DAYS, help='days of raw events to keep')
+    e.add_argument('--batch-size', type=int, default=10000, help='events per delete_many')
+    e.add_argument('--dry-run', action='store_true', help='only count what would be deleted')
+
+    b = sub.add_parser('backfill-rollups', help='add counters for events logged before rollups existed')
+    b.add_argument('--since', help='inclusive start, ISO-8601 (default: the oldest event)')
+    b.add_argument('--until', required=True, help='exclusive end, ISO-8601')
+
+    args = parser.parse_args()
+
+    if args.command == 'expire':
+        cutoff = datetime.utcnow() - timedelta(days=args.days)
+        if args.dry_run:
+            print(f'{audit_logs.count_documents({"timestamp": {"$lt": cutoff}})} events before {cutoff.isoformat()}')
+            return
+        deleted = audit_rollups.expire_raw_events(cutoff, batch_size=args.batch_size)
+        print(f'Deleted {deleted} audit events before {cutoff.isoformat()}')
+        return
+
+    total = audit_rollups.backfill(parse_time(args.since), parse_time(args.until))
+    print(f'Rolled up {total} events')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Give every legacy user document a username_norm.
+
+Run from backend/ once before deploying the user repository change (lookups
+no longer fall back to the raw username field):
+  python tools/backfill_username_norm.py [--batch-size 1000]
+
+Safe to re-run. Exits with status 1 if some usernames collide after
+normalization; those documents are listed and must be resolved by hand.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.user_repo import backfill_username_norm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=1000, help='updates per bulk_write')
+    args = parser.parse_args()
+
+    updated, collisions = backfill_username_norm(batch_size=args.batch_size)
+    print(f'Backfilled username_norm on {updated} users')
+    if collisions:
+        print(f'{len(collisions)} usernames collide after normalization: {", ".join(map(repr, collisions))}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
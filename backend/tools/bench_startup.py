@@ -0,0 +1,208 @@
+"""Compare gunicorn start-up with and without preload: per-worker memory and time to first login.
+
+Run from backend/ on Linux (memory is read from /proc):
+  python tools/bench_startup.py --sqlite /tmp/bench.sqlite3 [--workers 4] [--users 200]
+or against the configured MONGO_URI (omit --sqlite).
+
+Seeds --users synthetic users, each with a session, so preload can warm
+their keys (PRELOAD_WARM_USERS=--users). Then it starts gunicorn.conf.py
+once per mode, with GUNICORN_PRELOAD off and on. For each run it reports:
+- the time until the server answers;
+- the latency of the first login (challenge + verify);
+- the slowest login of a first wave of --workers * 4 concurrent logins,
+  which reaches the workers while they are still cold;
+- per worker: RSS, PSS (shared pages split between the processes sharing
+  them) and USS (pages private to the worker), with the worker's
+  verification pool processes counted separately.
+The seeded users and sessions are deleted afterwards.
+"""
+
+import argparse
+import os
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from tools.loadtest import HTTPTransport, Runner, Stats, SyntheticUser, percentile
+
+
+def seed(users):
+    from utils import user_repo
+    from utils.sessions import create_session
+
+    for user in users:
+        now = datetime.utcnow()
+        user_repo.insert_user({
+            "username": user.username, "username_norm": user.username, "publicY": user.Y_bytes.hex(),
+            "salt_kdf": "YmVuY2g=", "kdf_params": {"iterations": 1, "hash": "SHA-256"},
+            "vault_version": 0, "created_at": now, "updated_at": now,
+        })
+        create_session(user.username)
+
+
+def cleanup(prefix):
+    from utils.db import sessions, users
+
+    pattern = {"$regex": "^" + prefix}
+    users.delete_many({"username_norm": pattern})
+    sessions.delete_many({"username": pattern})
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def children(pid):
+    """Direct child pids of `pid` (scans /proc)."""
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # the command name may contain spaces; the fields after ")" are fixed
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return sorted(found)
+
+
+def memory(pid):
+    """(rss, pss, uss) in MiB from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0])
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return fields.get("Rss", 0) / 1024, fields.get("Pss", 0) / 1024, uss / 1024
+
+
+def _statuses(stats):
+    return "; ".join(f"{name} {dict(codes)}" for name, codes in sorted(stats.statuses.items()))
+
+
+def wait_ready(transport, proc, deadline):
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"gunicorn exited with {proc.returncode}")
+        try:
+            if transport.request("GET", "/auth/epoch")[0] == 200:
+                return
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.02)
+    sys.exit("gunicorn did not answer in time")
+
+
+def run_mode(preload, args, users, env):
+    port = free_port()
+    env = dict(env, PORT=str(port), GUNICORN_WORKERS=str(args.workers),
+               GUNICORN_PRELOAD="true" if preload else "false", PRELOAD_WARM_USERS=str(len(users)))
+    log = tempfile.TemporaryFile()
+    started = time.monotonic()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        transport = HTTPTransport(f"http://127.0.0.1:{port}")
+        wait_ready(transport, proc, started + args.timeout)
+        ready = time.monotonic() - started
+
+        stats = Stats()
+        first = time.monotonic()
+        if not Runner(transport, stats).login(users[0]):
+            sys.exit(f"first login failed: {_statuses(stats)}")
+        first_login = time.monotonic() - first
+
+
+        def timed_login(user):
+            t0 = time.monotonic()
+            ok = Runner(HTTPTransport(f"http://127.0.0.1:{port}"), stats).login(user)
+            return time.monotonic() - t0 if ok else None
+
+        wave = users[1:1 + args.workers * 4] or users[:1]
+        with ThreadPoolExecutor(max_workers=len(wave)) as pool:
+            latencies = list(pool.map(timed_login, wave))
+        if None in latencies:
+            sys.exit(f"a login of the first wave failed: {_statuses(stats)}")
+
+        # let the workers settle before reading their memory
+        time.sleep(args.settle)
+        workers = []
+        for pid in children(proc.pid):
+            pool_pids = children(pid)
+            workers.append((pid, memory(pid), [memory(p) for p in pool_pids]))
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        if args.verbose:
+            log.seek(0)
+            sys.stdout.write(log.read().decode(errors="replace"))
+        log.close()
+    return ready, first_login, sorted(latencies), workers
+
+
+def report(preload, ready, first_login, wave, workers):
+    print(f"preload={'on' if preload else 'off'}: ready {ready:.2f}s, first login {first_login * 1000:.0f} ms, "
+          f"first wave of {len(wave)} logins p50 {percentile(wave, 50) * 1000:.0f} ms max {wave[-1] * 1000:.0f} ms")
+    print(f"  {'worker':>8} {'RSS MiB':>8} {'PSS MiB':>8} {'USS MiB':>8} {'pool procs':>10} {'pool PSS':>9}")
+    totals = [0.0, 0.0]
+    for pid, (rss, pss, uss), pool in workers:
+        pool_pss = sum(m[1] for m in pool)
+        totals[0] += pss
+        totals[1] += pool_pss
+        print(f"  {pid:>8} {rss:>8.1f} {pss:>8.1f} {uss:>8.1f} {len(pool):>10} {pool_pss:>9.1f}")
+    print(f"  {'total':>8} {'':>8} {totals[0]:>8.1f} {'':>8} {'':>10} {totals[1]:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sqlite", metavar="PATH", help="use the embedded SQLite backend at PATH")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--users", type=int, default=200, help="seeded users (and keys warmed by preload)")
+    parser.add_argument("--modes", default="off,on", help="preload modes to run, in order")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to wait before reading memory")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the server")
+    parser.add_argument("--verbose", action="store_true", help="print gunicorn's output")
+    args = parser.parse_args()
+
+    env = dict(os.environ, RATE_LIMIT_IP="0", RATE_LIMIT_USERNAME="0")
+    # without a shared key each non-preloaded worker would only accept its own challenges
+    env.setdefault("SECRET_KEY", secrets.token_hex(32))
+    if args.sqlite:
+        env.update(STORAGE_BACKEND="sqlite", SQLITE_PATH=os.path.abspath(args.sqlite))
+        os.environ.update(STORAGE_BACKEND="sqlite", SQLITE_PATH=os.path.abspath(args.sqlite))
+        from utils.indexes import ensure_indexes
+        ensure_indexes(log=lambda _msg: None)
+
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    users = [SyntheticUser(f"{prefix}{i}") for i in range(max(args.users, 1))]
+    seed(users)
+    try:
+        for mode in args.modes.split(","):
+            preload = mode.strip() == "on"
+            report(preload, *run_mode(preload, args, users, env))
+    finally:
+        cleanup(prefix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Microbenchmarks for the login verification hot path.
+
+Run from backend/:
+  python tools/bench_verify.py [--proofs 200] [--batch-sizes 1,16,64,256] [--pool] [--reference]
+
+Times each step /auth/verify performs per proof (point decoding, challenge
+hash, single verification) and batch verification per proof at several batch
+sizes, for all-valid batches and for batches in which every proof is bad
+(the bisection's worst case). --pool adds the round trip through utils.verify_pool; --reference adds
+the ecdsa-based check the curve engine replaced.
+"""
+
+import argparse
+import os
+import secrets
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import schnorr
+from utils import secp256k1
+
+
+def make_proofs(count):
+    proofs = []
+    for _ in range(count):
+        x = secrets.randbelow(secp256k1.N - 1) + 1
+        k = secrets.randbelow(secp256k1.N - 1) + 1
+        Y_bytes = secp256k1.encode_point(secp256k1.mul_base(x))
+        R_bytes = secp256k1.encode_point(secp256k1.mul_base(k))
+        c = secrets.randbelow(2 ** 53 - 1) + 1
+        e = schnorr.challenge_scalar(c, R_bytes, Y_bytes)
+        proofs.append((c, Y_bytes, R_bytes, e, (k + e * x) % secp256k1.N))
+    return proofs
+
+
+def bench(label, fn, items, per=1):
+    """Run fn over items; print microseconds per call (divided by `per`)."""
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<36} {elapsed / (len(items) * per) * 1e6:>10.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--proofs", type=int, default=200)
+    parser.add_argument("--batch-sizes", default="1,16,64,256")
+    parser.add_argument("--pool", action="store_true", help="also time verification through utils.verify_pool")
+    parser.add_argument("--reference", action="store_true", help="also time the ecdsa-based verification")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    secp256k1.comb_table()
+    print(f"{'comb table build':<36} {(time.perf_counter() - started) * 1e3:>10.1f} ms")
+
+    proofs = make_proofs(args.proofs)
+    decoded = [(secp256k1.decode_point(Y), secp256k1.decode_point(R), e, s) for _, Y, R, e, s in proofs]
+
+    bench("decode_point (compressed)", lambda p: secp256k1.decode_point(p[1]), proofs)
+    bench("challenge_scalar", lambda p: schnorr.challenge_scalar(p[0], p[2], p[1]), proofs)
+    bench("mul_base", lambda p: secp256k1.mul_base(p[4]), proofs)
+    bench("schnorr.verify", lambda d: schnorr.verify(*d), decoded)
+
+    for size in (int(n) for n in args.batch_sizes.split(",")):
+        batches = [decoded[i:i + size] for i in range(0, len(decoded) - size + 1, size)] or [decoded[:size]]
+        per = len(batches[0])
+        bench(f"schnorr.batch_verify n={per} (per proof)", schnorr.batch_verify, batches, per=per)
+        bad = [[(Y, R, e, s + 1) for Y, R, e, s in batch] for batch in batches]
+        bench(f"  all invalid n={per} (per proof)", schnorr.batch_verify, bad, per=per)
+
+    if args.pool:
+        from utils import verify_pool
+        verify_pool.verify(*decoded[0])  # start the pool outside the timing
+        bench("verify_pool.verify", lambda d: verify_pool.verify(*d), decoded)
+
+    if args.reference:
+        from ecdsa import SECP256k1, VerifyingKey
+        G = SECP256k1.generator
+
+        def reference(p):
+            _, Y_bytes, R_bytes, e, s = p
+            Y = VerifyingKey.from_string(Y_bytes, curve=SECP256k1).pubkey.point
+            R = VerifyingKey.from_string(R_bytes, curve=SECP256k1).pubkey.point
+            return s * G == R + e * Y
+
+        bench("ecdsa reference (decode + verify)", reference, proofs[:max(1, len(proofs) // 4)])
+
+
+if __name__ == "__main__":
+    main()
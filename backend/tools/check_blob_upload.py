@@ -0,0 +1,112 @@
+"""Check that chunked blob uploads store exactly one JSON value.
+
+Run from backend/ (uses the embedded SQLite backend, no server needed):
+  python tools/check_blob_upload.py [--sqlite /tmp/check_blobs.sqlite3]
+
+Feeds blobstore.store_stream valid bodies, which must read back unchanged, and
+bodies it must refuse: invalid JSON, a gzip body with a second member or
+trailing bytes, a truncated gzip body, one over the size limit. Each body is
+sent plain and gzip-compressed, and split at several chunk sizes so that
+tokens and escapes straddle chunk boundaries. Exits non-zero on any
+disagreement. Run it whenever utils/blobstore.py changes.
+"""
+
+import argparse
+import gzip
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VALID = [
+    b'{"iv": "abc", "ciphertext": "QUJD\\u00e9\\n", "tag": "x", "version": 3}',
+    b'[1, -2.5e-3, true, false, null, {}, [], ""]',
+    b'  "\\ud83d\\ude00"  ',
+    b'0',
+    '{"k": "café ☃"}'.encode(),
+]
+INVALID = [
+    b'{"a": 1', b'{"a": 1}}', b'{"a": 1} GARBAGE', b'{"a" 1}', b'[1, 2,]', b'01', b'NaN', b'tru',
+    b'"ab\x01c"', b'"\\x"', b'\xff\xfe', b'{"a": 1}{"b": 2}',
+]
+CHUNK_SIZES = (1, 3, 7, 64, 1 << 20)
+
+failures = 0
+
+
+def check(condition, label):
+    global failures
+    if not condition:
+        failures += 1
+        print("MISMATCH:", label)
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def store(blobstore, chunks, encoding=None, max_bytes=None):
+    """The stored ref, or the exception store_stream raised."""
+    try:
+        return blobstore.store_stream(chunks, encoding, **({"max_bytes": max_bytes} if max_bytes else {}))
+    except (ValueError, blobstore.BlobTooLarge) as e:
+        return e
+
+
+def read_back(blobstore, ref, encoding=None):
+    data = b"".join(blobstore.open_stream(ref, encoding))
+    return gzip.decompress(data) if encoding == "gzip" else data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sqlite", metavar="PATH", help="SQLite file to use (default: a temporary one)")
+    args = parser.parse_args()
+
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = args.sqlite or os.path.join(tempfile.mkdtemp(), "check_blobs.sqlite3")
+    from utils import blobstore
+
+    for body in VALID:
+        for size in CHUNK_SIZES:
+            for encoding, sent in ((None, body), ("gzip", gzip.compress(body))):
+                ref = store(blobstore, split(sent, size), encoding)
+                check(not isinstance(ref, Exception), f"refused valid {body!r} ({encoding}, chunks of {size}): {ref}")
+                if isinstance(ref, Exception):
+                    continue
+                check(read_back(blobstore, ref) == body, f"{body!r} ({encoding}) read back changed")
+                check(read_back(blobstore, ref, "gzip") == body, f"{body!r} ({encoding}) gzip read back changed")
+                blobstore.delete(ref)
+
+    for body in INVALID:
+        for size in CHUNK_SIZES:
+            for encoding, sent in ((None, body), ("gzip", gzip.compress(body))):
+                result = store(blobstore, split(sent, size), encoding)
+                check(isinstance(result, ValueError), f"stored invalid {body!r} ({encoding}, chunks of {size})")
+
+    valid = gzip.compress(VALID[0])
+    cases = {
+        "second gzip member": valid + gzip.compress(b"GARBAGE"),
+        "second member, valid JSON": gzip.compress(b'{"a": 1}') + gzip.compress(b'{"b": 2}'),
+        "trailing bytes": valid + b"GARBAGE",
+        "truncated": valid[:-4],
+        "not gzip": VALID[0],
+    }
+    for label, sent in cases.items():
+        for size in CHUNK_SIZES:
+            result = store(blobstore, split(sent, size), "gzip")
+            check(isinstance(result, ValueError), f"gzip upload with {label} (chunks of {size}) -> {result!r}")
+
+    body = b'{"ct": "' + b"A" * 4096 + b'"}'
+    for encoding, sent in ((None, body), ("gzip", gzip.compress(body))):
+        result = store(blobstore, split(sent, 512), encoding, max_bytes=len(body) - 1)
+        check(isinstance(result, blobstore.BlobTooLarge), f"over the size limit ({encoding}) -> {result!r}")
+
+    print(f"{failures} mismatches")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
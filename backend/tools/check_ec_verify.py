@@ -0,0 +1,150 @@
+"""Cross-check utils.secp256k1 / utils.schnorr against the ecdsa package.
+
+Run from backend/:
+  python tools/check_ec_verify.py [--rounds 500] [--seed 1234]
+
+Exits non-zero if any result disagrees. Run it whenever the curve code changes.
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ecdsa import SECP256k1, VerifyingKey
+from ecdsa.ellipticcurve import INFINITY
+
+from utils import schnorr
+from utils import secp256k1 as fast
+
+N = SECP256k1.order
+G = SECP256k1.generator
+
+EDGE_SCALARS = [
+    0, 1, 2, 3, N - 1, N - 2, N, N + 1, 2 * N - 1,
+    2 ** 127, 2 ** 128 - 1, 2 ** 128, 2 ** 255, 2 ** 256 - 1,
+    fast.LAMBDA, N - fast.LAMBDA, fast.LAMBDA + 1, N // 2, N // 2 + 1,
+    # all-ones comb columns and wNAF carry chains
+    int("01" * 128, 2), int("10" * 128, 2), (1 << fast.COMB_COLUMNS) - 1,
+]
+
+failures = 0
+
+
+def check(condition, label):
+    global failures
+    if not condition:
+        failures += 1
+        print("MISMATCH:", label)
+
+
+def reference_affine(point):
+    return None if point == INFINITY else (point.x(), point.y())
+
+
+def reference_verify(Y_bytes, R_bytes, e, s):
+    """The original verify_proof check: s*G == R + e*Y using ecdsa points."""
+    Y = VerifyingKey.from_string(Y_bytes, curve=SECP256k1).pubkey.point
+    R = VerifyingKey.from_string(R_bytes, curve=SECP256k1).pubkey.point
+    return s * G == R + e * Y
+
+
+def check_base_multiplication(rng, rounds):
+    for k in EDGE_SCALARS + [rng.randrange(N) for _ in range(rounds)]:
+        check(fast.mul_base(k) == reference_affine(k * G), f"mul_base({k:#x})")
+
+
+def check_decoding(rng, rounds):
+    for _ in range(rounds):
+        point = rng.randrange(1, N) * G
+        for form in ("compressed", "uncompressed", "hybrid", "raw"):
+            raw = point.to_bytes(form)
+            check(fast.decode_point(raw) == (point.x(), point.y()), f"decode {form} {raw.hex()}")
+        check(fast.encode_point((point.x(), point.y())) == point.to_bytes("compressed"), "encode")
+
+    bad = [
+        b"",
+        b"\x02" + b"\x00" * 32,                          # x = 0 is not on the curve
+        b"\x05" + G.to_bytes("compressed")[1:],          # unknown prefix
+        b"\x02" + fast.P.to_bytes(32, "big"),            # x >= p
+        G.to_bytes("compressed")[:-1],                   # truncated
+        b"\x04" + G.x().to_bytes(32, "big") + (G.y() + 1).to_bytes(32, "big"),
+        b"\x07" + G.to_bytes("raw"),                     # hybrid prefix with the wrong parity
+    ]
+    for raw in bad:
+        try:
+            fast.decode_point(raw)
+        except ValueError:
+            continue
+        check(False, f"accepted invalid encoding {raw.hex()}")
+
+
+def random_proof(rng, valid=True):
+    x = rng.randrange(1, N)
+    k = rng.randrange(1, N)
+    Y_bytes = (x * G).to_bytes("compressed")
+    R_bytes = (k * G).to_bytes("compressed")
+    e = schnorr.challenge_scalar(rng.randrange(1, 2 ** 53), R_bytes, Y_bytes)
+    s = (k + e * x) % N
+    if not valid:
+        s = (s + rng.randrange(1, N)) % N
+    return Y_bytes, R_bytes, e, s
+
+
+def check_single_verification(rng, rounds):
+    cases = [random_proof(rng, valid=rng.random() < 0.5) for _ in range(rounds)]
+    # edge cases: e = 0 (s*G == R), e = n - 1, s = 0 and s >= n
+    x = rng.randrange(1, N)
+    Y_bytes = (x * G).to_bytes("compressed")
+    for k, e in ((5, 0), (5, N - 1), (N - 1, 1)):
+        R_bytes = (k * G).to_bytes("compressed")
+        cases.append((Y_bytes, R_bytes, e, (k + e * x) % N))
+        cases.append((Y_bytes, R_bytes, e, (k + e * x) % N + N))
+        cases.append((Y_bytes, R_bytes, e, 0))
+    # R == e*Y, so s*G - e*Y must land exactly on R with s = 2e*x
+    e = rng.randrange(1, N)
+    R_bytes = (e * x * G).to_bytes("compressed")
+    cases.append((Y_bytes, R_bytes, e, 2 * e * x % N))
+
+    for Y_bytes, R_bytes, e, s in cases:
+        expected = reference_verify(Y_bytes, R_bytes, e, s)
+        got = schnorr.verify(fast.decode_point(Y_bytes), fast.decode_point(R_bytes), e, s)
+        check(got == expected, f"verify Y={Y_bytes.hex()} R={R_bytes.hex()} e={e:#x} s={s:#x}")
+
+
+def check_batch_verification(rng, rounds):
+    size = max(2, min(rounds, 64))
+    proofs = [random_proof(rng, valid=rng.random() < 0.8) for _ in range(size)]
+    # the same key appearing twice exercises the coefficient merge
+    proofs.append(proofs[0])
+    expected = [reference_verify(*p) for p in proofs]
+    items = [(fast.decode_point(Y), fast.decode_point(R), e, s) for Y, R, e, s in proofs]
+    check(schnorr.batch_verify(items) == expected, "batch_verify disagrees with reference")
+    check(schnorr.batch_verify([]) == [], "empty batch")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2 ** 32)
+    rng = random.Random(seed)
+    print(f"seed={seed} rounds={args.rounds}")
+
+    check_base_multiplication(rng, args.rounds)
+    check_decoding(rng, max(1, args.rounds // 10))
+    check_single_verification(rng, args.rounds)
+    check_batch_verification(rng, args.rounds)
+
+    if failures:
+        print(f"{failures} mismatch(es)")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Check read routing and read-your-writes against the configured MONGO_URI.
+
+Run from backend/ against a replica set (docker compose brings up a
+single-member one, rs0):
+  MONGO_URI="mongodb://localhost:27017/?replicaSet=rs0" MONGO_READ_VAULT=secondaryPreferred \\
+    python tools/check_read_routing.py [--rounds 200]
+
+For every endpoint class, each round writes a probe document on the primary
+and reads it back through that class's read preference. It does so in one
+causally consistent session, and again in a new session advanced from the
+X-Read-After token, as the next HTTP request would be. Exits non-zero if a
+read misses its own write. Prints which members served the reads
+(zkp_mongo_reads_total).
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+
+from utils import consistency
+from utils.db import READ_PREFERENCES, _LazyCollection, bind_session, get_client, reads_total
+
+PROBES = _LazyCollection('read_routing_probes')
+
+
+def check(read_class, rounds):
+    reader = PROBES.reading(read_class)
+    client = get_client()
+    misses = 0
+    for _ in range(rounds):
+        probe = ObjectId()
+        with client.start_session(causal_consistency=True) as session, bind_session(session):
+            PROBES.insert_one({'_id': probe})
+            misses += reader.find_one({'_id': probe}) is None
+            token = consistency.encode_token(session.operation_time, session.cluster_time)
+        # the next request, possibly on another worker, only has the token
+        operation_time, cluster_time = consistency.decode_token(token)
+        with client.start_session(causal_consistency=True) as session, bind_session(session):
+            session.advance_cluster_time(cluster_time)
+            session.advance_operation_time(operation_time)
+            misses += reader.find_one({'_id': probe}) is None
+    return misses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=100, help='write/read pairs per endpoint class')
+    args = parser.parse_args()
+
+    failed = False
+    try:
+        for read_class, preference in READ_PREFERENCES.items():
+            misses = check(read_class, args.rounds)
+            failed |= bool(misses)
+            print(f'{read_class:<6} {preference!r}: {misses} of {2 * args.rounds} reads missed their write')
+    finally:
+        PROBES.drop()
+
+    print('reads served:')
+    for _, labels, count in sorted(reads_total.samples()):
+        print(f'  {labels}: {count}')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Bulk-import users from an NDJSON file (one /auth/register record per line).
+
+Run from backend/, writing straight to MONGO_URI:
+  python tools/import_users.py users.ndjson [--batch-size 1000] [--results results.ndjson]
+or through a running server's admin endpoint (needs its ADMIN_TOKEN):
+  python tools/import_users.py users.ndjson --url https://backend.example.com --token $ADMIN_TOKEN
+Use - to read the records from stdin.
+
+Existing usernames are reported, never overwritten, so an interrupted import
+can simply be re-run. Per-record results go to --results (NDJSON); rejected
+records are also printed. Exits with status 1 if any record was rejected.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def import_local(infile, batch_size, source):
+    from utils import logger
+    from utils.user_import import import_users
+    try:
+        yield from import_users(infile, batch_size=batch_size, source=source)
+    finally:
+        logger.flush()
+
+
+def import_remote(infile, url, token, source):
+    parts = urlsplit(url)
+    cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    conn = cls(parts.netloc, timeout=300)
+    # http.client sends an iterable body with chunked transfer encoding
+    conn.request('POST', parts.path.rstrip('/') + '/admin/users/import?source=' + quote(source), body=infile,
+                 headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/x-ndjson'},
+                 encode_chunked=True)
+    response = conn.getresponse()
+    if response.status != 200:
+        sys.exit(f'import failed: HTTP {response.status} {response.read().decode(errors="replace")}')
+    for line in response:
+        result = json.loads(line)
+        if 'summary' not in result:
+            yield result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('file', help='NDJSON file, or - for stdin')
+    parser.add_argument('--batch-size', type=int, default=None, help='users per insert_many (default IMPORT_BATCH_SIZE)')
+    parser.add_argument('--results', help='write every per-record result to this NDJSON file')
+    parser.add_argument('--url', help='import through this server instead of writing to Mongo directly')
+    parser.add_argument('--token', default=os.getenv('ADMIN_TOKEN'), help='admin token for --url (default $ADMIN_TOKEN)')
+    args = parser.parse_args()
+
+    if args.url and not args.token:
+        parser.error('--url needs --token or ADMIN_TOKEN')
+    infile = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+    source = os.path.basename(args.file) if args.file != '-' else 'stdin'
+    if args.url:
+        results = import_remote(infile, args.url, args.token, source)
+    else:
+        from utils.user_import import IMPORT_BATCH_SIZE
+        results = import_local(infile, args.batch_size or IMPORT_BATCH_SIZE, source)
+
+    out = open(args.results, 'w') if args.results else None
+    counts = {'created': 0, 'error': 0}
+    started = time.perf_counter()
+    try:
+        for result in results:
+            counts[result['status']] += 1
+            if out:
+                out.write(json.dumps(result) + '\n')
+            if result['status'] != 'created':
+                print(f"line {result['line']} ({result.get('username')!r}): {result.get('message')}")
+    finally:
+        if out:
+            out.close()
+        infile.close()
+    elapsed = time.perf_counter() - started
+    total = counts['created'] + counts['error']
+    print(f'{counts["created"]} created, {counts["error"]} rejected of {total} records '
+          f'in {elapsed:.1f}s ({total / elapsed * 60 if elapsed else 0:.0f} records/min)')
+    if counts['error']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+"""Drive register -> challenge -> verify -> vault traffic and report latency per endpoint.
+
+Run from backend/ against a running server:
+  python tools/loadtest.py --url http://localhost:5000 --users 50 --concurrency 10
+or fully offline, in-process (Flask test client, no HTTP):
+  python tools/loadtest.py --in-process --mongomock --users 50 --concurrency 10
+--asgi runs the in-process requests through the asyncio app (asgi.py) on one
+event loop instead.
+
+Each virtual user owns a synthetic secp256k1 key pair, registers once and then
+runs --iterations operations drawn from --mix. Proofs are built exactly as the
+frontend builds them: e = SHA256(str(c) || R || Y) mod n, s = k + e*x mod n.
+"login" is the two-step challenge/verify flow, "login_one_shot" the single
+POST /auth/login against the published epoch.
+--in-process talks to MONGO_URI unless --mongomock swaps in the in-memory
+stand-in (pip install mongomock), or --sqlite PATH uses the embedded SQLite
+backend (STORAGE_BACKEND=sqlite). In-process runs disable the rate limits
+unless --keep-rate-limits is given; a remote server must be configured for load
+(e.g. RATE_LIMIT_IP=0 RATE_LIMIT_USERNAME=0).
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import schnorr
+from utils import secp256k1
+
+DEFAULT_MIX = "login=1,vault_read=4,vault_write=1"
+
+
+class SyntheticUser:
+    """A registered identity with its private key, session and last seen vault ETag."""
+
+    def __init__(self, username):
+        self.username = username
+        self.x = secrets.randbelow(secp256k1.N - 1) + 1
+        self.Y_bytes = secp256k1.encode_point(secp256k1.mul_base(self.x))
+        self.token = None
+        self.etag = None
+
+    def prove(self, c):
+        k = secrets.randbelow(secp256k1.N - 1) + 1
+        R_bytes = secp256k1.encode_point(secp256k1.mul_base(k))
+        e = schnorr.challenge_scalar(c, R_bytes, self.Y_bytes)
+        return R_bytes.hex(), format((k + e * self.x) % secp256k1.N, "064x")
+
+
+class HTTPTransport:
+    """Keep-alive HTTP connection per thread."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.secure = parts.scheme == "https"
+        self.host = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.secure else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.host, timeout=30)
+        return conn
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        for attempt in (0, 1):
+            conn = self._conn()
+            try:
+                conn.request(method, self.prefix + path, payload, headers)
+                response = conn.getresponse()
+                raw = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # server closed the keep-alive connection; reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        data = json.loads(raw) if raw else None
+        # case-insensitive, as servers differ in header name case
+        return response.status, response.headers, data
+
+
+class InProcessTransport:
+    """Flask test client per thread, so no network is involved."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, dict(response.headers), response.get_json(silent=True)
+
+
+class ASGITransport:
+    """Calls an ASGI app on an event loop thread, so no network is involved.
+    Every thread's requests share that one loop, as in a hypercorn worker."""
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._startup(), self.loop).result()
+
+    async def _startup(self):
+        messages = asyncio.Queue()
+        started = asyncio.Event()
+
+        async def send(message):
+            if message["type"].startswith("lifespan.startup"):
+                started.set()
+
+        await messages.put({"type": "lifespan.startup"})
+        # runs until the process exits (no shutdown is sent)
+        self._lifespan = self.loop.create_task(self.app({"type": "lifespan", "asgi": {"version": "3.0"}},
+                                                        messages.get, send))
+        await started.wait()
+
+    async def _call(self, method, path, body, headers):
+        from werkzeug.datastructures import Headers
+
+        path, _, query = path.partition("?")
+        payload = b"" if body is None else json.dumps(body).encode()
+        headers = dict(headers or {}, **({"Content-Type": "application/json"} if body is not None else {}))
+        headers["Content-Length"] = str(len(payload))
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+            "method": method, "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+            "root_path": "", "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+            "headers": [(k.lower().encode(), str(v).encode()) for k, v in headers.items()],
+        }
+        pending = [{"type": "http.request", "body": payload, "more_body": False}]
+        response_headers, chunks = Headers(), []
+        status = None
+        sent = asyncio.Event()
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            # the client stays connected until the whole response is in
+            await sent.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", []):
+                    response_headers.add(name.decode("latin-1"), value.decode("latin-1"))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    sent.set()
+
+        await self.app(scope, receive, send)
+        raw = b"".join(chunks)
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = None
+        return status, response_headers, data
+
+    def request(self, method, path, body=None, headers=None):
+        return asyncio.run_coroutine_threadsafe(self._call(method, path, body, headers), self.loop).result()
+
+
+class Stats:
+    """Latencies and outcomes per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint, seconds, status, ok):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class Runner:
+    def __init__(self, transport, stats):
+        self.transport = transport
+        self.stats = stats
+
+    def call(self, endpoint, method, path, body=None, headers=None, ok_statuses=(200,)):
+        started = time.perf_counter()
+        try:
+            status, resp_headers, data = self.transport.request(method, path, body, headers)
+        except Exception:
+            self.stats.record(endpoint, time.perf_counter() - started, "exception", False)
+            return None, {}, None
+        self.stats.record(endpoint, time.perf_counter() - started, status, status in ok_statuses)
+        return status, resp_headers, data
+
+    def register(self, user):
+        status, _, _ = self.call("register", "POST", "/auth/register", {
+            "username": user.username,
+            "publicY": user.Y_bytes.hex(),
+            "salt_kdf": "bG9hZHRlc3Q=",
+            "kdf_params": {"iterations": 1, "hash": "SHA-256"},
+            "vault_blob": {"iv": "", "ciphertext": secrets.token_hex(256), "tag": ""},
+        })
+        return status == 200
+
+    def login_one_shot(self, user):
+        status, _, data = self.call("epoch", "GET", "/auth/epoch")
+        if status != 200:
+            return False
+        ts = int(time.time())
+        R, s = user.prove(f"{data['epoch']}:{ts}:{user.username.strip().lower()}")
+        status, headers, data = self.call("login", "POST", "/auth/login", {
+            "username": user.username, "epoch": data["epoch"], "ts": ts, "R": R, "s": s,
+        })
+        if status != 200:
+            return False
+        user.token = data["session_token"]
+        user.etag = headers.get("ETag") or user.etag
+        return True
+
+    def login(self, user):
+        status, _, data = self.call("challenge", "POST", "/auth/challenge", {"username": user.username})
+        if status != 200:
+            return False
+        R, s = user.prove(data["c"])
+        status, headers, data = self.call("verify", "POST", "/auth/verify", {
+            "username": user.username, "challenge_id": data["challenge_id"], "R": R, "s": s,
+        })
+        if status != 200:
+            return False
+        user.token = data["session_token"]
+        user.etag = headers.get("ETag") or user.etag
+        return True
+
+    def vault_read(self, user):
+        headers = {"Authorization": f"Bearer {user.token}"}
+        if user.etag:
+            headers["If-None-Match"] = user.etag
+        status, resp_headers, _ = self.call("vault_read", "GET", "/vault", headers=headers, ok_statuses=(200, 304))
+        user.etag = resp_headers.get("ETag") or user.etag
+
+    def vault_write(self, user):
+        headers = {"Authorization": f"Bearer {user.token}"}
+        if user.etag:
+            headers["If-Match"] = user.etag
+        blob = {"iv": "", "ciphertext": secrets.token_hex(256), "tag": ""}
+        # 409 is a legitimate outcome of optimistic concurrency, not a failure
+        status, resp_headers, _ = self.call("vault_write", "POST", "/vault", {"vault_blob": blob},
+                                            headers=headers, ok_statuses=(200, 409))
+        user.etag = resp_headers.get("ETag") or user.etag
+
+    def run_user(self, user, iterations, mix, rng):
+        if not self.register(user) or not self.login(user):
+            return
+        names, weights = zip(*mix)
+        for _ in range(iterations):
+            op = rng.choices(names, weights)[0]
+            if op == "login":
+                self.login(user)
+            elif op == "login_one_shot":
+                self.login_one_shot(user)
+            elif user.token:
+                getattr(self, op)(user)
+
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("login", "login_one_shot", "vault_read", "vault_write"):
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def in_process_app(use_mongomock, keep_rate_limits, sqlite_path=None, use_asgi=False):
+    if not keep_rate_limits:
+        os.environ["RATE_LIMIT_IP"] = "0"
+        os.environ["RATE_LIMIT_USERNAME"] = "0"
+    if sqlite_path:
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = sqlite_path
+    elif use_mongomock:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("--mongomock needs the mongomock package (pip install mongomock)")
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    import app as app_module
+    if use_mongomock or sqlite_path:
+        from utils.indexes import ensure_indexes
+        ensure_indexes(log=lambda _msg: None)
+    if use_asgi:
+        import asgi
+        return asgi.app
+    return app_module.app
+
+
+def in_process_transport(args):
+    app = in_process_app(args.mongomock, getattr(args, "keep_rate_limits", False), args.sqlite, args.asgi)
+    return ASGITransport(app) if args.asgi else InProcessTransport(app)
+
+
+def report(stats, elapsed):
+    print(f"{'endpoint':<12} {'count':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint in ("register", "challenge", "verify", "epoch", "login", "vault_read", "vault_write"):
+        values = sorted(stats.latencies.get(endpoint, []))
+        if not values:
+            continue
+        print(f"{endpoint:<12} {len(values):>7} {stats.errors[endpoint]:>7} {len(values) / elapsed:>8.1f} "
+              f"{percentile(values, 50) * 1000:>8.2f} {percentile(values, 95) * 1000:>8.2f} "
+              f"{percentile(values, 99) * 1000:>8.2f} {values[-1] * 1000:>8.2f}")
+    for endpoint, statuses in sorted(stats.statuses.items()):
+        print(f"  {endpoint}: " + ", ".join(f"{code}={n}" for code, n in sorted(statuses.items(), key=str)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of a running backend")
+    target.add_argument("--in-process", action="store_true", help="call the Flask app directly")
+    storage = parser.add_mutually_exclusive_group()
+    storage.add_argument("--mongomock", action="store_true", help="with --in-process: use an in-memory Mongo")
+    storage.add_argument("--sqlite", metavar="PATH", help="with --in-process: use the embedded SQLite backend at PATH")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="with --in-process: keep RATE_LIMIT_* as configured")
+    parser.add_argument("--asgi", action="store_true", help="with --in-process: call the asyncio app (asgi.py)")
+    parser.add_argument("--users", type=int, default=20, help="synthetic users (one thread task each)")
+    parser.add_argument("--concurrency", type=int, default=5, help="users running at the same time")
+    parser.add_argument("--iterations", type=int, default=20, help="operations per user after registering")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the operation mix")
+    args = parser.parse_args()
+
+    if args.url:
+        transport = HTTPTransport(args.url)
+    else:
+        transport = in_process_transport(args)
+
+    stats = Stats()
+    runner = Runner(transport, stats)
+    run_id = uuid.uuid4().hex[:8]
+    seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2 ** 32)
+    users = [SyntheticUser(f"lt-{run_id}-{i}") for i in range(args.users)]
+    print(f"run={run_id} seed={seed} users={args.users} concurrency={args.concurrency} iterations={args.iterations}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(runner.run_user, user, args.iterations, args.mix, random.Random(seed + i))
+                   for i, user in enumerate(users)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(v) for v in stats.latencies.values())
+    print(f"{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+    report(stats, elapsed)
+    if any(stats.errors.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
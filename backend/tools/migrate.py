@@ -0,0 +1,32 @@
+"""Create indexes and apply schema fixes; run once per deploy, before starting the workers.
+
+Run from backend/:
+  python tools/migrate.py
+
+Workers no longer touch indexes at start-up. Data migrations that move or
+rewrite documents stay separate, one-shot tools:
+  tools/backfill_username_norm.py, tools/migrate_plain_entries.py,
+  tools/audit_query.py migrate-timestamps
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.indexes import ensure_indexes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quiet', action='store_true', help='only report errors')
+    args = parser.parse_args()
+
+    ensure_indexes(log=(lambda _msg: None) if args.quiet else print)
+    if not args.quiet:
+        print('Migration complete')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Move embedded users.plain_entries arrays into the vault_entries collection.
+
+Run from backend/ once after deploying the vault_entries change:
+  python tools/migrate_plain_entries.py [--batch-size 1000]
+
+Entries are upserted with $setOnInsert, so the script can be re-run safely
+(an entry already written through the API is never overwritten). Entries
+without an id, or reusing one, get a new id; a user's array is only removed
+once all of its entries are stored, and arrays that cannot be moved are
+kept and reported (see utils/entries.py). Afterwards
+it fills in the search fields (title_norm, url_norm, tags_norm, grams) of
+entries stored before entry search existed; --search-only does just that.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.entries import backfill_search_fields, migrate_embedded_entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=1000, help='entries per bulk_write')
+    parser.add_argument('--search-only', action='store_true', help='only backfill the search fields')
+    args = parser.parse_args()
+
+    if not args.search_only:
+        stats = migrate_embedded_entries(batch_size=args.batch_size)
+        print(f"Migrated {stats['users']} users, wrote {stats['written']} entries "
+              f"({stats['new_ids']} given new ids, {stats['duplicates']} exact duplicates merged)")
+        if stats['kept']:
+            print(f"Kept plain_entries of {stats['kept']} users "
+                  f"({stats['not_migrated']} non-object items); see the messages above")
+    indexed = backfill_search_fields(batch_size=args.batch_size)
+    print(f'Indexed {indexed} entries for search')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,13 @@
-from pymongo import MongoClient
-from dotenv import load_dotenv
 import os
+import sys
 from pprint import pprint
 
-load_dotenv()
-MONGO_URI = os.getenv('MONGO_URI')
-DBNAME = os.getenv('MONGO_DBNAME', 'zkp_demo')
-if not MONGO_URI:
-    print('MONGO_URI not set in .env')
-    exit(1)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import audit_query
+from utils.db import audit_logs as cols
 
-client = MongoClient(MONGO_URI)
-db = client.get_database(DBNAME)
-cols = db.get_collection('audit_logs')
 print('Last 30 audit logs:')
-for doc in cols.find().sort('timestamp', -1).limit(30):
+# newest first over the (timestamp, _id) index; see tools/audit_query.py for filters and exports
+for doc in audit_query.iter_events(cols, {}, descending=True, limit=30):
     pprint(doc)
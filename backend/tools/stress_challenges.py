@@ -0,0 +1,179 @@
+"""Check that a login challenge cannot be spent twice under contention.
+
+Run from backend/, in-process (many threads in one worker):
+  python tools/stress_challenges.py --in-process --mongomock [--rounds 50] [--threads 16]
+  python tools/stress_challenges.py --in-process --sqlite /tmp/stress.sqlite3
+  python tools/stress_challenges.py --in-process --mongomock --asgi   # asyncio app (asgi.py)
+or against a running server (threads and workers as configured there):
+  GUNICORN_THREADS=8 gunicorn -c gunicorn.conf.py app:app
+  python tools/stress_challenges.py --url http://localhost:5000
+
+First, --threads threads consume the same keys from the challenge replay
+cache at once. Then, for each of --rounds challenges, one valid proof is
+posted to /auth/verify by every thread at the same moment (a barrier
+releases them together), and the same again for --rounds one-shot proofs
+posted to /auth/login. Exactly one of those requests may open a session;
+the others must get 400. Last, for --rounds challenges that were spent once,
+every other encoding of the same MAC (the spare bits of its last character,
+"=" padding) is replayed; all must get 400. Exits non-zero on a double
+spend, an accepted replay or an unexpected status. The server needs its rate
+limits off (in-process runs do that).
+"""
+
+import argparse
+import base64
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.loadtest import HTTPTransport, Runner, Stats, SyntheticUser, in_process_transport
+from utils.cache import ReplayCache, Striped
+
+
+def stress_cache(threads, keys):
+    """Every key must be consumed by exactly one thread."""
+    cache = Striped(ReplayCache, keys * 2)
+    wins = Counter()
+    barrier = threading.Barrier(threads)
+    expires_at = time.time() + 60
+
+    def run():
+        barrier.wait()
+        for key in range(keys):
+            if cache.consume(key, expires_at):
+                wins[threading.get_ident(), key] += 1
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(run) for _ in range(threads)]:
+            future.result()
+    per_key = Counter(key for _, key in wins.elements())
+    return sum(1 for key in range(keys) if per_key[key] != 1)
+
+
+def _contend(pool, transport, threads, path, body):
+    """POST `body` to `path` from every thread at the same moment."""
+    barrier = threading.Barrier(threads)
+
+    def post():
+        barrier.wait()
+        return transport.request("POST", path, body)[0]
+
+    return Counter(f.result() for f in [pool.submit(post) for _ in range(threads)])
+
+
+def stress_verify(transport, threads, rounds, one_shot=False):
+    """Returns (double_spent_rounds, unexpected_statuses, status counts).
+    With one_shot, each round posts one /auth/login proof instead of a
+    challenge's /auth/verify proof."""
+    runner = Runner(transport, Stats())
+    user = SyntheticUser(f"stress-{uuid.uuid4().hex[:8]}")
+    if not runner.register(user):
+        sys.exit("could not register the stress user")
+    statuses = Counter()
+    double_spent = unexpected = 0
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for _ in range(rounds):
+            if one_shot:
+                status, _, data = transport.request("GET", "/auth/epoch")
+                if status != 200:
+                    sys.exit(f"epoch failed with {status}: {data}")
+                ts = int(time.time())
+                R, s = user.prove(f"{data['epoch']}:{ts}:{user.username}")
+                path, body = "/auth/login", {"username": user.username, "epoch": data["epoch"], "ts": ts, "R": R, "s": s}
+            else:
+                status, _, data = transport.request("POST", "/auth/challenge", {"username": user.username})
+                if status != 200:
+                    sys.exit(f"challenge failed with {status}: {data}")
+                R, s = user.prove(data["c"])
+                path, body = "/auth/verify", {"username": user.username, "challenge_id": data["challenge_id"], "R": R, "s": s}
+
+            results = _contend(pool, transport, threads, path, body)
+            statuses.update(results)
+            double_spent += results[200] > 1
+            unexpected += sum(n for code, n in results.items() if code not in (200, 400, 503))
+    return double_spent, unexpected, statuses
+
+
+def _reencodings(token):
+    """Other spellings of `token` whose MAC decodes to the same bytes."""
+    payload, mac = token.split(".")
+    raw = base64.urlsafe_b64decode(mac + "=" * (-len(mac) % 4))
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+    variants = [f"{token}=", f"{token}=="]
+    for ch in alphabet:
+        candidate = mac[:-1] + ch
+        if ch != mac[-1] and base64.urlsafe_b64decode(candidate + "=" * (-len(candidate) % 4)) == raw:
+            variants.append(f"{payload}.{candidate}")
+    return variants
+
+
+def replay_reencoded(transport, rounds):
+    """Returns (replays accepted, unexpected statuses, status counts)."""
+    runner = Runner(transport, Stats())
+    user = SyntheticUser(f"stress-{uuid.uuid4().hex[:8]}")
+    if not runner.register(user):
+        sys.exit("could not register the stress user")
+    statuses = Counter()
+    accepted = unexpected = 0
+    for _ in range(rounds):
+        status, _, data = transport.request("POST", "/auth/challenge", {"username": user.username})
+        if status != 200:
+            sys.exit(f"challenge failed with {status}: {data}")
+        R, s = user.prove(data["c"])
+        body = {"username": user.username, "challenge_id": data["challenge_id"], "R": R, "s": s}
+        status = transport.request("POST", "/auth/verify", body)[0]
+        if status != 200:
+            unexpected += 1
+            continue
+        for challenge_id in _reencodings(data["challenge_id"]):
+            status = transport.request("POST", "/auth/verify", dict(body, challenge_id=challenge_id))[0]
+            statuses[status] += 1
+            accepted += status == 200
+            unexpected += status not in (200, 400)
+    return accepted, unexpected, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of a running backend")
+    target.add_argument("--in-process", action="store_true", help="call the Flask app directly")
+    storage = parser.add_mutually_exclusive_group()
+    storage.add_argument("--mongomock", action="store_true", help="with --in-process: use an in-memory Mongo")
+    storage.add_argument("--sqlite", metavar="PATH", help="with --in-process: use the embedded SQLite backend at PATH")
+    parser.add_argument("--asgi", action="store_true", help="with --in-process: call the asyncio app (asgi.py)")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent spenders of each challenge")
+    parser.add_argument("--rounds", type=int, default=50, help="challenges to fight over")
+    parser.add_argument("--cache-keys", type=int, default=20000, help="keys in the replay cache phase")
+    args = parser.parse_args()
+
+    failed = stress_cache(args.threads, args.cache_keys)
+    print(f"replay cache: {args.threads} threads x {args.cache_keys} keys, {failed} keys not consumed exactly once")
+
+    if args.url:
+        transport = HTTPTransport(args.url)
+    else:
+        transport = in_process_transport(args)
+    failures = failed
+    for name, one_shot in (("verify", False), ("login", True)):
+        double_spent, unexpected, statuses = stress_verify(transport, args.threads, args.rounds, one_shot)
+        print(f"{name}: {args.rounds} proofs x {args.threads} threads, {double_spent} spent more than once; "
+              + ", ".join(f"{code}={n}" for code, n in sorted(statuses.items(), key=str)))
+        failures += double_spent + unexpected
+    accepted, unexpected, statuses = replay_reencoded(transport, args.rounds)
+    print(f"re-encoded replays: {args.rounds} spent challenges, {accepted} replays accepted; "
+          + ", ".join(f"{code}={n}" for code, n in sorted(statuses.items(), key=str)))
+    failures += accepted + unexpected
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# utils/adb.py
+"""
+Async counterparts of the utils.db collection proxies, used by asgi.py.
+Exports: users, sessions, session_revocations, spent_challenges, vault_entries, run_blocking
+
+On Mongo each process gets one pymongo AsyncMongoClient per event loop,
+with the same URI and pool settings as the sync client (utils/db.py). It is
+created on first use, like the sync one. The proxies then return the
+driver's own coroutines and cursors. Any other backend has no async driver:
+the SQLite facade, or a test double standing in for MongoClient. For those,
+every call runs in the loop's default thread pool, which suits a local file.
+The cursor interface is the same: find(...).sort(...).limit(...), then
+`await cursor.to_list()` or `async for`.
+
+Every read goes to the primary. The async app has no causally consistent
+sessions (X-Read-After), so reading a secondary could miss the client's
+own last write.
+"""
+
+import asyncio
+from functools import partial
+
+from pymongo.mongo_client import MongoClient
+
+from utils import db
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Await a blocking call on the running loop's default thread pool."""
+    return asyncio.get_running_loop().run_in_executor(None, partial(fn, *args, **kwargs))
+
+
+_clients = {}  # event loop -> AsyncMongoClient
+
+
+def _native():
+    # only a real pymongo client has an async twin; anything else is driven through threads
+    return db.STORAGE_BACKEND == "mongo" and isinstance(db.get_client(), MongoClient)
+
+
+def _async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # pymongo >= 4.13; imported here so the sync app does not need it
+        from pymongo import AsyncMongoClient
+        client = _clients[loop] = AsyncMongoClient(
+            db.MONGO_URI,
+            maxPoolSize=db.MONGO_MAX_POOL_SIZE,
+            minPoolSize=db.MONGO_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=db.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=db.MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=db.MONGO_SOCKET_TIMEOUT_MS,
+            waitQueueTimeoutMS=db.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        )
+    return client
+
+
+class _ThreadCursor:
+    """find() on a sync collection, fetched in a worker thread when awaited."""
+
+    def __init__(self, collection, args, kwargs):
+        self._cursor = partial(collection.find, *args, **kwargs)
+        self._chain = []
+
+    def _add(self, name, *args):
+        self._chain.append((name, args))
+        return self
+
+    def sort(self, *args):
+        return self._add("sort", *args)
+
+    def limit(self, *args):
+        return self._add("limit", *args)
+
+    def skip(self, *args):
+        return self._add("skip", *args)
+
+    def batch_size(self, *args):
+        return self._add("batch_size", *args)
+
+    def _fetch(self, length):
+        cursor = self._cursor()
+        for name, args in self._chain:
+            cursor = getattr(cursor, name)(*args)
+        if length is not None:
+            cursor = cursor.limit(length)
+        return list(cursor)
+
+    async def to_list(self, length=None):
+        return await run_blocking(self._fetch, length)
+
+    async def __aiter__(self):
+        for doc in await self.to_list():
+            yield doc
+
+
+class _AsyncCollection:
+    """Resolves to the named collection on each use (see module docstring)."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        if _native():
+            return getattr(_async_client().get_database(db.MONGO_DBNAME).get_collection(self.name), attr)
+        collection = getattr(db, self.name)
+        if attr == "find":
+            return lambda *args, **kwargs: _ThreadCursor(collection, args, kwargs)
+        return partial(run_blocking, getattr(collection, attr))
+
+    def __repr__(self):
+        return f"<async collection {db.MONGO_DBNAME}.{self.name}>"
+
+
+users = _AsyncCollection("users")
+sessions = _AsyncCollection("sessions")
+session_revocations = _AsyncCollection("session_revocations")
+spent_challenges = _AsyncCollection("spent_challenges")
+vault_entries = _AsyncCollection("vault_entries")
@@ -0,0 +1,157 @@
+"""
+Audit-log queries for operators and compliance exports.
+Exports: ensure_indexes, parse_time, build_filter, fetch_page, iter_events,
+         write_ndjson, write_csv, migrate_string_timestamps
+
+Every query is a range scan over one of the AUDIT_INDEXES. Results are
+ordered by (timestamp, _id) and paginated by keyset: each page resumes
+strictly after the last (timestamp, _id) seen, never with skip. Exports walk
+the pages one at a time, so memory stays constant however many events match,
+and a long export never depends on one server-side cursor staying alive.
+"""
+
+import base64
+import csv
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+DEFAULT_FIELDS = ("timestamp", "event_type", "username", "details")
+
+# time range, optionally narrowed by user or event type; _id breaks timestamp ties
+AUDIT_INDEXES = (
+    [("timestamp", DESCENDING), ("_id", DESCENDING)],
+    [("username", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+    [("event_type", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+)
+
+
+def ensure_indexes(collection):
+    for keys in AUDIT_INDEXES:
+        collection.create_index(keys)
+
+
+def parse_time(value):
+    """Parse an ISO-8601 date/datetime into a naive UTC datetime (as stored by log_event)."""
+    if value is None or isinstance(value, datetime):
+        return value
+    text = value.strip()
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def build_filter(start=None, end=None, username=None, event_types=None):
+    """Mongo filter for [start, end) with optional user and event-type constraints."""
+    query = {}
+    window = {}
+    if start is not None:
+        window["$gte"] = parse_time(start)
+    if end is not None:
+        window["$lt"] = parse_time(end)
+    if window:
+        query["timestamp"] = window
+    if username:
+        query["username"] = username
+    if event_types:
+        event_types = list(event_types)
+        query["event_type"] = event_types[0] if len(event_types) == 1 else {"$in": event_types}
+    return query
+
+
+def encode_cursor(doc):
+    raw = f"{doc['timestamp'].isoformat()}|{doc['_id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    ts, oid = raw.split("|", 1)
+    return datetime.fromisoformat(ts), ObjectId(oid)
+
+
+def _after(query, cursor, descending):
+    """Narrow `query` to the rows strictly after `cursor` in the chosen order."""
+    if not cursor:
+        return query
+    ts, oid = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    keyset = {"$or": [{"timestamp": {op: ts}}, {"timestamp": ts, "_id": {op: oid}}]}
+    return {"$and": [query, keyset]} if query else keyset
+
+
+def fetch_page(collection, query, limit=100, cursor=None, descending=False, projection=None):
+    """Return (docs, next_cursor). next_cursor is None on the last page."""
+    direction = DESCENDING if descending else ASCENDING
+    docs = list(
+        collection.find(_after(query, cursor, descending), projection)
+        .sort([("timestamp", direction), ("_id", direction)])
+        .limit(limit)
+    )
+    next_cursor = encode_cursor(docs[-1]) if len(docs) == limit else None
+    return docs, next_cursor
+
+
+def iter_events(collection, query, page_size=5000, cursor=None, descending=False, limit=None):
+    """Yield matching events page by page (constant memory)."""
+    produced = 0
+    while True:
+        size = page_size if limit is None else min(page_size, limit - produced)
+        if size <= 0:
+            return
+        docs, cursor = fetch_page(collection, query, size, cursor, descending)
+        yield from docs
+        produced += len(docs)
+        if cursor is None:
+            return
+
+
+def write_ndjson(events, fp):
+    """Write events as newline-delimited (relaxed extended) JSON. Returns the count."""
+    count = 0
+    for doc in events:
+        fp.write(json_util.dumps(doc))
+        fp.write("\n")
+        count += 1
+    return count
+
+
+def write_csv(events, fp, fields=DEFAULT_FIELDS):
+    """Write events as CSV with one column per field. Returns the count."""
+    writer = csv.writer(fp)
+    writer.writerow(fields)
+    count = 0
+    for doc in events:
+        row = []
+        for field in fields:
+            value = doc.get(field)
+            row.append(value.isoformat() if isinstance(value, datetime) else ("" if value is None else value))
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def migrate_string_timestamps(collection, batch_size=1000):
+    """Convert legacy ISO-string timestamps to BSON dates in place. Returns the count."""
+    converted = 0
+    while True:
+        batch = list(collection.find({"timestamp": {"$type": "string"}}, {"timestamp": 1}).limit(batch_size))
+        if not batch:
+            return converted
+        ops = []
+        for doc in batch:
+            update = {}
+            try:
+                update["timestamp"] = parse_time(doc["timestamp"])
+            except ValueError:
+                # unparseable: keep the original text and park the event at the epoch
+                update["timestamp"] = datetime(1970, 1, 1)
+                update["timestamp_raw"] = doc["timestamp"]
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+        collection.bulk_write(ops, ordered=False)
+        converted += len(ops)
@@ -0,0 +1,138 @@
+"""
+Pre-aggregated audit counters for dashboards.
+Exports: GRANULARITIES, apply, series, expire_raw_events, backfill
+
+The audit writer (utils/logger.py) passes every batch of events to apply().
+It counts them per minute and per hour bucket and event type, and optionally
+per user (AUDIT_ROLLUP_PER_USER), and writes the counts to `audit_rollups` with one
+unordered bulk_write of $inc upserts. A batch of any size costs one round
+trip, with one update per distinct (bucket, event type[, user]):
+
+    {_id: "m|2024-05-01T12:34|LOGIN_SUCCESS|", g: "m", t: <bucket start>,
+     e: "LOGIN_SUCCESS", u: None, n: 17, expires_at: ...}
+
+Minute buckets expire after AUDIT_ROLLUP_MINUTE_DAYS; hour buckets are kept.
+series() reads a time range back as zero-filled arrays. Its cost depends only on the
+number of buckets, not on how many events they count, so raw events can be
+deleted (expire_raw_events, tools/audit_retention.py) without changing a
+dashboard.
+"""
+
+import os
+from collections import Counter as Tally
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from utils import audit_query
+from utils.db import audit_logs, audit_rollups
+
+load_dotenv()
+
+AUDIT_ROLLUP_PER_USER = os.getenv("AUDIT_ROLLUP_PER_USER", "false").strip().lower() in ("1", "true", "yes")
+AUDIT_ROLLUP_MINUTE_DAYS = float(os.getenv("AUDIT_ROLLUP_MINUTE_DAYS", "7"))
+# largest range series() serves, in buckets (a day of minutes)
+SERIES_MAX_BUCKETS = 1440
+
+GRANULARITIES = {
+    "minute": ("m", timedelta(minutes=1)),
+    "hour": ("h", timedelta(hours=1)),
+}
+
+
+def _truncate(ts, code):
+    if code == "m":
+        return ts.replace(second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _key(code, bucket, event_type, username):
+    return f"{code}|{bucket.isoformat(timespec='minutes')}|{event_type}|{username or ''}"
+
+
+def apply(events, per_user=AUDIT_ROLLUP_PER_USER, collection=audit_rollups):
+    """Add a batch of audit events to the rollups. Returns the number of upserts."""
+    counts = Tally()
+    for event in events:
+        ts = event.get("timestamp")
+        if not isinstance(ts, datetime):
+            continue
+        users = (None, event.get("username")) if per_user and event.get("username") else (None,)
+        for code, _ in GRANULARITIES.values():
+            bucket = _truncate(ts, code)
+            for username in users:
+                counts[(code, bucket, event["event_type"], username)] += 1
+    if not counts:
+        return 0
+
+    ops = []
+    for (code, bucket, event_type, username), n in counts.items():
+        fields = {"g": code, "t": bucket, "e": event_type, "u": username}
+        if code == "m":
+            fields["expires_at"] = bucket + timedelta(days=AUDIT_ROLLUP_MINUTE_DAYS)
+        ops.append(UpdateOne({"_id": _key(code, bucket, event_type, username)},
+                             {"$inc": {"n": n}, "$setOnInsert": fields}, upsert=True))
+    collection.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def series(granularity, start, end, event_types=None, username=None, collection=audit_rollups.reading("stats")):
+    """Counts for [start, end) as {"buckets": [...], "series": {event_type: [n, ...]}, "totals": {...}}.
+    Buckets are zero-filled; raises ValueError for an unknown granularity or a range over
+    SERIES_MAX_BUCKETS buckets.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    code, step = GRANULARITIES[granularity]
+    first = _truncate(start, code)
+    if end <= first:
+        raise ValueError("until must be after since")
+    count = -(-(end - first) // step)
+    if count > SERIES_MAX_BUCKETS:
+        raise ValueError(f"range spans more than {SERIES_MAX_BUCKETS} {granularity} buckets")
+    buckets = [first + i * step for i in range(count)]
+
+    query = {"g": code, "u": username or None, "t": {"$gte": first, "$lt": end}}
+    if event_types:
+        query["e"] = {"$in": list(event_types)}
+    result = {event_type: [0] * count for event_type in event_types or ()}
+    for doc in collection.find(query, {"_id": 0, "t": 1, "e": 1, "n": 1}):
+        result.setdefault(doc["e"], [0] * count)[(doc["t"] - first) // step] += doc["n"]
+    return {
+        "buckets": buckets,
+        "series": result,
+        "totals": {event_type: sum(values) for event_type, values in result.items()},
+    }
+
+
+def expire_raw_events(older_than, batch_size=10000, collection=audit_logs, log=print):
+    """Delete raw audit events with a timestamp before `older_than`, batch_size at a time
+    so no single delete holds the collection for long. The rollups are left untouched.
+    Returns the number deleted."""
+    deleted = 0
+    while True:
+        ids = [doc["_id"] for doc in collection.find({"timestamp": {"$lt": older_than}}, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            return deleted
+        deleted += collection.delete_many({"_id": {"$in": ids}}).deleted_count
+        log(f"audit_logs: deleted {deleted} events before {older_than.isoformat()}")
+
+
+def backfill(start, end, per_user=AUDIT_ROLLUP_PER_USER, page_size=5000, log=print):
+    """Build rollups from raw events in [start, end). Counts are added, not replaced:
+    run it once, for a period recorded before rollups were enabled. Returns the event count."""
+    query = audit_query.build_filter(start, end)
+    total = 0
+    page = []
+    for event in audit_query.iter_events(audit_logs, query, page_size=page_size):
+        page.append(event)
+        if len(page) >= page_size:
+            apply(page, per_user)
+            total += len(page)
+            page = []
+            log(f"audit_rollups: {total} events rolled up")
+    if page:
+        apply(page, per_user)
+        total += len(page)
+    return total
@@ -0,0 +1,311 @@
+"""
+Chunked, compressed storage for large client-encrypted blobs.
+Exports: BlobTooLarge, store_value, store_stream, open_stream, delete, json_envelope
+
+vault_blob and encrypted_backup are opaque JSON values to the server. A value
+whose JSON encoding fits in BLOB_INLINE_MAX bytes stays inline in the user
+document. A larger one goes to the GridFS bucket `blobs`, gzip-compressed.
+The user document then keeps only a small reference next to the field:
+    <field>: None, <field>_ref: {file_id, size, stored}
+(size is the JSON length in bytes, stored the compressed length). Uploads and
+downloads move the blob in fixed-size chunks, so memory stays constant
+whatever the blob's size. VAULT_MAX_BYTES caps the uncompressed size and
+also protects against gzip bombs. json_envelope splices the stored bytes
+verbatim into GET /vault and login responses, so every upload is checked to
+be exactly one JSON value as it streams in (_JsonChecker). A body that fails
+the check is never stored. With STORAGE_BACKEND=sqlite the bucket is a files
+table and a chunks table in the SQLite file (sqlite_store.Bucket).
+"""
+
+import codecs
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+
+import gridfs
+from bson import ObjectId
+from dotenv import load_dotenv
+
+from utils import sqlite_store
+from utils.db import STORAGE_BACKEND, get_client, get_db
+
+load_dotenv()
+
+BLOB_INLINE_MAX = int(os.getenv("BLOB_INLINE_MAX", str(64 * 1024)))
+VAULT_MAX_BYTES = int(os.getenv("VAULT_MAX_BYTES", str(64 * 1024 * 1024)))
+CHUNK_SIZE = 255 * 1024  # GridFS default chunk size
+GZIP_LEVEL = 6
+JSON_MAX_DEPTH = 512
+
+_bucket = None
+_bucket_client = None
+_lock = threading.Lock()
+
+
+class BlobTooLarge(Exception):
+    def __init__(self, limit=VAULT_MAX_BYTES):
+        super().__init__(f"Blob exceeds {limit} bytes")
+        self.limit = limit
+
+
+def _get_bucket():
+    global _bucket, _bucket_client
+    client = get_client()
+    if _bucket_client is not client:
+        with _lock:
+            if _bucket_client is not client:
+                bucket_class = sqlite_store.Bucket if STORAGE_BACKEND == "sqlite" else gridfs.GridFSBucket
+                _bucket = bucket_class(get_db(), bucket_name="blobs", chunk_size_bytes=CHUNK_SIZE)
+                _bucket_client = client
+    return _bucket
+
+
+_WS = re.compile(r"[ \t\n\r]*")
+_STRING_RUN = re.compile(r'[^"\\\x00-\x1f]*')
+_ESCAPE = re.compile(r'\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})')
+_SCALAR_RUN = re.compile(r"[-+.0-9a-zA-Z]*")
+_SCALAR = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null")
+_SCALAR_MAX = 1024
+
+
+class _JsonChecker:
+    """Incremental check that a byte stream is exactly one JSON value (UTF-8).
+    Keeps only the container stack and at most one unfinished number, literal or
+    escape between chunks, so memory does not grow with the blob. Raises ValueError."""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._stack = []
+        self._expect = "value"  # value, value_or_close, key, key_or_close, colon, comma_or_close, end
+        self._in_string = False
+        self._carry = ""
+
+    def feed(self, data, final=False):
+        try:
+            text = self._decoder.decode(data, final)
+        except UnicodeDecodeError:
+            raise ValueError("Invalid JSON body: not UTF-8")
+        buf, pos = self._carry + text, 0
+        self._carry = ""
+        end = len(buf)
+        while pos < end:
+            if self._in_string:
+                pos = _STRING_RUN.match(buf, pos).end()
+                if pos == end:
+                    break
+                c = buf[pos]
+                if c == '"':
+                    self._in_string = False
+                    pos += 1
+                    self._string_done()
+                elif c == "\\":
+                    m = _ESCAPE.match(buf, pos)
+                    if m:
+                        pos = m.end()
+                    elif end - pos < 6 and not final:
+                        self._carry = buf[pos:]
+                        break
+                    else:
+                        raise ValueError("Invalid JSON body: bad escape in string")
+                else:
+                    raise ValueError("Invalid JSON body: control character in string")
+                continue
+            pos = _WS.match(buf, pos).end()
+            if pos == end:
+                break
+            c = buf[pos]
+            if c == '"':
+                if self._expect not in ("value", "value_or_close", "key", "key_or_close"):
+                    self._fail(c)
+                self._in_string = True
+                pos += 1
+            elif c in "{[":
+                if self._expect not in ("value", "value_or_close"):
+                    self._fail(c)
+                if len(self._stack) >= JSON_MAX_DEPTH:
+                    raise ValueError("Invalid JSON body: nested too deeply")
+                self._stack.append(c)
+                self._expect = "key_or_close" if c == "{" else "value_or_close"
+                pos += 1
+            elif c in "}]":
+                opener, empty = ("{", "key_or_close") if c == "}" else ("[", "value_or_close")
+                if not self._stack or self._stack[-1] != opener or self._expect not in ("comma_or_close", empty):
+                    self._fail(c)
+                self._stack.pop()
+                self._value_done()
+                pos += 1
+            elif c == ",":
+                if self._expect != "comma_or_close":
+                    self._fail(c)
+                self._expect = "key" if self._stack[-1] == "{" else "value"
+                pos += 1
+            elif c == ":":
+                if self._expect != "colon":
+                    self._fail(c)
+                self._expect = "value"
+                pos += 1
+            else:
+                run_end = _SCALAR_RUN.match(buf, pos).end()
+                if run_end == end and not final:
+                    if run_end - pos > _SCALAR_MAX:
+                        raise ValueError("Invalid JSON body: token too long")
+                    self._carry = buf[pos:]
+                    break
+                if self._expect not in ("value", "value_or_close") or not _SCALAR.fullmatch(buf, pos, run_end):
+                    self._fail(buf[pos:run_end][:20] or c)
+                self._value_done()
+                pos = run_end
+        if final and (self._in_string or self._expect != "end"):
+            raise ValueError("Invalid JSON body: unexpected end")
+
+    def _fail(self, token):
+        raise ValueError(f"Invalid JSON body: unexpected {token!r}")
+
+    def _string_done(self):
+        if self._expect in ("key", "key_or_close"):
+            self._expect = "colon"
+        else:
+            self._value_done()
+
+    def _value_done(self):
+        self._expect = "comma_or_close" if self._stack else "end"
+
+
+def _gzip():
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+def _gunzip():
+    return zlib.decompressobj(31)
+
+
+def store_stream(chunks, content_encoding=None, max_bytes=VAULT_MAX_BYTES, metadata=None):
+    """Upload an iterable of byte chunks to GridFS, stored gzip-compressed.
+    `content_encoding` is "gzip" if the chunks already are (they are stored as sent),
+    or None. Returns the reference dict. Raises BlobTooLarge and ValueError
+    (bad gzip data or more than one gzip member, an empty blob, or a body that is
+    not one JSON value); a partial upload is removed.
+    """
+    bucket = _get_bucket()
+    file_id = ObjectId()
+    size = stored = 0
+    parser = _JsonChecker()
+    inflater = _gunzip() if content_encoding == "gzip" else None
+    compressor = None if content_encoding == "gzip" else _gzip()
+    upload = bucket.open_upload_stream_with_id(file_id, f"blob-{file_id}", metadata=metadata or {})
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if inflater is not None:
+                # check the uncompressed bytes without holding them; bounded output per call.
+                # Only one gzip member: bytes after it would be stored but never checked.
+                if inflater.eof:
+                    raise ValueError("Trailing data after the gzip body")
+                try:
+                    data = inflater.decompress(chunk, CHUNK_SIZE)
+                    while True:
+                        size += len(data)
+                        if size > max_bytes:
+                            raise BlobTooLarge(max_bytes)
+                        parser.feed(data)
+                        if not inflater.unconsumed_tail:
+                            break
+                        data = inflater.decompress(inflater.unconsumed_tail, CHUNK_SIZE)
+                except zlib.error:
+                    raise ValueError("Invalid gzip body")
+                if inflater.unused_data:
+                    raise ValueError("Trailing data after the gzip body")
+                out = chunk
+            else:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise BlobTooLarge(max_bytes)
+                parser.feed(chunk)
+                out = compressor.compress(chunk)
+            if out:
+                upload.write(out)
+                stored += len(out)
+        if compressor is not None:
+            tail = compressor.flush()
+            upload.write(tail)
+            stored += len(tail)
+        elif not inflater.eof:
+            raise ValueError("Truncated gzip body")
+        if size == 0:
+            raise ValueError("Empty blob")
+        parser.feed(b"", final=True)
+        upload.close()
+    except BaseException:
+        upload.abort()
+        raise
+    return {"file_id": file_id, "size": size, "stored": stored}
+
+
+def store_value(value, max_bytes=VAULT_MAX_BYTES, metadata=None):
+    """Return (inline_value, ref) for a JSON value: exactly one of them is not None
+    (both None for a None value)."""
+    if value is None:
+        return None, None
+    data = json.dumps(value, separators=(",", ":")).encode()
+    if len(data) <= BLOB_INLINE_MAX:
+        return value, None
+    if len(data) > max_bytes:
+        raise BlobTooLarge(max_bytes)
+    chunks = (data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+    return None, store_stream(chunks, max_bytes=max_bytes, metadata=metadata)
+
+
+def open_stream(ref, content_encoding=None):
+    """Yield the blob in chunks: its stored gzip bytes if `content_encoding` is "gzip",
+    otherwise the plain JSON bytes."""
+    download = _get_bucket().open_download_stream(ref["file_id"])
+    try:
+        inflater = None if content_encoding == "gzip" else _gunzip()
+        while True:
+            chunk = download.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if inflater is None:
+                yield chunk
+                continue
+            data = inflater.decompress(chunk, CHUNK_SIZE)
+            while data:
+                yield data
+                data = inflater.decompress(inflater.unconsumed_tail, CHUNK_SIZE) if inflater.unconsumed_tail else b""
+        if inflater is not None:
+            tail = inflater.flush()
+            if tail:
+                yield tail
+    finally:
+        download.close()
+
+
+def delete(ref):
+    """Remove a stored blob. A missing file is not an error, and any other
+    failure is logged rather than raised: the caller's write has already
+    succeeded, and at worst an unreachable file is left in the bucket."""
+    if not ref:
+        return
+    try:
+        _get_bucket().delete(ref["file_id"])
+    except gridfs.errors.NoFile:
+        pass
+    except Exception as e:
+        logging.warning("blobstore: could not delete blob %s: %s", ref.get("file_id"), e)
+
+
+def json_envelope(payload, field, inline_value=None, ref=None):
+    """Yield the JSON document `payload` plus `field` (last key), streaming the
+    field's value from GridFS when `ref` is given."""
+    head = json.dumps(payload)
+    if ref is None:
+        yield (head[:-1] + (", " if payload else "") + json.dumps(field) + ": "
+               + json.dumps(inline_value) + "}").encode()
+        return
+    yield (head[:-1] + (", " if payload else "") + json.dumps(field) + ": ").encode()
+    yield from open_stream(ref)
+    yield b"}"
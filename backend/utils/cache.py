@@ -0,0 +1,148 @@
+"""
+Small bounded in-process caches.
+Exports: ReplayCache, TTLCache, Striped, CACHE_STRIPES
+
+Every cache serializes its operations on its own lock, so each one is safe to
+share between the threads of a gthread worker. Striped spreads the keys over
+several such caches by hash. Threads then contend only when their keys land
+on the same stripe, and any single-key operation, such as
+ReplayCache.consume, stays atomic.
+"""
+
+import heapq
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# independent locks per shared cache (1 = a single lock, enough for sync workers)
+CACHE_STRIPES = max(1, int(os.getenv("CACHE_STRIPES", "16")))
+
+
+class ReplayCache:
+    """Remembers one-time keys (e.g. consumed login challenges) until they expire.
+
+    Memory is bounded by `maxsize`. Expired keys are dropped as new ones
+    arrive. If the cache is still full, the key that expires first is evicted
+    and its expiry becomes the horizon. Keys do not arrive in expiry order
+    (one-shot logins carry their own, longer exp), so a heap orders them.
+    Any key that expires at or before the horizon is then treated as already
+    seen. This fails closed: under a flood, old tokens get rejected instead
+    of becoming replayable.
+    """
+
+    def __init__(self, maxsize=100_000, clock=time.time):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries = {}  # key -> expires_at (epoch seconds)
+        self._expiries = []  # heap of (expires_at, key), one per entry
+        self._horizon = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _purge(self, now):
+        expiries = self._expiries
+        while expiries and expiries[0][0] <= now:
+            del self._entries[heapq.heappop(expiries)[1]]
+
+    def seen(self, key, expires_at):
+        """True if `key` was already consumed (or can no longer be proven unused)."""
+        with self._lock:
+            return expires_at <= self._horizon or key in self._entries
+
+    def consume(self, key, expires_at):
+        """Atomically mark `key` used. Returns False if it had already been used."""
+        now = self._clock()
+        with self._lock:
+            if expires_at <= self._horizon or key in self._entries:
+                return False
+            self._purge(now)
+            while len(self._entries) >= self.maxsize:
+                evicted, evicted_key = heapq.heappop(self._expiries)
+                del self._entries[evicted_key]
+                self._horizon = max(self._horizon, evicted)
+            self._entries[key] = expires_at
+            heapq.heappush(self._expiries, (expires_at, key))
+            return True
+
+
+class TTLCache:
+    """Size-bounded LRU mapping whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=10_000, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return default
+            if item[0] <= self._clock():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._entries.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class Striped:
+    """`stripes` caches from `factory(maxsize)`, each holding its share of `maxsize`.
+
+    Offers the methods of the wrapped cache (get, set, pop, clear, seen,
+    consume); each call locks only the stripe that owns its key.
+    """
+
+    def __init__(self, factory, maxsize, stripes=CACHE_STRIPES):
+        self.maxsize = maxsize
+        self._stripes = [factory(math.ceil(maxsize / stripes)) for _ in range(stripes)]
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def __len__(self):
+        return sum(len(stripe) for stripe in self._stripes)
+
+    def get(self, key, default=None):
+        return self._stripe(key).get(key, default)
+
+    def set(self, key, value, ttl=None):
+        self._stripe(key).set(key, value, ttl)
+
+    def pop(self, key, default=None):
+        return self._stripe(key).pop(key, default)
+
+    def clear(self):
+        for stripe in self._stripes:
+            stripe.clear()
+
+    def seen(self, key, expires_at):
+        return self._stripe(key).seen(key, expires_at)
+
+    def consume(self, key, expires_at):
+        return self._stripe(key).consume(key, expires_at)
@@ -0,0 +1,130 @@
+"""
+Stateless login challenges.
+Exports: issue_challenge, open_challenge, mac_key, current_epoch, open_login,
+login_key, InvalidChallenge
+
+A challenge is a compact token "<payload>.<mac>". The payload is the base64url
+JSON {"u": username_norm, "c": nonce, "exp": unix_seconds}, and the mac is a
+truncated HMAC-SHA256 of it under SECRET_KEY. Any worker that shares the key
+can check a challenge without a lookup. Single use is enforced by the caller,
+using mac_key() as the one-time key. Only the canonical (unpadded) encoding
+of the MAC is accepted: base64 ignores the spare bits of the last character
+and optional "=" padding, and every such variant would be a fresh key.
+
+One-shot logins (Fiat-Shamir) skip the challenge request. The server
+publishes an epoch value, the MAC of the current LOGIN_EPOCH_SECONDS slot,
+and the client proves against c = "<epoch>:<ts>:<username_norm>" with its own
+unix timestamp ts. open_login accepts the current or previous epoch and a ts
+within LOGIN_WINDOW seconds of the server clock; login_key() is the one-time
+key of such a proof.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# JS clients hash str(c), so keep c within the integers a JS number holds exactly
+NONCE_MAX = 2 ** 53 - 1
+MAC_BYTES = 16
+# One-shot logins: epoch length and accepted clock difference (seconds)
+LOGIN_EPOCH_SECONDS = int(os.getenv("LOGIN_EPOCH_SECONDS", "300"))
+LOGIN_WINDOW = int(os.getenv("LOGIN_WINDOW", "60"))
+
+_secret = os.getenv("SECRET_KEY")
+if not _secret:
+    # Tokens then only verify in the worker that issued them.
+    logging.warning("SECRET_KEY not set; login challenges are bound to this process")
+    _secret = secrets.token_hex(32)
+_KEY = hashlib.sha256(b"zkp-login-challenge:" + _secret.encode()).digest()
+
+
+class InvalidChallenge(Exception):
+    """The challenge token is malformed, forged or expired."""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _mac(payload):
+    return hmac.new(_KEY, payload.encode("ascii"), hashlib.sha256).digest()[:MAC_BYTES]
+
+
+def issue_challenge(username_norm, ttl):
+    """Return (token, c, expires_at_epoch) for a fresh challenge."""
+    c = secrets.randbelow(NONCE_MAX) + 1
+    expires_at = int(time.time()) + ttl
+    body = json.dumps({"u": username_norm, "c": c, "exp": expires_at}, separators=(",", ":"))
+    payload = _b64encode(body.encode())
+    return f"{payload}.{_b64encode(_mac(payload))}", c, expires_at
+
+
+def open_challenge(token, now=None):
+    """Check a token's signature and expiry. Returns {"u", "c", "exp"}."""
+    if not isinstance(token, str) or token.count(".") != 1:
+        raise InvalidChallenge("Invalid or used challenge")
+    payload, mac = token.split(".")
+    try:
+        # compare the text, not the decoded bytes: re-encodings of one MAC must not pass
+        valid = hmac.compare_digest(mac.encode("ascii"), _b64encode(_mac(payload)).encode("ascii"))
+        claims = json.loads(_b64decode(payload)) if valid else None
+    except (ValueError, UnicodeError):
+        raise InvalidChallenge("Invalid or used challenge")
+    if not isinstance(claims, dict) or not {"u", "c", "exp"} <= claims.keys():
+        raise InvalidChallenge("Invalid or used challenge")
+    if (now if now is not None else time.time()) > claims["exp"]:
+        raise InvalidChallenge("Challenge expired")
+    return claims
+
+
+def mac_key(token):
+    """Stable one-time key for a token (its MAC), for replay tracking.
+    Derived from the decoded MAC bytes, so it does not depend on how they were encoded."""
+    return _b64encode(_b64decode(token.rsplit(".", 1)[-1]))
+
+
+def _epoch_value(slot):
+    # ":" never occurs in a base64url payload, so this cannot collide with a challenge MAC
+    return _b64encode(_mac(f"epoch:{slot}"))
+
+
+def current_epoch(now=None):
+    """Return (epoch, valid_until_epoch_seconds) for the epoch being published."""
+    slot = int((now if now is not None else time.time()) // LOGIN_EPOCH_SECONDS)
+    return _epoch_value(slot), (slot + 1) * LOGIN_EPOCH_SECONDS
+
+
+def open_login(epoch, ts, username_norm, now=None):
+    """Check a one-shot login's epoch and timestamp.
+    Returns {"u", "c", "exp"} like open_challenge, where c is the string the
+    client hashed and exp is when ts leaves the acceptance window.
+    """
+    now = now if now is not None else time.time()
+    if not isinstance(epoch, str):
+        raise InvalidChallenge("Invalid login epoch")
+    if isinstance(ts, bool) or not isinstance(ts, int):
+        raise InvalidChallenge("Invalid login timestamp")
+    slot = int(now // LOGIN_EPOCH_SECONDS)
+    if not any(hmac.compare_digest(epoch.encode(), _epoch_value(s).encode()) for s in (slot, slot - 1)):
+        raise InvalidChallenge("Login epoch expired")
+    if abs(now - ts) > LOGIN_WINDOW:
+        raise InvalidChallenge("Login timestamp outside the accepted window")
+    return {"u": username_norm, "c": f"{epoch}:{ts}:{username_norm}", "exp": ts + LOGIN_WINDOW}
+
+
+def login_key(claims, R_bytes):
+    """One-time key for a one-shot proof: the same (c, R) can only open one session."""
+    return hashlib.sha256(claims["c"].encode() + R_bytes).hexdigest()[:32]
@@ -0,0 +1,113 @@
+"""
+Response compression negotiated from Accept-Encoding.
+Exports: init_app, init_async_app, negotiate, compress_stream
+
+gzip or deflate is applied to JSON and text responses of at least
+COMPRESS_MIN_BYTES, and to every streamed response. Streamed bodies are
+compressed chunk by chunk, so they stay constant-memory. A response that
+already has a Content-Encoding (e.g. a stored gzip blob sent as is) is left
+alone. A compressed response's ETag is made weak, as the same vault version
+now has more than one byte representation. init_async_app installs the same
+policy on the asyncio app (asgi.py), whose streamed bodies are async iterables.
+"""
+
+import os
+import zlib
+
+from flask import request
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+
+_WBITS = {"gzip": 31, "deflate": 15}
+_COMPRESSIBLE = ("application/json", "text/")
+
+
+def negotiate(req=None):
+    """Best of gzip/deflate the client accepts for this request, or None."""
+    return (request if req is None else req).accept_encodings.best_match(("gzip", "deflate"))
+
+
+def _compressor(encoding):
+    return zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, _WBITS[encoding])
+
+
+def compress_stream(chunks, encoding):
+    compressor = _compressor(encoding)
+    for chunk in chunks:
+        out = compressor.compress(chunk if isinstance(chunk, bytes) else chunk.encode())
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _encoding(response, req):
+    """Encoding to apply to `response`, or None (also sets Vary where it matters)."""
+    if not 200 <= response.status_code < 300 or response.status_code == 204 or req.method == "HEAD":
+        return None
+    if "Content-Encoding" in response.headers:
+        return None
+    if not (response.mimetype or "").startswith(_COMPRESSIBLE):
+        return None
+    response.vary.add("Accept-Encoding")
+    return negotiate(req)
+
+
+def _mark_encoded(response, encoding):
+    response.headers["Content-Encoding"] = encoding
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        response.headers["ETag"] = "W/" + etag
+
+
+def _compress(response):
+    encoding = _encoding(response, request)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        compressor = _compressor(encoding)
+        response.set_data(compressor.compress(data) + compressor.flush())
+    _mark_encoded(response, encoding)
+    return response
+
+
+async def _compress_async_stream(chunks, encoding):
+    compressor = _compressor(encoding)
+    async for chunk in chunks:
+        out = compressor.compress(chunk if isinstance(chunk, bytes) else chunk.encode())
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+async def _compress_async(response):
+    from quart import request as async_request
+
+    encoding = _encoding(response, async_request)
+    if encoding is None:
+        return response
+    if isinstance(response.response, response.data_body_class):
+        data = await response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        compressor = _compressor(encoding)
+        response.set_data(compressor.compress(data) + compressor.flush())
+    else:
+        response.response = response.iterable_body_class(_compress_async_stream(response.response, encoding))
+        response.headers.pop("Content-Length", None)
+    _mark_encoded(response, encoding)
+    return response
+
+
+def init_app(app):
+    app.after_request(_compress)
+
+
+def init_async_app(app):
+    app.after_request(_compress_async)
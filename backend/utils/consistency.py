@@ -0,0 +1,101 @@
+"""
+Read-your-writes across replica set members.
+Exports: init_app, encode_token, decode_token, READ_AFTER_HEADER
+
+Only active when some endpoint class reads from secondaries (see
+READ_PREFERENCES in utils/db.py). Each request then runs in one causally
+consistent pymongo session, bound to every collection proxy. A read in that
+session waits until the member serving it has caught up with the session's
+operationTime.
+
+HTTP requests are independent and may land on any worker, so the session's
+position travels with the client. Every response carries it in the
+X-Read-After header, a signed token holding operationTime and $clusterTime.
+A client that sends the last token it received back on its next request
+gets a session advanced to that point. Its own writes (register, vault
+saves, entry changes) are then never missing from a secondary read.
+Without the header a request still gets consistent reads within itself.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+
+import bson
+from dotenv import load_dotenv
+from flask import g, request
+
+from utils.db import bind_session, causal_reads_enabled, get_client
+
+load_dotenv()
+
+READ_AFTER_HEADER = "X-Read-After"
+MAC_BYTES = 16
+
+# like login challenges, tokens from another worker only verify with a shared SECRET_KEY
+_KEY = hashlib.sha256(b"zkp-read-after:" + (os.getenv("SECRET_KEY") or secrets.token_hex(32)).encode()).digest()
+
+
+def _mac(payload):
+    return hmac.new(_KEY, payload, hashlib.sha256).digest()[:MAC_BYTES]
+
+
+def encode_token(operation_time, cluster_time):
+    payload = bson.encode({"t": operation_time, "c": cluster_time})
+    return base64.urlsafe_b64encode(payload + _mac(payload)).rstrip(b"=").decode("ascii")
+
+
+def decode_token(token):
+    """Return (operation_time, cluster_time), or None for a malformed or forged token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (TypeError, ValueError):
+        return None
+    payload, mac = raw[:-MAC_BYTES], raw[-MAC_BYTES:]
+    if len(raw) <= MAC_BYTES or not hmac.compare_digest(mac, _mac(payload)):
+        return None
+    try:
+        doc = bson.decode(payload)
+    except Exception:
+        return None
+    return doc.get("t"), doc.get("c")
+
+
+def _start():
+    session = get_client().start_session(causal_consistency=True)
+    position = decode_token(request.headers.get(READ_AFTER_HEADER, ""))
+    if position is not None:
+        operation_time, cluster_time = position
+        if cluster_time:
+            session.advance_cluster_time(cluster_time)
+        if operation_time:
+            session.advance_operation_time(operation_time)
+    g.mongo_session = session
+    g.mongo_session_binding = bind_session(session)
+    g.mongo_session_binding.__enter__()
+
+
+def _attach_token(response):
+    session = g.get("mongo_session")
+    if session is not None and session.operation_time is not None:
+        response.headers[READ_AFTER_HEADER] = encode_token(session.operation_time, session.cluster_time)
+    return response
+
+
+def _end(_exc=None):
+    binding = g.pop("mongo_session_binding", None)
+    if binding is not None:
+        binding.__exit__(None, None, None)
+    session = g.pop("mongo_session", None)
+    if session is not None:
+        session.end_session()
+
+
+def init_app(app):
+    if not causal_reads_enabled():
+        return
+    app.before_request(_start)
+    app.after_request(_attach_token)
+    app.teardown_request(_end)
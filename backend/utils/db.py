@@ -1,32 +1,264 @@
 # utils/db.py
 """
-MongoDB connection helper.
-Exports: users_collection
+MongoDB (or embedded SQLite) connection helper.
+Exports: STORAGE_BACKEND, get_client, close_client, get_db, bind_session, causal_reads_enabled, db,
+         users, sessions, session_revocations, spent_challenges, vault_entries, rate_limits,
+         audit_logs, audit_rollups
+
+There is one MongoClient per process. It is created on first use, never at
+import, and with connect=False, so importing the app (in gunicorn's master,
+a worker or a test) costs no network round trip. A forked child drops the
+client it inherited and builds its own pool on its first query. The
+module-level collections are proxies that resolve against that client on
+every use. Indexes are not created here; run tools/migrate.py
+(utils/indexes.py) once per deploy.
+
+Reads that may go to a secondary name their endpoint class, e.g.
+users.reading("vault").find_one(...). Each class has its own read preference
+(MONGO_READ_AUTH, MONGO_READ_VAULT, MONGO_READ_STATS), such as "primary" (the
+default), "secondaryPreferred" or "nearest:120" (max staleness, seconds).
+Writes always go to the primary. While a pymongo session is bound with
+bind_session(), every call through these proxies joins it, so a causally
+consistent session sees its own earlier writes on any member
+(utils/consistency.py). A command listener counts which member served each
+read in zkp_mongo_reads_total.
+
+STORAGE_BACKEND=sqlite replaces the MongoClient with utils/sqlite_store.py,
+one WAL-mode file at SQLITE_PATH shared by the workers of a host. The same
+proxies, queries and indexes (tools/migrate.py) then run without a Mongo
+server, which suits a single-host deployment and CI. Read preferences and
+causal sessions do not apply to it.
 """
 
-from pymongo import MongoClient
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 from dotenv import load_dotenv
 import os
+import threading
+
+from utils import sqlite_store
+from utils.metrics import Counter
 
 load_dotenv()
 
-MONGO_URI = os.getenv("MONGO_URI")  
-if not MONGO_URI:
-    raise RuntimeError("MONGO_URI not set in .env")
+# "mongo" or "sqlite"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").strip().lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join("logs", "zkp.sqlite3"))
+
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DBNAME = os.getenv("MONGO_DBNAME", "zkp_demo")
+
+
+def _optional_int(name, default=None):
+    value = os.getenv(name, "").strip()
+    return int(value) if value else default
+
+
+# connections per process; a gunicorn worker rarely needs more than its thread count
+MONGO_MAX_POOL_SIZE = _optional_int("MONGO_MAX_POOL_SIZE", 20)
+MONGO_MIN_POOL_SIZE = _optional_int("MONGO_MIN_POOL_SIZE", 0)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = _optional_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+MONGO_CONNECT_TIMEOUT_MS = _optional_int("MONGO_CONNECT_TIMEOUT_MS", 5000)
+# unset = no socket timeout (pymongo default)
+MONGO_SOCKET_TIMEOUT_MS = _optional_int("MONGO_SOCKET_TIMEOUT_MS")
+# how long a request may wait for a free pooled connection
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _optional_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)
+
+_READ_MODES = {
+    "primary": Primary,
+    "primarypreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondarypreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def _read_preference(spec):
+    """"mode" or "mode:max_staleness_seconds" -> a pymongo read preference."""
+    mode, _, staleness = (spec or "primary").strip().partition(":")
+    cls = _READ_MODES.get(mode.strip().lower())
+    if cls is None:
+        raise ValueError(f"unknown read preference {spec!r}")
+    if cls is Primary:
+        return Primary()
+    return cls(max_staleness=int(staleness)) if staleness.strip() else cls()
+
+
+# endpoint class -> read preference (challenge/backup lookups, vault reads, dashboards)
+READ_PREFERENCES = {
+    "auth": _read_preference(os.getenv("MONGO_READ_AUTH", "primary")),
+    "vault": _read_preference(os.getenv("MONGO_READ_VAULT", "primary")),
+    "stats": _read_preference(os.getenv("MONGO_READ_STATS", "primary")),
+}
+
+# commands that return data; their replies are attributed to the member that served them
+READ_COMMANDS = frozenset(("find", "getMore", "aggregate", "count", "distinct"))
+# collection methods that take a session= argument
+SESSION_METHODS = frozenset((
+    "find", "find_one", "count_documents", "distinct", "aggregate",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+))
+
+reads_total = Counter("zkp_mongo_reads_total", "Read commands by the replica set member that served them.",
+                      labelnames=("member", "role"))
+
+_client = None
+_lock = threading.Lock()
+_session = ContextVar("mongo_session", default=None)
+
+
+class _ReadListener(monitoring.CommandListener):
+    """Counts each successful read per serving member (host:port) and its role at the time."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name not in READ_COMMANDS:
+            return
+        address = event.connection_id
+        role = "unknown"
+        client = _client
+        if client is not None:
+            server = client.topology_description.server_descriptions().get(address)
+            if server is not None:
+                role = server.server_type_name
+        reads_total.inc("%s:%s" % address, role)
+
+    def failed(self, event):
+        pass
+
+
+def causal_reads_enabled():
+    """True when some endpoint class may read from a secondary."""
+    return STORAGE_BACKEND == "mongo" and any(pref.mode != Primary().mode for pref in READ_PREFERENCES.values())
+
+
+@contextmanager
+def bind_session(session):
+    """Run every proxied collection call in the block inside `session`."""
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+
+
+def _forget_client():
+    # the child must not reuse sockets or monitor threads of the parent's pool
+    global _client, _lock
+    _client = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_client)
+
+
+def get_client():
+    """The process-wide MongoClient, or sqlite_store.Client (created on first call)."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None and STORAGE_BACKEND == "sqlite":
+                _client = sqlite_store.Client(SQLITE_PATH)
+            elif _client is None:
+                if STORAGE_BACKEND != "mongo":
+                    raise RuntimeError(f"unknown STORAGE_BACKEND {STORAGE_BACKEND!r} (mongo or sqlite)")
+                if not MONGO_URI:
+                    raise RuntimeError("MONGO_URI not set in .env")
+                _client = MongoClient(
+                    MONGO_URI,
+                    connect=False,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    event_listeners=[_ReadListener()],
+                )
+    return _client
+
+
+def close_client():
+    """Close this process's client, e.g. in gunicorn's master after preloading,
+    so no socket or SQLite handle is open when it forks. The next use reconnects."""
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+def get_db():
+    return get_client().get_database(MONGO_DBNAME)
+
+
+class _LazyDatabase:
+    """Stands in for the Database until it is first used."""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+class _LazyCollection:
+    """Stands in for a Collection; resolves against the current process's client."""
+
+    def __init__(self, name, read_class=None):
+        self.name = name
+        self.read_class = read_class
+        self._client = None
+        self._collection = None
+        self._readers = {}
+
+    def reading(self, read_class):
+        """This collection with the read preference of an endpoint class (see READ_PREFERENCES)."""
+        reader = self._readers.get(read_class)
+        if reader is None:
+            if read_class not in READ_PREFERENCES:
+                raise KeyError(f"unknown read class {read_class!r}")
+            reader = self._readers.setdefault(read_class, _LazyCollection(self.name, read_class))
+        return reader
+
+    def __getattr__(self, attr):
+        client = get_client()
+        if self._client is not client:
+            options = {"read_preference": READ_PREFERENCES[self.read_class]} if self.read_class else {}
+            self._collection = client.get_database(MONGO_DBNAME).get_collection(self.name, **options)
+            self._client = client
+        value = getattr(self._collection, attr)
+        session = _session.get()
+        if session is not None and attr in SESSION_METHODS:
+            return partial(value, session=session)
+        return value
 
-client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    def __repr__(self):
+        return f"<lazy collection {MONGO_DBNAME}.{self.name}>"
 
-db = client.get_database(os.getenv("MONGO_DBNAME", "zkp_demo"))
 
-users = db.get_collection("users")
-users.create_index("username", unique=True)
-# also index normalized username (lowercased, trimmed) to make lookups resilient
-try:
-    users.create_index("username_norm", unique=True)
-except Exception:
-    # if index creation fails (rare), continue - app will still work using username
-    pass
+db = _LazyDatabase()
 
+users = _LazyCollection("users")
 # Sessions collection to persist session tokens across server restarts
-sessions = db.get_collection("sessions")
-sessions.create_index("token", unique=True)
+sessions = _LazyCollection("sessions")
+# logouts broadcast here so every worker can evict the token from its cache
+session_revocations = _LazyCollection("session_revocations")
+# login challenges that opened a session, kept until they expire (see utils/sessions.py)
+spent_challenges = _LazyCollection("spent_challenges")
+# plain vault entries, one document per entry (see utils/entries.py)
+vault_entries = _LazyCollection("vault_entries")
+# sliding-window rate-limit counters (RATE_LIMIT_BACKEND=mongo, see utils/ratelimit.py)
+rate_limits = _LazyCollection("rate_limits")
+# security audit trail (see utils/logger.py)
+audit_logs = _LazyCollection("audit_logs")
+# per-minute / per-hour event counters (see utils/audit_rollups.py)
+audit_rollups = _LazyCollection("audit_rollups")
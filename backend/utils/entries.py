@@ -0,0 +1,399 @@
+"""
+Plain vault entries, one document per entry.
+Exports: SEARCH_FIELDS, SORTS, BATCH_OPS, list_entries, save_entry, delete_entry,
+         apply_batch, list_entries_async, save_entry_async, delete_entry_async,
+         apply_batch_async, migrate_embedded_entries, backfill_search_fields
+
+Documents in the `vault_entries` collection look like
+    { username_norm, id, entry, title_norm, url_norm, tags_norm, grams,
+      created_at, updated_at }
+where `entry` is the object the client sent and `id` is its id as a string.
+(username_norm, id) is unique.
+
+Only the non-secret fields named in SEARCH_FIELDS can be searched. They are
+copied, normalized, into *_norm fields: lowercased, and for URLs without
+the scheme and "www.". Prefix search is an anchored regex over the
+(username_norm, <field>_norm, _id) index. Substring search looks up the
+multikey `grams` index, which holds the field-tagged trigrams of each
+value, and then checks the candidates with a regex. Results are
+keyset-paginated on (sort key, _id). With those indexes, the cost of a
+page depends on the matches, not on how many entries a user has.
+
+apply_batch turns an ordered list of add/update/delete operations into one
+ordered bulk_write (pymongo splits it into server-sized batches).
+
+The *_async functions are the same operations for the asyncio app
+(asgi.py), through utils.adb.
+"""
+
+import base64
+import json
+import re
+import uuid
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils import adb
+from utils.db import users, vault_entries
+
+PAGE_DEFAULT = 100
+PAGE_MAX = 1000
+
+# searchable field -> (normalized document field, gram tag, entry keys it is read from)
+SEARCH_FIELDS = {
+    "title": ("title_norm", "t", ("title", "name")),
+    "url": ("url_norm", "u", ("url", "website")),
+    "tags": ("tags_norm", "g", ("tags", "category")),
+}
+# sort name -> document field ("created" is insertion order)
+SORTS = {"created": "_id", "title": "title_norm", "url": "url_norm"}
+GRAM = 3
+# longest prefix of a value that is indexed for substring search
+GRAM_SOURCE_MAX = 128
+SEARCH_VERSION = 1
+# operations accepted by apply_batch
+BATCH_OPS = ("add", "update", "delete")
+
+_URL_PREFIX = re.compile(r"^(?:[a-z][a-z0-9+.-]*://)?(?:www\.)?")
+
+
+def _norm_text(value):
+    return value.strip().lower() if isinstance(value, str) else ""
+
+
+def _norm_url(value):
+    return _URL_PREFIX.sub("", _norm_text(value))
+
+
+def _first(entry, keys):
+    for key in keys:
+        if entry.get(key) not in (None, "", []):
+            return entry[key]
+    return None
+
+
+def _grams(tag, text):
+    text = text[:GRAM_SOURCE_MAX]
+    return {f"{tag}:{text[i:i + GRAM]}" for i in range(len(text) - GRAM + 1)}
+
+
+def _search_fields(entry):
+    """The normalized search fields stored next to an entry."""
+    title = _norm_text(_first(entry, SEARCH_FIELDS["title"][2]))
+    url = _norm_url(_first(entry, SEARCH_FIELDS["url"][2]))
+    tags = _first(entry, SEARCH_FIELDS["tags"][2])
+    tags = sorted({_norm_text(t) for t in (tags if isinstance(tags, list) else [tags]) if _norm_text(t)})
+    grams = _grams("t", title) | _grams("u", url)
+    for tag in tags:
+        grams |= _grams("g", tag)
+    return {"title_norm": title, "url_norm": url, "tags_norm": tags,
+            "grams": sorted(grams), "search_v": SEARCH_VERSION}
+
+
+def _query_text(field, q):
+    return _norm_url(q) if field == "url" else _norm_text(q)
+
+
+def _match_clause(field, q, match):
+    """Filter for one field; substring matches of GRAM or more characters go through `grams`."""
+    norm_field, tag, _ = SEARCH_FIELDS[field]
+    text = _query_text(field, q)
+    if match == "contains" and len(text) >= GRAM:
+        return {"grams": {"$all": sorted(_grams(tag, text))}, norm_field: {"$regex": re.escape(text)}}
+    # prefix search (also used for substrings too short for the gram index)
+    return {norm_field: {"$regex": "^" + re.escape(text)}}
+
+
+def _encode_cursor(doc, sort_field):
+    if sort_field == "_id":
+        return str(doc["_id"])
+    raw = json.dumps([doc.get(sort_field, ""), str(doc["_id"])]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _after(cursor, sort_field, descending):
+    op = "$lt" if descending else "$gt"
+    try:
+        if sort_field == "_id":
+            return {"_id": {op: ObjectId(cursor)}}
+        value, oid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        oid = ObjectId(oid)
+    except (InvalidId, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    return {"$or": [{sort_field: {op: value}}, {sort_field: value, "_id": {op: oid}}]}
+
+
+def list_entries(username_norm, limit=PAGE_DEFAULT, cursor=None, q=None, field=None,
+                 match="prefix", sort="created", descending=False):
+    """Return (entries, next_cursor); next_cursor is None on the last page.
+
+    With `q`, only entries whose `field` (any of SEARCH_FIELDS when None)
+    starts with (match="prefix") or contains (match="contains") q are returned.
+    `sort` is one of SORTS. Raises ValueError for a bad field, match, sort or cursor.
+    """
+    query, projection, order, sort_field = _list_query(username_norm, cursor, q, field, match, sort, descending)
+    docs = list(vault_entries.reading("vault").find(query, projection).sort(order).limit(limit))
+    return _page(docs, limit, sort_field)
+
+
+def _list_query(username_norm, cursor, q, field, match, sort, descending):
+    """(query, projection, order, sort_field) of a list_entries page."""
+    if sort not in SORTS:
+        raise ValueError("Invalid sort")
+    if match not in ("prefix", "contains"):
+        raise ValueError("Invalid match")
+    if field is not None and field not in SEARCH_FIELDS:
+        raise ValueError("Invalid field")
+    sort_field = SORTS[sort]
+
+    clauses = [{"username_norm": username_norm}]
+    if q:
+        fields = [field] if field else list(SEARCH_FIELDS)
+        options = [_match_clause(f, q, match) for f in fields]
+        clauses.append(options[0] if len(options) == 1 else {"$or": options})
+    if cursor:
+        clauses.append(_after(cursor, sort_field, descending))
+    query = clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    direction = DESCENDING if descending else ASCENDING
+    order = [("_id", direction)] if sort_field == "_id" else [(sort_field, direction), ("_id", direction)]
+    projection = {"entry": 1} if sort_field == "_id" else {"entry": 1, sort_field: 1}
+    return query, projection, order, sort_field
+
+
+def _page(docs, limit, sort_field):
+    next_cursor = _encode_cursor(docs[-1], sort_field) if len(docs) == limit else None
+    return [doc["entry"] for doc in docs], next_cursor
+
+
+def _entry_write(username_norm, entry, now):
+    """(filter, update) that stores `entry` under its id for this user."""
+    return (
+        {"username_norm": username_norm, "id": str(entry["id"])},
+        {"$set": dict(_search_fields(entry), entry=entry, updated_at=now), "$setOnInsert": {"created_at": now}},
+    )
+
+
+def save_entry(username_norm, entry):
+    """Insert or replace the entry with entry["id"] for this user."""
+    vault_entries.update_one(*_entry_write(username_norm, entry, datetime.utcnow()), upsert=True)
+
+
+def delete_entry(username_norm, entry_id):
+    """Delete one entry. Returns True if it existed."""
+    return vault_entries.delete_one({"username_norm": username_norm, "id": str(entry_id)}).deleted_count > 0
+
+
+def apply_batch(username_norm, operations):
+    """Apply [(op, entry_or_id), ...] in order with a single ordered bulk_write.
+
+    "add" inserts or replaces entry["id"] (like save_entry), "update" replaces
+    an existing entry only, "delete" removes entry id. Returns one result per
+    operation: {"id", "status"} with status created, updated, deleted or
+    not_found. Statuses come from the ids present just before the write. If
+    the write fails part way, the failing operation gets status error and
+    the ones after it status skipped, since none of them were applied.
+    """
+    ids = _batch_ids(operations)
+    present = {doc["id"] for doc in vault_entries.find(_present_query(username_norm, ids), {"id": 1})}
+    requests, results = _batch_requests(username_norm, operations, ids, present)
+    if requests:
+        try:
+            vault_entries.bulk_write(requests, ordered=True)
+        except BulkWriteError as e:
+            _mark_failed(results, e)
+    return results
+
+
+def _batch_ids(operations):
+    return [str(target["id"] if op != "delete" else target) for op, target in operations]
+
+
+def _present_query(username_norm, ids):
+    return {"username_norm": username_norm, "id": {"$in": list(set(ids))}}
+
+
+def _batch_requests(username_norm, operations, ids, present):
+    """(write requests, results) of apply_batch, given the ids `present` before it."""
+    now = datetime.utcnow()
+    requests, results = [], []
+    for (op, target), entry_id in zip(operations, ids):
+        exists = entry_id in present
+        if op == "add":
+            requests.append(UpdateOne(*_entry_write(username_norm, target, now), upsert=True))
+            status = "updated" if exists else "created"
+            present.add(entry_id)
+        elif op == "update":
+            requests.append(UpdateOne(*_entry_write(username_norm, target, now), upsert=False))
+            status = "updated" if exists else "not_found"
+        else:
+            requests.append(DeleteOne({"username_norm": username_norm, "id": entry_id}))
+            status = "deleted" if exists else "not_found"
+            present.discard(entry_id)
+        results.append({"id": entry_id, "status": status})
+    return requests, results
+
+
+def _mark_failed(results, error):
+    failed = error.details["writeErrors"][0]
+    results[failed["index"]].update(status="error", message=failed.get("errmsg", "Write failed"))
+    for result in results[failed["index"] + 1:]:
+        result["status"] = "skipped"
+
+
+async def list_entries_async(username_norm, limit=PAGE_DEFAULT, cursor=None, q=None, field=None,
+                             match="prefix", sort="created", descending=False):
+    """list_entries for the asyncio app (always from the primary)."""
+    query, projection, order, sort_field = _list_query(username_norm, cursor, q, field, match, sort, descending)
+    docs = await adb.vault_entries.find(query, projection).sort(order).limit(limit).to_list()
+    return _page(docs, limit, sort_field)
+
+
+async def save_entry_async(username_norm, entry):
+    await adb.vault_entries.update_one(*_entry_write(username_norm, entry, datetime.utcnow()), upsert=True)
+
+
+async def delete_entry_async(username_norm, entry_id):
+    result = await adb.vault_entries.delete_one({"username_norm": username_norm, "id": str(entry_id)})
+    return result.deleted_count > 0
+
+
+async def apply_batch_async(username_norm, operations):
+    """apply_batch for the asyncio app."""
+    ids = _batch_ids(operations)
+    present = {doc["id"] for doc in await adb.vault_entries.find(_present_query(username_norm, ids), {"id": 1}).to_list()}
+    requests, results = _batch_requests(username_norm, operations, ids, present)
+    if requests:
+        try:
+            await adb.vault_entries.bulk_write(requests, ordered=True)
+        except BulkWriteError as e:
+            _mark_failed(results, e)
+    return results
+
+
+def _entry_ops(username_norm, entries):
+    now = datetime.utcnow()
+    for entry_id, entry in entries:
+        created = entry.get("created_at")
+        yield UpdateOne(
+            {"username_norm": username_norm, "id": entry_id},
+            # $setOnInsert keeps re-runs idempotent and never clobbers newer writes
+            {"$setOnInsert": dict(
+                _search_fields(entry),
+                entry=entry,
+                created_at=created if isinstance(created, datetime) else now,
+                updated_at=now,
+            )},
+            upsert=True,
+        )
+
+
+def _migration_id(username_norm, index, entry):
+    """Stable id for an embedded entry without a usable one, so a re-run picks the same."""
+    raw = json.dumps([username_norm, index, entry], sort_keys=True, default=str)
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "vault-entry:" + raw))
+
+
+def _embedded_entries(user, username_norm, stats, log):
+    """({id: entry} to write, whether every item of the array is in it)."""
+    prepared = {}
+    complete = True
+    for index, entry in enumerate(user.get("plain_entries") or []):
+        if not isinstance(entry, dict):
+            log(f"user {user['_id']}: plain_entries[{index}] is not an object; keeping the array")
+            stats["not_migrated"] += 1
+            complete = False
+            continue
+        entry_id = entry.get("id")
+        key = None if entry_id in (None, "") else str(entry_id)
+        if key in prepared:
+            if prepared[key] == entry:
+                stats["duplicates"] += 1
+                continue
+            # same id, different content: keep both
+            key = None
+        if key is None:
+            key = _migration_id(username_norm, index, entry)
+            entry = dict(entry, id=key)
+            stats["new_ids"] += 1
+        prepared[key] = entry
+    return prepared, complete
+
+
+def migrate_embedded_entries(batch_size=1000, log=print):
+    """Move users.plain_entries arrays into vault_entries, then unset them.
+
+    Entries without an id get a new one, derived from the user, position and
+    content. So do entries whose id an earlier, different entry of the same
+    array already uses. Exact copies are written once. A user's array is
+    unset only once every entry in it is found in vault_entries; arrays
+    holding non-objects, or whose writes failed, are kept and reported. Safe
+    to re-run. Returns counts: users (arrays unset), kept (arrays left in
+    place), written, new_ids, duplicates, not_migrated.
+    """
+    stats = dict.fromkeys(("users", "kept", "written", "new_ids", "duplicates", "not_migrated"), 0)
+    ops = []
+    pending_users = []  # (user _id, username_norm, ids written for it)
+
+    def _flush():
+        if ops:
+            try:
+                stats["written"] += vault_entries.bulk_write(ops, ordered=False).upserted_count
+            except BulkWriteError as e:
+                stats["written"] += e.details.get("nUpserted", 0)
+                errors = e.details["writeErrors"]
+                log(f"{len(errors)} entries not written, e.g. {errors[0].get('errmsg')}")
+            ops.clear()
+        done = []
+        for user_id, username_norm, ids in pending_users:
+            if vault_entries.count_documents({"username_norm": username_norm, "id": {"$in": ids}}) == len(ids):
+                done.append(user_id)
+            else:
+                log(f"user {user_id}: not every entry was written; keeping the array")
+                stats["kept"] += 1
+        if done:
+            users.update_many({"_id": {"$in": done}}, {"$unset": {"plain_entries": ""}})
+            stats["users"] += len(done)
+        pending_users.clear()
+
+    cursor = users.find(
+        {"plain_entries": {"$exists": True}},
+        {"username": 1, "username_norm": 1, "plain_entries": 1},
+    ).batch_size(100)
+    for user in cursor:
+        username_norm = user.get("username_norm") or (user.get("username") or "").strip().lower()
+        if not username_norm:
+            log(f"skipping user {user['_id']}: no username")
+            stats["kept"] += 1
+            continue
+        entries, complete = _embedded_entries(user, username_norm, stats, log)
+        ops.extend(_entry_ops(username_norm, entries.items()))
+        if complete:
+            pending_users.append((user["_id"], username_norm, list(entries)))
+        else:
+            stats["kept"] += 1
+        if len(ops) >= batch_size:
+            _flush()
+    _flush()
+    return stats
+
+
+def backfill_search_fields(batch_size=1000, log=print):
+    """(Re)build the search fields of entries written before search existed, or by an
+    older SEARCH_VERSION. Safe to re-run; returns the number of entries updated."""
+    updated = 0
+    ops = []
+    cursor = vault_entries.find({"search_v": {"$ne": SEARCH_VERSION}}, {"entry": 1}).batch_size(batch_size)
+    for doc in cursor:
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": _search_fields(doc.get("entry") or {})}))
+        if len(ops) >= batch_size:
+            updated += vault_entries.bulk_write(ops, ordered=False).modified_count
+            ops = []
+            log(f"vault_entries: {updated} entries indexed for search")
+    if ops:
+        updated += vault_entries.bulk_write(ops, ordered=False).modified_count
+    return updated
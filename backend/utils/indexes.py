@@ -0,0 +1,70 @@
+"""
+Index and schema maintenance, run once per deploy (tools/migrate.py), not on worker start.
+Exports: INDEXES, ensure_indexes
+
+create_index is a no-op for an index that already exists with the same
+options, so ensure_indexes is safe to run on every deploy.
+"""
+
+from datetime import datetime
+
+from utils import audit_query
+from utils.db import get_db
+
+# collection -> [(keys, options)]
+INDEXES = {
+    "users": [
+        ("username", {"unique": True}),
+        # normalized username (lowercased, trimmed); every lookup goes through it
+        ("username_norm", {"unique": True}),
+    ],
+    "sessions": [
+        ("token", {"unique": True}),
+        # Mongo deletes a session once its expires_at passes (idle or absolute limit)
+        ("expires_at", {"expireAfterSeconds": 0}),
+    ],
+    # _id is the challenge key: a login challenge opens at most one session,
+    # whichever worker verifies it, and logging out does not free it again
+    "spent_challenges": [
+        ("expires_at", {"expireAfterSeconds": 0}),
+    ],
+    "session_revocations": [
+        ("revoked_at", {}),
+        ("expires_at", {"expireAfterSeconds": 0}),
+    ],
+    "vault_entries": [
+        ([("username_norm", 1), ("id", 1)], {"unique": True}),
+        ([("username_norm", 1), ("_id", 1)], {}),
+        # entry search (utils/entries.py): prefix and sort per field, substring via trigrams
+        ([("username_norm", 1), ("title_norm", 1), ("_id", 1)], {}),
+        ([("username_norm", 1), ("url_norm", 1), ("_id", 1)], {}),
+        ([("username_norm", 1), ("tags_norm", 1), ("_id", 1)], {}),
+        ([("username_norm", 1), ("grams", 1)], {}),
+    ],
+    "rate_limits": [
+        ("expires_at", {"expireAfterSeconds": 0}),
+    ],
+    # time-range, per-user and per-event-type scans behind tools/audit_query.py
+    "audit_logs": [(keys, {}) for keys in audit_query.AUDIT_INDEXES],
+    "audit_rollups": [
+        # series(): one granularity, user (None = everyone) and time range
+        ([("g", 1), ("u", 1), ("t", 1), ("e", 1)], {}),
+        # minute buckets carry expires_at; hour buckets have none and are kept
+        ("expires_at", {"expireAfterSeconds": 0}),
+    ],
+}
+
+
+def ensure_indexes(db=None, log=print):
+    """Create every index in INDEXES and end sessions that predate expiry."""
+    db = db if db is not None else get_db()
+    for name, specs in INDEXES.items():
+        collection = db.get_collection(name)
+        for keys, options in specs:
+            created = collection.create_index(keys, **options)
+            log(f"{name}: {created}")
+
+    # sessions created before expiry existed have no expires_at; end them so the TTL index reaps them
+    ended = db.sessions.update_many({"expires_at": {"$exists": False}}, {"$set": {"expires_at": datetime.utcnow()}})
+    if ended.modified_count:
+        log(f"sessions: expired {ended.modified_count} legacy sessions")
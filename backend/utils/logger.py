@@ -1,42 +1,245 @@
+"""
+Security audit log.
+Exports: log_event, flush, shutdown
+
+log_event() never waits on I/O. Entries go onto a bounded in-process queue.
+A background thread drains it and writes each batch to logs/audit.log and,
+with one insert_many, to the Mongo `audit_logs` collection (through the
+shared client in utils/db.py). A batch is flushed when it reaches
+AUDIT_BATCH_SIZE entries or after AUDIT_FLUSH_INTERVAL seconds.
+
+When the queue is full, AUDIT_OVERFLOW decides what happens:
+  drop  - discard the entry (counted in zkp_audit_dropped_total)
+  block - wait up to AUDIT_BLOCK_TIMEOUT seconds for room, then drop
+  spill - append the entry to logs/audit_spill.ndjson (re-importable with mongoimport)
+Batches that Mongo rejects are spilled the same way. Pending entries are
+flushed at interpreter exit. Each batch also updates the per-minute and
+per-hour counters in utils/audit_rollups.py, spilled events included.
+
+Every gunicorn worker appends to the same two files, so the app never
+rotates them itself: a size-based rollover in one worker would rename the
+file under the others and lose their lines. Both use WatchedFileHandler,
+which reopens the path once it has been moved, so rotate audit.log with
+logrotate (without copytruncate), e.g.
+
+  /srv/zkp/backend/logs/audit.log {
+    daily
+    rotate 14
+    compress
+    delaycompress
+    missingok
+    notifempty
+  }
+
+The spill file holds events that are in no other store. Nothing deletes it:
+import it (mongoimport --collection audit_logs --file audit_spill.ndjson)
+and then move or remove it by hand.
+"""
+
+import atexit
 import logging
-from datetime import datetime
-from pymongo import MongoClient
 import os
+import queue
+import threading
+import time
+from datetime import datetime
+from logging.handlers import WatchedFileHandler
+
+from bson import json_util
 from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError
+
+from utils import audit_rollups
+from utils.db import audit_logs as audit_collection
+from utils.metrics import Counter, Gauge
 
 load_dotenv()
 
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "spill").strip().lower()
+AUDIT_BLOCK_TIMEOUT = float(os.getenv("AUDIT_BLOCK_TIMEOUT", "0.05"))
+
 # Setup Python logger
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOG_DIR, "audit.log")
+SPILL_FILE = os.path.join(LOG_DIR, "audit_spill.ndjson")
 
 logging.basicConfig(
-    filename=LOG_FILE,
     level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[WatchedFileHandler(LOG_FILE)],
 )
 
-# Optional: Log to MongoDB for persistent audit
-mongo_uri = os.getenv("MONGO_URI")
-client = MongoClient(mongo_uri)
-db = client["zkp_demo"]
-audit_collection = db["audit_logs"]
+_spill_logger = logging.getLogger("zkp.audit.spill")
+_spill_logger.propagate = False
+_spill_logger.setLevel(logging.INFO)
+_spill_logger.addHandler(WatchedFileHandler(SPILL_FILE))
+
+enqueued_total = Counter("zkp_audit_enqueued_total", "Audit events accepted onto the queue.")
+dropped_total = Counter("zkp_audit_dropped_total", "Audit events discarded because the queue was full.")
+spilled_total = Counter("zkp_audit_spilled_total", "Audit events written to the spill file instead of Mongo.")
+written_total = Counter("zkp_audit_written_total", "Audit events inserted into Mongo.")
+flush_errors_total = Counter("zkp_audit_flush_errors_total", "Failed insert_many calls.")
+rollup_errors_total = Counter("zkp_audit_rollup_errors_total", "Batches whose rollup counters could not be updated.")
+
+
+class AuditPipeline:
+    """Bounded queue plus one writer thread, per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def _ensure_started(self):
+        # (re)start after fork: threads do not survive into a gunicorn worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+            self._stopping = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+
+    def submit(self, entry):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+            enqueued_total.inc()
+            return
+        except queue.Full:
+            pass
+
+        if AUDIT_OVERFLOW == "block":
+            try:
+                self._queue.put(entry, timeout=AUDIT_BLOCK_TIMEOUT)
+                enqueued_total.inc()
+                return
+            except queue.Full:
+                pass
+        elif AUDIT_OVERFLOW == "spill":
+            _spill([entry])
+            return
+        dropped_total.inc()
+
+    def _drain(self, first):
+        batch = [first]
+        deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL
+        while len(batch) < AUDIT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # take whatever else is already waiting without blocking
+        while len(batch) < AUDIT_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        q = self._queue
+        while True:
+            try:
+                first = q.get(timeout=AUDIT_FLUSH_INTERVAL)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            batch = self._drain(first)
+            _write(batch)
+            for _ in batch:
+                q.task_done()
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far has been written (best effort)."""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def shutdown(self, timeout=5.0):
+        if self._queue is None or self._pid != os.getpid():
+            return
+        self.flush(timeout)
+        self._stopping.set()
+
+
+def _spill(entries):
+    for entry in entries:
+        # extended JSON keeps the timestamp a date when re-imported with mongoimport
+        _spill_logger.info(json_util.dumps(entry))
+    spilled_total.inc(amount=len(entries))
+
+
+def _write(batch):
+    # Log to file
+    for entry in batch:
+        logging.info(f"[{entry['event_type']}] user={entry['username']}, details={entry['details']}")
+
+    # counters first: insert_many may spill part of the batch, but every event is counted once
+    try:
+        audit_rollups.apply(batch)
+    except Exception:
+        rollup_errors_total.inc()
+
+    # log to MongoDB too
+    try:
+        audit_collection.insert_many(batch, ordered=False)
+        written_total.inc(amount=len(batch))
+        return
+    except BulkWriteError as e:
+        # unordered: everything except the reported documents made it in
+        failed = {err["index"] for err in e.details.get("writeErrors", [])}
+        written_total.inc(amount=e.details.get("nInserted", 0))
+        batch = [entry for i, entry in enumerate(batch) if i in failed]
+    except Exception:
+        pass
+    flush_errors_total.inc()
+    for entry in batch:
+        entry.pop("_id", None)
+    _spill(batch)
+
+
+_pipeline = AuditPipeline()
+Gauge("zkp_audit_queue_depth", "Audit events waiting to be written.", func=_pipeline.depth)
+atexit.register(_pipeline.shutdown)
+
 
 def log_event(event_type, username=None, details=None):
     """
-    Logs security events both to file and MongoDB
+    Logs security events both to file and MongoDB (asynchronously, see module docstring)
     """
     entry = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "event_type": event_type,  
+        "timestamp": datetime.utcnow(),
+        "event_type": event_type,
         "username": username,
         "details": details,
     }
+    _pipeline.submit(entry)
 
-    # Log to file
-    log_text = f"[{event_type}] user={username}, details={details}"
-    logging.info(log_text)
 
-    # log to MongoDB too
-    audit_collection.insert_one(entry)
\ No newline at end of file
+def flush(timeout=5.0):
+    """Block until queued audit events are written (used by tools and tests)."""
+    _pipeline.flush(timeout)
+
+
+def shutdown(timeout=5.0):
+    """Flush pending events and stop the writer thread."""
+    _pipeline.shutdown(timeout)
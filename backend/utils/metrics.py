@@ -0,0 +1,232 @@
+"""
+In-process metrics for the hot request paths.
+Exports: start_trace, Histogram, Counter, Gauge, render_prometheus
+
+Each gunicorn worker keeps its own registry, so a scrape of /metrics reports
+the worker that happened to serve it. Tracing is sampled: set
+METRICS_SAMPLE_RATE to a value between 0 and 1 (0 disables it). Unsampled
+requests get a shared no-op trace, so the disabled path costs one check.
+"""
+
+import bisect
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    METRICS_SAMPLE_RATE = min(max(float(os.getenv("METRICS_SAMPLE_RATE", "1.0")), 0.0), 1.0)
+except ValueError:
+    METRICS_SAMPLE_RATE = 1.0
+
+# seconds; tuned for stages that range from a dict lookup to a Mongo round trip
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Gauge:
+    """Point-in-time value. Pass `func` to read it lazily at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, func=None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = ()
+        self._value = 0
+        self._func = func
+        _register(self)
+
+    def set(self, value):
+        self._value = value
+
+    def value(self):
+        return self._func() if self._func else self._value
+
+    def samples(self):
+        yield self.name, "", self.value()
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def observe(self, value, *labels):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # one slot per bucket plus the +Inf overflow slot, then sum and count
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self, *labels):
+        """Return (count, sum) for one label combination."""
+        series = self._series.get(labels)
+        if series is None:
+            return 0, 0.0
+        return series[-1], series[-2]
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            running = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), series):
+                running += hits
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket", _format_labels(self.labelnames, labels, ("le", le)), running
+            yield self.name + "_sum", _format_labels(self.labelnames, labels), series[-2]
+            yield self.name + "_count", _format_labels(self.labelnames, labels), series[-1]
+
+
+stage_seconds = Histogram(
+    "zkp_stage_seconds",
+    "Wall time spent in each stage of a traced request.",
+    labelnames=("op", "stage"),
+)
+request_seconds = Histogram(
+    "zkp_request_seconds",
+    "Total wall time of traced requests.",
+    labelnames=("op", "outcome"),
+)
+
+
+class _Stage:
+    __slots__ = ("op", "name", "started")
+
+    def __init__(self, op, name):
+        self.op = op
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stage_seconds.observe(time.perf_counter() - self.started, self.op, self.name)
+        return False
+
+
+class Trace:
+    """Times the stages of a single sampled request."""
+
+    __slots__ = ("op", "started")
+
+    def __init__(self, op):
+        self.op = op
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        return _Stage(self.op, name)
+
+    def finish(self, outcome="ok"):
+        request_seconds.observe(time.perf_counter() - self.started, self.op, outcome)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _NullTrace:
+    __slots__ = ()
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def finish(self, outcome="ok"):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+_NULL_TRACE = _NullTrace()
+
+
+def start_trace(op):
+    """Return a Trace for `op` if this request is sampled, else a shared no-op."""
+    if METRICS_SAMPLE_RATE <= 0.0:
+        return _NULL_TRACE
+    if METRICS_SAMPLE_RATE < 1.0 and random.random() >= METRICS_SAMPLE_RATE:
+        return _NULL_TRACE
+    return Trace(op)
+
+
+def render_prometheus():
+    """Render every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append("# HELP %s %s" % (metric.name, metric.help_text))
+        lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+        for name, labels, value in metric.samples():
+            lines.append("%s%s %s" % (name, labels, value))
+    return "\n".join(lines) + "\n"
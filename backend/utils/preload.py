@@ -0,0 +1,67 @@
+"""
+Start-up work for gunicorn's preload mode (GUNICORN_PRELOAD=true, see gunicorn.conf.py).
+Exports: PRELOAD_WARM_USERS, active_usernames, warm, start_worker
+
+With preload, the master imports the app once and forks every worker from
+it, so what the master builds first is shared copy-on-write instead of being
+rebuilt per worker. warm() runs in the master before the fork. It builds the
+secp256k1 comb table and, with PRELOAD_WARM_USERS > 0, decodes the public
+keys of that many recently active users (latest sessions) into the user
+cache. Then it closes the master's database client and calls gc.freeze(), so
+the workers' garbage collector never writes to those objects and unshares
+their pages.
+
+start_worker() runs in each worker once it has forked. It starts the
+verification pool, so the first login does not pay for starting it. Pool
+processes are spawned, not forked, and build their own small comb table.
+"""
+
+import gc
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+from utils import secp256k1, user_repo, verify_pool
+from utils.db import close_client, sessions
+
+load_dotenv()
+
+PRELOAD_WARM_USERS = int(os.getenv("PRELOAD_WARM_USERS", "0"))
+
+
+def active_usernames(limit):
+    """Up to `limit` distinct users with the most recently active sessions."""
+    names = {}
+    # an active session's expires_at moves forward as it is used
+    for doc in sessions.find({}, {"_id": 0, "username": 1}).sort("expires_at", -1).limit(limit * 10):
+        name = user_repo.normalize(doc.get("username"))
+        if name:
+            names.setdefault(name, None)
+            if len(names) >= limit:
+                break
+    return list(names)
+
+
+def warm(warm_users=PRELOAD_WARM_USERS, log=logging.info):
+    """Build the shared read-only state in the master, then freeze the heap."""
+    started = time.perf_counter()
+    secp256k1.comb_table()
+    if warm_users > 0:
+        try:
+            loaded = user_repo.warm(active_usernames(warm_users))
+            log(f"preload: decoded {loaded} public keys")
+        except Exception:
+            # a cold cache only costs the first logins a lookup each
+            logging.warning("preload: could not warm the user cache", exc_info=True)
+        finally:
+            close_client()
+    gc.collect()
+    gc.freeze()
+    log(f"preload: master ready in {time.perf_counter() - started:.2f}s, {gc.get_freeze_count()} objects frozen")
+
+
+def start_worker():
+    """Per-worker start-up after the fork."""
+    verify_pool.start()
@@ -0,0 +1,189 @@
+"""
+Request rate limiting for the unauthenticated auth endpoints.
+Exports: Limit, RateLimiter, MemoryBackend, MongoBackend, SQLiteBackend, limiter
+
+Limits are sliding-window counters. For a window of W seconds, a key's rate
+is estimated from the current window's count plus the previous window's
+count, weighted by the share of W that still overlaps the sliding window.
+That needs two integers per key, whatever the traffic, and is never more
+than one window's worth away from an exact sliding log.
+
+Backends store the counters (RATE_LIMIT_BACKEND):
+  memory - per-process LRU of at most RATE_LIMIT_MAX_KEYS keys (one worker)
+  mongo  - `rate_limits` collection with a TTL index, shared by all workers
+  sqlite - WAL-mode file at RATE_LIMIT_SQLITE_PATH, shared by the workers of one host
+If a backend fails, the check is allowed rather than locking every user out.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+
+from utils.db import rate_limits
+from utils.metrics import Counter
+
+load_dotenv()
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").strip().lower()
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", os.path.join("logs", "ratelimit.sqlite3"))
+
+checked_total = Counter("zkp_ratelimit_checked_total", "Rate-limit checks.", labelnames=("scope",))
+rejected_total = Counter("zkp_ratelimit_rejected_total", "Requests rejected by a rate limit.", labelnames=("scope",))
+errors_total = Counter("zkp_ratelimit_errors_total", "Rate-limit backend failures (request allowed).")
+
+
+class Limit:
+    """At most `count` hits per `period` seconds for one scope (e.g. "ip")."""
+
+    def __init__(self, scope, count, period):
+        self.scope = scope
+        self.count = int(count)
+        self.period = float(period)
+
+    @classmethod
+    def parse(cls, scope, spec):
+        """Parse "count/seconds" (e.g. "20/60"). Returns None for "" or "0" (disabled)."""
+        spec = (spec or "").strip()
+        if not spec or spec == "0":
+            return None
+        count, _, period = spec.partition("/")
+        return cls(scope, count, period or 60)
+
+
+class MemoryBackend:
+    """Counters in a size-bounded per-process LRU."""
+
+    def __init__(self, maxsize=RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> [window, previous, current]
+        self._lock = threading.Lock()
+
+    def hit(self, key, window, period, amount=1):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < window - 1:
+                entry = [window, 0, 0]
+            elif entry[0] == window - 1:
+                entry = [window, entry[2], 0]
+            entry[2] += amount
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return entry[1], entry[2]
+
+
+class MongoBackend:
+    """One document per key and window; expired windows are removed by a TTL index."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def hit(self, key, window, period, amount=1):
+        doc = self.collection.find_one_and_update(
+            {"_id": f"{key}:{window}"},
+            {"$inc": {"n": amount},
+             "$setOnInsert": {"expires_at": datetime.utcnow() + timedelta(seconds=2 * period)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        previous = self.collection.find_one({"_id": f"{key}:{window - 1}"}, {"n": 1})
+        return (previous or {}).get("n", 0), doc["n"]
+
+
+class SQLiteBackend:
+    """Counters in a local SQLite file (WAL), shared by the processes of one host."""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path=RATE_LIMIT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._hits = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            " key TEXT NOT NULL, win INTEGER NOT NULL, n INTEGER NOT NULL, expires REAL NOT NULL,"
+            " PRIMARY KEY (key, win)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS rate_limits_expires ON rate_limits (expires)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        # connections must not cross a fork either
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def hit(self, key, window, period, amount=1):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO rate_limits (key, win, n, expires) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key, win) DO UPDATE SET n = n + excluded.n",
+                (key, window, amount, now + 2 * period),
+            )
+            counts = dict(conn.execute(
+                "SELECT win, n FROM rate_limits WHERE key = ? AND win IN (?, ?)",
+                (key, window - 1, window),
+            ).fetchall())
+            self._hits += 1
+            if self._hits % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM rate_limits WHERE expires < ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return counts.get(window - 1, 0), counts.get(window, 0)
+
+
+class RateLimiter:
+    """Checks hits against a set of Limits, keyed by scope and identity."""
+
+    def __init__(self, backend, clock=time.time):
+        self.backend = backend
+        self._clock = clock
+
+    def hit(self, limit, identity, amount=1):
+        """Count a hit. Returns 0 if allowed, else seconds until the client may retry."""
+        if limit is None or not identity:
+            return 0
+        checked_total.inc(limit.scope)
+        now = self._clock()
+        window = int(now // limit.period)
+        elapsed = now - window * limit.period
+        try:
+            previous, current = self.backend.hit(f"{limit.scope}:{identity}", window, limit.period, amount)
+        except Exception:
+            errors_total.inc()
+            return 0
+        estimate = previous * (limit.period - elapsed) / limit.period + current
+        if estimate <= limit.count:
+            return 0
+        rejected_total.inc(limit.scope)
+        return max(1, math.ceil(limit.period - elapsed))
+
+
+def _default_backend():
+    if RATE_LIMIT_BACKEND == "mongo":
+        return MongoBackend(rate_limits)
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteBackend()
+    return MemoryBackend()
+
+
+limiter = RateLimiter(_default_backend())
@@ -0,0 +1,327 @@
+"""
+Fast secp256k1 arithmetic for Schnorr verification.
+Exports: decode_point, encode_point, mul_base, verify, multi_verify, comb_table
+
+Points are affine (x, y) tuples; None is the point at infinity. Internally
+everything runs on plain Python ints in Jacobian coordinates: lookup tables
+are normalised with one shared inversion (Montgomery's trick), the main loop
+uses mixed additions only, and the result is compared with R projectively,
+without a final inversion.
+
+verify() computes s*G - e*Y in a single interleaved pass (Shamir's trick):
+the Y part is split with the GLV endomorphism into two ~128-bit width-5
+wNAF expansions over one shared chain of doublings, and the G part folds a
+fixed-base comb table (8 teeth, 32 columns) into the last 32 steps of that
+same chain. The comb table is built once per process on first use.
+"""
+
+import threading
+
+P = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+B = 7
+G = (
+    0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+    0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8,
+)
+
+# GLV endomorphism: lambda*(x, y) == (beta*x, y), which splits a 256-bit
+# scalar into two ~128-bit halves and halves the doubling chain.
+LAMBDA = 0x5363AD4CC05C30E0A5261C028812645A122E22EA20816678DF02967C1B23BD72
+BETA = 0x7AE96A2B657C07106E64479EAC3434E99CF0497512F58995C1396C28719501EE
+_GLV_A1 = 0x3086D221A7D46BCDE86C90E49284EB15
+_GLV_B1 = -0xE4437ED6010E88286F547FA90ABFE4C3
+_GLV_A2 = 0x114CA50F7A8E2F3F657C1108D9D44CFD8
+_GLV_B2 = _GLV_A1
+
+WNAF_WIDTH = 5
+COMB_TEETH = 8
+COMB_COLUMNS = (256 + COMB_TEETH - 1) // COMB_TEETH
+
+_INF = (1, 1, 0)  # Jacobian point at infinity (Z == 0)
+
+
+# --- encoding ---------------------------------------------------------------
+
+def decode_point(raw):
+    """Decode a SEC1 compressed (33 bytes), uncompressed/hybrid (65 bytes) or
+    raw (64 bytes) point into an affine (x, y) tuple, accepting the same
+    encodings as ecdsa's VerifyingKey.from_string. Raises ValueError if the
+    point is not on the curve.
+    """
+    if len(raw) == 33 and raw[0] in (2, 3):
+        x = int.from_bytes(raw[1:], "big")
+        if x >= P:
+            raise ValueError("Point x coordinate out of range")
+        y2 = (pow(x, 3, P) + B) % P
+        y = pow(y2, (P + 1) // 4, P)
+        if y * y % P != y2:
+            raise ValueError("Encoding does not correspond to a point on curve")
+        if (y & 1) != (raw[0] & 1):
+            y = P - y
+        return x, y
+    prefix = None
+    if len(raw) == 65 and raw[0] in (4, 6, 7):
+        prefix, raw = raw[0], raw[1:]
+    if len(raw) == 64:
+        x = int.from_bytes(raw[:32], "big")
+        y = int.from_bytes(raw[32:], "big")
+        if x >= P or y >= P or (y * y - pow(x, 3, P) - B) % P:
+            raise ValueError("Encoding does not correspond to a point on curve")
+        # hybrid encodings (0x06/0x07) also carry the parity of y
+        if prefix in (6, 7) and (y & 1) != (prefix & 1):
+            raise ValueError("Inconsistent hybrid point encoding")
+        return x, y
+    raise ValueError("Invalid point encoding length")
+
+
+def encode_point(point):
+    """SEC1 compressed encoding of an affine point."""
+    x, y = point
+    return bytes([2 | (y & 1)]) + x.to_bytes(32, "big")
+
+
+# --- Jacobian arithmetic (a = 0) --------------------------------------------
+
+def _double(X, Y, Z):
+    if not Z or not Y:
+        return _INF
+    YY = Y * Y % P
+    S = 4 * X * YY % P
+    M = 3 * X * X % P
+    X3 = (M * M - 2 * S) % P
+    return X3, (M * (S - X3) - 8 * YY * YY) % P, 2 * Y * Z % P
+
+
+def _add_affine(X1, Y1, Z1, x2, y2):
+    """Jacobian + affine (mixed addition)."""
+    if not Z1:
+        return x2, y2, 1
+    ZZ = Z1 * Z1 % P
+    H = (x2 * ZZ - X1) % P
+    R = (y2 * ZZ * Z1 - Y1) % P
+    if not H:
+        if not R:
+            return _double(X1, Y1, Z1)
+        return _INF
+    HH = H * H % P
+    HHH = H * HH % P
+    V = X1 * HH % P
+    X3 = (R * R - HHH - 2 * V) % P
+    return X3, (R * (V - X3) - Y1 * HHH) % P, Z1 * H % P
+
+
+def _to_affine_many(points):
+    """Normalise Jacobian points to affine with one shared inversion (Montgomery's trick)."""
+    prefix = []
+    acc = 1
+    for _, _, Z in points:
+        prefix.append(acc)
+        acc = acc * Z % P
+    inv = pow(acc, -1, P)
+    out = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        X, Y, Z = points[i]
+        zinv = inv * prefix[i] % P
+        inv = inv * Z % P
+        zz = zinv * zinv % P
+        out[i] = (X * zz % P, Y * zz * zinv % P)
+    return out
+
+
+def _wnaf(k, width=WNAF_WIDTH):
+    """Width-w non-adjacent form of k, least significant digit first."""
+    digits = []
+    half = 1 << (width - 1)
+    full = 1 << width
+    while k:
+        if k & 1:
+            d = k & (full - 1)
+            if d >= half:
+                d -= full
+            k -= d
+        else:
+            d = 0
+        digits.append(d)
+        k >>= 1
+    return digits
+
+
+def _split_scalar(k):
+    """Return (k1, k2) with k == k1 + k2*LAMBDA (mod N) and |k1|, |k2| < 2^129."""
+    c1 = (_GLV_B2 * k + N // 2) // N
+    c2 = (-_GLV_B1 * k + N // 2) // N
+    return k - c1 * _GLV_A1 - c2 * _GLV_A2, -c1 * _GLV_B1 - c2 * _GLV_B2
+
+
+def _odd_multiples_jacobian(point, twice, width=WNAF_WIDTH):
+    """[P, 3P, ..., (2^(w-1) - 1)P] in Jacobian form, given 2P in affine form."""
+    x, y = point
+    table = [(x, y, 1)]
+    for _ in range((1 << (width - 2)) - 1):
+        table.append(_add_affine(*table[-1], *twice))
+    return table
+
+
+def _signed_tables(affine_multiples, negate=False, endo=False):
+    """Lookup tables (positive digits, negative digits) from [P, 3P, ...].
+    `negate` flips the base point; `endo` maps it through the endomorphism.
+    """
+    if endo:
+        affine_multiples = [(BETA * x % P, y) for x, y in affine_multiples]
+    negated = [(x, P - y) for x, y in affine_multiples]
+    return (negated, affine_multiples) if negate else (affine_multiples, negated)
+
+
+# --- fixed-base comb for G --------------------------------------------------
+
+_comb = None
+_comb_lock = threading.Lock()
+
+
+def comb_table():
+    """Return the comb table for G, building it on first use.
+
+    Entry k (1 <= k < 2^teeth) is sum over set bits t of k of 2^(t*columns) * G,
+    so a 256-bit scalar becomes 32 table additions with no doublings of its own.
+    """
+    global _comb
+    if _comb is None:
+        with _comb_lock:
+            if _comb is None:
+                _comb = _build_comb()
+    return _comb
+
+
+def _build_comb():
+    teeth = [G]
+    for _ in range(COMB_TEETH - 1):
+        X, Y, Z = teeth[-1][0], teeth[-1][1], 1
+        for _ in range(COMB_COLUMNS):
+            X, Y, Z = _double(X, Y, Z)
+        teeth.append(_to_affine_many([(X, Y, Z)])[0])
+
+    table = [None] * (1 << COMB_TEETH)
+    table[1] = G
+    for t in range(1, COMB_TEETH):
+        high = 1 << t
+        table[high] = teeth[t]
+        fresh = [_add_affine(*table[low], 1, *teeth[t]) for low in range(1, high)]
+        table[high + 1:2 * high] = _to_affine_many(fresh)
+    return table
+
+
+def _comb_columns(k):
+    """Column indices of k for the comb table, most significant column first."""
+    cols = []
+    for j in range(COMB_COLUMNS - 1, -1, -1):
+        idx = 0
+        for t in range(COMB_TEETH - 1, -1, -1):
+            idx = (idx << 1) | ((k >> (t * COMB_COLUMNS + j)) & 1)
+        cols.append(idx)
+    return cols
+
+
+def mul_base(k):
+    """k*G as an affine point (None for infinity), using only the comb table."""
+    k %= N
+    table = comb_table()
+    acc = _INF
+    for idx in _comb_columns(k):
+        acc = _double(*acc)
+        if idx:
+            acc = _add_affine(*acc, *table[idx])
+    if not acc[2]:
+        return None
+    return _to_affine_many([acc])[0]
+
+
+# --- verification -----------------------------------------------------------
+
+def _linear_combination(base_scalar, terms):
+    """base_scalar*G + sum k_i*P_i in Jacobian form.
+
+    terms are (k, affine point) pairs. Every term shares one ~128-step
+    doubling chain; the G contribution rides along the last COMB_COLUMNS doublings.
+    """
+    comb = comb_table()
+    live = [(k % N, point) for k, point in terms if point is not None and k % N]
+    doubles = _to_affine_many([_double(x, y, 1) for _, (x, y) in live]) if live else []
+    jacobian = []
+    for (_, point), twice in zip(live, doubles):
+        jacobian.extend(_odd_multiples_jacobian(point, twice))
+    affine = _to_affine_many(jacobian) if jacobian else []
+
+    # each term k*P becomes k1*P + k2*phi(P); phi's tables come for free from P's
+    width = 1 << (WNAF_WIDTH - 2)
+    expansions = []
+    tables = []
+    for i, (k, _) in enumerate(live):
+        multiples = affine[i * width:(i + 1) * width]
+        for part, endo in zip(_split_scalar(k), (False, True)):
+            if part:
+                expansions.append(_wnaf(abs(part)))
+                tables.append(_signed_tables(multiples, negate=part < 0, endo=endo))
+
+    # schedule[i] lists the affine points added right after the i-th doubling
+    steps = max([COMB_COLUMNS] + [len(d) for d in expansions])
+    schedule = [[] for _ in range(steps)]
+    for j, idx in enumerate(reversed(_comb_columns(base_scalar % N))):
+        if idx:
+            schedule[j].append(comb[idx])
+    for digits, (pos, neg) in zip(expansions, tables):
+        for i, d in enumerate(digits):
+            if d > 0:
+                schedule[i].append(pos[d >> 1])
+            elif d < 0:
+                schedule[i].append(neg[(-d) >> 1])
+
+    # _double/_add_affine inlined: this loop is the whole cost of a login
+    p = P
+    X, Y, Z = _INF
+    for i in range(steps - 1, -1, -1):
+        if Z:
+            YY = Y * Y % p
+            S = 4 * X * YY % p
+            M = 3 * X * X % p
+            Z = 2 * Y * Z % p
+            X = (M * M - 2 * S) % p
+            Y = (M * (S - X) - 8 * YY * YY) % p
+        for x2, y2 in schedule[i]:
+            if not Z:
+                X, Y, Z = x2, y2, 1
+                continue
+            ZZ = Z * Z % p
+            H = (x2 * ZZ - X) % p
+            R = (y2 * ZZ * Z - Y) % p
+            if not H:
+                X, Y, Z = _double(X, Y, Z) if not R else _INF
+                continue
+            HH = H * H % p
+            HHH = H * HH % p
+            V = X * HH % p
+            X = (R * R - HHH - 2 * V) % p
+            Y = (R * (V - X) - Y * HHH) % p
+            Z = Z * H % p
+    return X, Y, Z
+
+
+def _equals_affine(jac, point):
+    X, Y, Z = jac
+    if not Z:
+        return point is None
+    if point is None:
+        return False
+    x, y = point
+    ZZ = Z * Z % P
+    return X == x * ZZ % P and Y == y * ZZ * Z % P
+
+
+def verify(Y, R, e, s):
+    """Check s*G == R + e*Y by computing s*G - e*Y in one pass and comparing with R."""
+    return _equals_affine(_linear_combination(s, [(N - e % N, Y)]), R)
+
+
+def multi_verify(base_scalar, terms):
+    """True if base_scalar*G + sum k_i*P_i is the point at infinity."""
+    return not _linear_combination(base_scalar, terms)[2]
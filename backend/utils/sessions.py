@@ -0,0 +1,317 @@
+"""
+Session tokens with idle and absolute expiry.
+Exports: create_session, resolve_session, revoke_session,
+         create_session_async, resolve_session_async, revoke_session_async,
+         SessionUnavailable
+
+Sessions live in the Mongo `sessions` collection. Their `expires_at` field
+carries a TTL index, so Mongo removes dead sessions by itself. Each worker
+keeps a size-bounded LRU of recently resolved tokens, including short-lived
+negative entries for unknown tokens. Logout writes to `session_revocations`,
+and every worker polls that collection (at most once per
+SESSION_REVOCATION_POLL seconds) to evict revoked tokens from its cache.
+In a threaded worker, one thread polls while the others carry on.
+
+A login first records its challenge key in `spent_challenges` (the key is
+the _id), where it stays until the challenge expires. That insert is what
+stops one challenge from opening two sessions on different workers, so it
+outlives the session: logout deletes the session, not the spent key. If
+either write fails, no token is issued (SessionUnavailable).
+
+The *_async functions do the same for the asyncio app (asgi.py). They use
+utils.adb and share this process's cache and revocation state with the sync ones.
+"""
+
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from pymongo.errors import DuplicateKeyError
+
+from utils import adb
+from utils.cache import Striped, TTLCache
+from utils.db import sessions as sessions_collection, session_revocations, spent_challenges
+
+load_dotenv()
+
+# seconds of inactivity after which a session ends
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "3600"))
+# hard cap on a session's lifetime, however active it is
+SESSION_MAX_TTL = int(os.getenv("SESSION_MAX_TTL", "86400"))
+# how often an active session's last_seen is written back (bounds write load)
+SESSION_TOUCH_INTERVAL = int(os.getenv("SESSION_TOUCH_INTERVAL", "60"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+# how long an unknown token is remembered as unknown
+SESSION_NEGATIVE_TTL = float(os.getenv("SESSION_NEGATIVE_TTL", "5"))
+SESSION_REVOCATION_POLL = float(os.getenv("SESSION_REVOCATION_POLL", "1"))
+# how long revocation records are kept; a worker idle for longer drops its whole cache
+REVOCATION_RETENTION = 300
+# tolerated clock skew between the workers writing revoked_at
+REVOCATION_SKEW = timedelta(seconds=5)
+
+_UNKNOWN = object()
+
+_cache = Striped(lambda size: TTLCache(maxsize=size, ttl=SESSION_MAX_TTL), SESSION_CACHE_SIZE)
+_last_revocation_poll = time.monotonic()
+_revocations_seen_until = datetime.utcnow()
+_poll_lock = threading.Lock()
+
+
+def _expiry(created_at, last_seen):
+    return min(last_seen + timedelta(seconds=SESSION_IDLE_TTL),
+               created_at + timedelta(seconds=SESSION_MAX_TTL))
+
+
+class SessionUnavailable(Exception):
+    """The session could not be persisted; no token was issued."""
+
+
+def create_session(username, challenge_key=None, challenge_exp=None):
+    """Persist a new session and return its token.
+    `challenge_key` (with its unix expiry `challenge_exp`) is spent first;
+    returns None if it was already spent (replayed challenge). Raises
+    SessionUnavailable if the store cannot be written.
+    """
+    try:
+        if challenge_key:
+            spent_challenges.insert_one(_spent(challenge_key, challenge_exp))
+        session = _new_session(username)
+        sessions_collection.insert_one(session)
+    except DuplicateKeyError:
+        return None
+    except Exception as e:
+        raise SessionUnavailable(str(e)) from e
+    return _cached(session)
+
+
+def _spent(challenge_key, challenge_exp):
+    # without an expiry the key is kept for a session's lifetime
+    expires_at = (datetime.utcfromtimestamp(challenge_exp) if challenge_exp
+                  else datetime.utcnow() + timedelta(seconds=SESSION_MAX_TTL))
+    return {"_id": challenge_key, "expires_at": expires_at}
+
+
+def _new_session(username):
+    now = datetime.utcnow()
+    return {
+        "token": secrets.token_hex(16),
+        "username": username,
+        "created_at": now,
+        "last_seen": now,
+        "expires_at": _expiry(now, now),
+    }
+
+
+def _cached(session):
+    session.pop("_id", None)
+    _cache.set(session["token"], session)
+    return session["token"]
+
+
+def _poll_due():
+    return time.monotonic() - _last_revocation_poll >= SESSION_REVOCATION_POLL
+
+
+def _poll_revocations():
+    if time.monotonic() - _last_revocation_poll < SESSION_REVOCATION_POLL:
+        return
+    # a poll is already running in another thread
+    if not _poll_lock.acquire(blocking=False):
+        return
+    try:
+        _poll_locked()
+    finally:
+        _poll_lock.release()
+
+
+def _poll_locked():
+    if not _start_poll():
+        return
+    try:
+        _apply_revocations(session_revocations.find(_revocations_query()))
+    except Exception:
+        pass
+
+
+def _start_poll():
+    """Claim this poll interval; False if another poll already took it."""
+    global _last_revocation_poll
+    now = time.monotonic()
+    elapsed = now - _last_revocation_poll
+    if elapsed < SESSION_REVOCATION_POLL:
+        return False
+    _last_revocation_poll = now
+    if elapsed >= REVOCATION_RETENTION:
+        # revocations we never saw may already have been purged
+        _cache.clear()
+    return True
+
+
+def _revocations_query():
+    return {"revoked_at": {"$gt": _revocations_seen_until - REVOCATION_SKEW}}
+
+
+def _apply_revocations(docs):
+    global _revocations_seen_until
+    for doc in docs:
+        _cache.pop(doc.get("token"))
+        if doc["revoked_at"] > _revocations_seen_until:
+            _revocations_seen_until = doc["revoked_at"]
+
+
+def resolve_session(token):
+    """Return the username for a live session token, or None."""
+    if not token:
+        return None
+    _poll_revocations()
+
+    now = datetime.utcnow()
+    session = _cache.get(token)
+    if session is _UNKNOWN:
+        return None
+    if session is None or session["expires_at"] <= now:
+        # another worker may have extended it; the database is authoritative
+        try:
+            stored = sessions_collection.find_one({"token": token})
+        except Exception:
+            stored = None
+        session = _from_stored(token, stored, now)
+        if session is None:
+            return None
+
+    touched = _touch(session, now)
+    if touched is not session:
+        try:
+            sessions_collection.update_one(
+                {"token": token},
+                {"$set": {"last_seen": now, "expires_at": touched["expires_at"]}},
+            )
+        except Exception:
+            pass
+    _cache.set(token, touched)
+    return touched["username"]
+
+
+def _from_stored(token, stored, now):
+    """Cache entry for a stored session, or None (remembered as unknown) if it has ended."""
+    if stored is not None:
+        created_at = stored.get("created_at") or now
+        session = {
+            "token": token,
+            "username": stored.get("username"),
+            "created_at": created_at,
+            "last_seen": stored.get("last_seen") or created_at,
+            # sessions from before expiry existed carry no expires_at and are treated as ended
+            "expires_at": stored.get("expires_at") or now,
+        }
+        if session["expires_at"] > now:
+            return session
+    _cache.set(token, _UNKNOWN, ttl=SESSION_NEGATIVE_TTL)
+    return None
+
+
+def _touch(session, now):
+    """The session with last_seen moved to now, once per SESSION_TOUCH_INTERVAL."""
+    if (now - session["last_seen"]).total_seconds() < SESSION_TOUCH_INTERVAL:
+        return session
+    return dict(session, last_seen=now, expires_at=_expiry(session["created_at"], now))
+
+
+def revoke_session(token):
+    """Delete a session and tell the other workers to drop it from their caches."""
+    _cache.pop(token)
+    now = datetime.utcnow()
+    try:
+        sessions_collection.delete_one({"token": token})
+    except Exception:
+        pass
+    try:
+        session_revocations.insert_one({
+            "token": token,
+            "revoked_at": now,
+            "expires_at": now + timedelta(seconds=REVOCATION_RETENTION),
+        })
+    except Exception:
+        pass
+
+
+async def create_session_async(username, challenge_key=None, challenge_exp=None):
+    """create_session for the asyncio app."""
+    try:
+        if challenge_key:
+            await adb.spent_challenges.insert_one(_spent(challenge_key, challenge_exp))
+        session = _new_session(username)
+        await adb.sessions.insert_one(session)
+    except DuplicateKeyError:
+        return None
+    except Exception as e:
+        raise SessionUnavailable(str(e)) from e
+    return _cached(session)
+
+
+async def _poll_revocations_async():
+    # _start_poll claims the interval, so concurrent requests do not poll twice
+    if not _poll_due() or not _poll_lock.acquire(blocking=False):
+        return
+    try:
+        claimed = _start_poll()
+    finally:
+        _poll_lock.release()
+    if claimed:
+        try:
+            _apply_revocations(await adb.session_revocations.find(_revocations_query()).to_list())
+        except Exception:
+            pass
+
+
+async def resolve_session_async(token):
+    """resolve_session for the asyncio app."""
+    if not token:
+        return None
+    await _poll_revocations_async()
+
+    now = datetime.utcnow()
+    session = _cache.get(token)
+    if session is _UNKNOWN:
+        return None
+    if session is None or session["expires_at"] <= now:
+        try:
+            stored = await adb.sessions.find_one({"token": token})
+        except Exception:
+            stored = None
+        session = _from_stored(token, stored, now)
+        if session is None:
+            return None
+
+    touched = _touch(session, now)
+    if touched is not session:
+        try:
+            await adb.sessions.update_one(
+                {"token": token},
+                {"$set": {"last_seen": now, "expires_at": touched["expires_at"]}},
+            )
+        except Exception:
+            pass
+    _cache.set(token, touched)
+    return touched["username"]
+
+
+async def revoke_session_async(token):
+    """revoke_session for the asyncio app."""
+    _cache.pop(token)
+    now = datetime.utcnow()
+    try:
+        await adb.sessions.delete_one({"token": token})
+    except Exception:
+        pass
+    try:
+        await adb.session_revocations.insert_one({
+            "token": token,
+            "revoked_at": now,
+            "expires_at": now + timedelta(seconds=REVOCATION_RETENTION),
+        })
+    except Exception:
+        pass
@@ -0,0 +1,1003 @@
+"""
+Embedded SQLite storage behind the pymongo Collection API used by this app.
+Exports: Client, Database, Collection, Cursor, Bucket
+
+STORAGE_BACKEND=sqlite (utils/db.py) swaps the MongoClient for a Client over
+one WAL-mode file, SQLITE_PATH. The collection proxies, and every module
+that queries through them, are unchanged. Each collection is a table
+    (id TEXT PRIMARY KEY, doc TEXT)
+holding the document as JSON; ObjectId, datetime and bytes values are
+tagged ({"$oid": hex}, {"$date": iso}, {"$binary": b64}), and datetimes are
+truncated to milliseconds as Mongo stores them.
+
+create_index() builds the same indexes as Mongo, over json_extract()
+expressions, unique and sparse (partial) included. expireAfterSeconds is
+recorded in the `_ttl` table and applied by a purge that runs with writes at
+most every TTL_PURGE_INTERVAL seconds, so like Mongo's TTL monitor it is
+lazy. Equality, $in, range and anchored-prefix $regex conditions, and the
+sort, run in SQL and use those indexes. Fields that have held an array are
+recorded in `_multikey` (as Mongo marks an index multikey), and conditions on
+them match any element through json_each() instead. Anything else ($or,
+$all, $exists, ...) is checked in Python on the rows SQL returns. Writes
+take the database write lock (BEGIN IMMEDIATE), so find_one_and_update and
+upserts are atomic across threads and processes, and insert_many /
+bulk_write commit in one transaction.
+
+Only the operators and methods the app uses are implemented; anything else
+raises NotImplementedError rather than silently matching differently.
+"""
+
+import base64
+import json
+import operator
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from gridfs.errors import NoFile
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+DUPLICATE_KEY = 11000
+TTL_PURGE_INTERVAL = 60.0
+FETCH_SIZE = 256
+
+_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_REGEX_SPECIAL = set(".^$*+?{}[]|()\\")
+_REGEX_FLAGS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}
+_SQL_RANGE = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_TYPES = {
+    "string": str, "date": datetime, "objectId": ObjectId, "bool": bool, "object": dict,
+    "array": list, "null": type(None), "binData": bytes, "double": float,
+    "int": int, "long": int, "number": (int, float),
+}
+
+
+# -- encoding ---------------------------------------------------------------
+
+def _naive_ms(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def _encode(value):
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, datetime):
+        return {"$date": _naive_ms(value).isoformat(timespec="milliseconds")}
+    if isinstance(value, (bytes, bytearray)):
+        return {"$binary": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _decode_hook(obj):
+    if len(obj) == 1:
+        (tag, value), = obj.items()
+        if tag == "$oid":
+            return ObjectId(value)
+        if tag == "$date":
+            return datetime.fromisoformat(value)
+        if tag == "$binary":
+            return base64.b64decode(value)
+    return obj
+
+
+def _dumps(value):
+    return json.dumps(_encode(value), separators=(",", ":"), ensure_ascii=False)
+
+
+def _loads(text):
+    return json.loads(text, object_hook=_decode_hook)
+
+
+def _canonical(value):
+    """A query value as it compares against stored values (datetimes in ms, naive UTC)."""
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, datetime):
+        return _naive_ms(value)
+    return value
+
+
+def _key(_id):
+    """The primary-key text of an _id."""
+    return _dumps(_id)
+
+
+def _quote(name):
+    if not _NAME.match(name):
+        raise ValueError(f"invalid collection name {name!r}")
+    return f'"{name}"'
+
+
+# -- matching ---------------------------------------------------------------
+
+def _lookup(value, parts):
+    """Values at a dotted path; arrays along the way contribute each element's value."""
+    if not parts:
+        return [value]
+    if isinstance(value, dict):
+        return _lookup(value[parts[0]], parts[1:]) if parts[0] in value else []
+    if isinstance(value, list):
+        found = []
+        for item in value:
+            if isinstance(item, dict):
+                found.extend(_lookup(item, parts))
+        if parts[0].isdigit() and int(parts[0]) < len(value):
+            found.extend(_lookup(value[int(parts[0])], parts[1:]))
+        return found
+    return []
+
+
+def _expand(values):
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+
+def _same(a, b):
+    return a == b and isinstance(a, bool) == isinstance(b, bool)
+
+
+def _eq(values, target):
+    if target is None and not values:
+        return True
+    return any(_same(v, target) or (isinstance(v, list) and any(_same(x, target) for x in v)) for v in values)
+
+
+def _comparable(a, b):
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b)
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return True
+    return type(a) is type(b) and isinstance(a, (str, datetime, ObjectId))
+
+
+def _compare(op):
+    def check(values, arg, _options):
+        return any(_comparable(v, arg) and op(v, arg) for v in _expand(values))
+    return check
+
+
+def _is_type(value, name):
+    expected = _TYPES.get(name)
+    if expected is None:
+        raise NotImplementedError(f"$type {name!r}")
+    if isinstance(value, bool) and name not in ("bool",):
+        return False
+    return isinstance(value, expected)
+
+
+def _regex(values, pattern, options):
+    if not isinstance(pattern, re.Pattern):
+        flags = 0
+        for flag in options or "":
+            flags |= _REGEX_FLAGS[flag]
+        pattern = re.compile(pattern, flags)
+    return any(isinstance(v, str) and pattern.search(v) for v in _expand(values))
+
+
+_OPERATORS = {
+    "$eq": lambda values, arg, _o: _eq(values, arg),
+    "$ne": lambda values, arg, _o: not _eq(values, arg),
+    "$in": lambda values, arg, _o: any(_eq(values, a) for a in arg),
+    "$nin": lambda values, arg, _o: not any(_eq(values, a) for a in arg),
+    "$gt": _compare(operator.gt),
+    "$gte": _compare(operator.ge),
+    "$lt": _compare(operator.lt),
+    "$lte": _compare(operator.le),
+    "$exists": lambda values, arg, _o: bool(values) == bool(arg),
+    "$regex": _regex,
+    "$all": lambda values, arg, _o: bool(arg) and all(_eq(values, a) for a in arg),
+    "$size": lambda values, arg, _o: any(isinstance(v, list) and len(v) == arg for v in values),
+    "$type": lambda values, arg, _o: any(
+        _is_type(v, name) for v in list(values) + [x for v in values if isinstance(v, list) for x in v]
+        for name in (arg if isinstance(arg, list) else [arg])),
+    "$not": lambda values, arg, _o: not _match_field(values, arg),
+}
+
+
+def _is_operator_dict(cond):
+    return isinstance(cond, dict) and bool(cond) and all(k.startswith("$") for k in cond)
+
+
+def _match_field(values, cond):
+    if isinstance(cond, re.Pattern):
+        return _regex(values, cond, None)
+    if not _is_operator_dict(cond):
+        return _eq(values, cond)
+    options = cond.get("$options")
+    for op, arg in cond.items():
+        if op == "$options":
+            continue
+        check = _OPERATORS.get(op)
+        if check is None:
+            raise NotImplementedError(f"query operator {op}")
+        if not check(values, arg, options):
+            return False
+    return True
+
+
+def matches(doc, query):
+    """True if `doc` matches the (canonical) Mongo filter `query`."""
+    for key, cond in query.items():
+        if key == "$and":
+            if not all(matches(doc, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, c) for c in cond):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, c) for c in cond):
+                return False
+        elif key.startswith("$"):
+            raise NotImplementedError(f"query operator {key}")
+        elif not _match_field(_lookup(doc, key.split(".")), cond):
+            return False
+    return True
+
+
+# -- projection and updates -------------------------------------------------
+
+def _get_path(doc, parts):
+    for part in parts:
+        if not isinstance(doc, dict) or part not in doc:
+            return None, False
+        doc = doc[part]
+    return doc, True
+
+
+def _set_path(doc, parts, value):
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+        if not isinstance(doc, dict):
+            raise NotImplementedError("updating a path through a non-document")
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc, parts):
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _project(doc, projection):
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include = [f for f, on in projection.items() if on and f != "_id"]
+    if include:
+        out = {"_id": doc["_id"]} if projection.get("_id", 1) and "_id" in doc else {}
+        for field in include:
+            parts = field.split(".")
+            value, found = _get_path(doc, parts)
+            if found:
+                _set_path(out, parts, value)
+        return out
+    out = dict(doc)
+    for field, on in projection.items():
+        if not on:
+            parts = field.split(".")
+            if len(parts) > 1:
+                out[parts[0]] = _loads(_dumps(out.get(parts[0])))
+            _unset_path(out, parts)
+    return out
+
+
+def _apply_update(doc, update, inserting):
+    if not _is_operator_dict(update):
+        replacement = dict(update)
+        if "_id" in doc:
+            replacement["_id"] = doc["_id"]
+        return replacement
+    doc = _loads(_dumps(doc))
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            parts = path.split(".")
+            if op in ("$set", "$setOnInsert"):
+                _set_path(doc, parts, value)
+            elif op == "$unset":
+                _unset_path(doc, parts)
+            elif op == "$inc":
+                current, found = _get_path(doc, parts)
+                if found and (isinstance(current, bool) or not isinstance(current, (int, float))):
+                    raise TypeError(f"cannot $inc non-numeric field {path!r}")
+                _set_path(doc, parts, (current if found else 0) + value)
+            elif op in ("$max", "$min"):
+                current, found = _get_path(doc, parts)
+                if not found or (operator.gt if op == "$max" else operator.lt)(value, current):
+                    _set_path(doc, parts, value)
+            else:
+                raise NotImplementedError(f"update operator {op}")
+    return doc
+
+
+def _equality_fields(query):
+    """The field: value pairs an upsert copies from its filter."""
+    for key, cond in query.items():
+        if key == "$and":
+            for clause in cond:
+                yield from _equality_fields(clause)
+        elif not key.startswith("$") and not _is_operator_dict(cond) and not isinstance(cond, re.Pattern):
+            yield key, cond
+        elif not key.startswith("$") and isinstance(cond, dict) and "$eq" in cond:
+            yield key, cond["$eq"]
+
+
+def _upsert_doc(query, update):
+    doc = {}
+    if _is_operator_dict(update):
+        for key, value in _equality_fields(query):
+            _set_path(doc, key.split("."), value)
+    doc = _apply_update(doc, update, inserting=True)
+    if "_id" not in doc:
+        _id = query.get("_id")
+        doc["_id"] = _id if _id is not None and not _is_operator_dict(_id) else ObjectId()
+    return doc
+
+
+# -- query planning ---------------------------------------------------------
+
+def _expr(field):
+    if field == "_id":
+        return "id"
+    return "json_extract(doc, '$" + "".join(f'."{part}"' for part in field.split(".")) + "')"
+
+
+def _pushable(value):
+    return isinstance(value, (str, int, float, ObjectId, datetime))
+
+
+def _sql_value(field, value):
+    if field == "_id":
+        return _key(value)
+    if isinstance(value, (ObjectId, datetime)):
+        return _dumps(value)
+    return value
+
+
+def _literal_prefix(pattern):
+    """The literal text an anchored regex requires, e.g. "^ab\\.c" -> "ab.c"."""
+    if not isinstance(pattern, str) or not pattern.startswith("^"):
+        return ""
+    prefix = []
+    i = 1
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                break
+            ch, i = pattern[i + 1], i + 2
+        elif ch in _REGEX_SPECIAL:
+            break
+        else:
+            i += 1
+        if i < len(pattern) and pattern[i] in "*?{":
+            break
+        prefix.append(ch)
+    return "".join(prefix)
+
+
+def _array_paths(doc, prefix=""):
+    for key, value in doc.items():
+        if isinstance(value, list):
+            yield prefix + key
+        elif isinstance(value, dict):
+            yield from _array_paths(value, prefix + key + ".")
+
+
+def _is_multikey(field, multikey):
+    parts = field.split(".")
+    return any(".".join(parts[:i]) in multikey for i in range(1, len(parts) + 1))
+
+
+def _field_sql(field, cond, params, multikey=(), expr=None):
+    """SQL for one field condition, appending its parameters. Returns (sql_parts, exact)."""
+    if expr is None and field != "_id" and _is_multikey(field, multikey):
+        # any element (or the value itself, in documents where it is not an array)
+        parts, _ = _field_sql(field, cond, params, expr="value")
+        if not parts:
+            return [], False
+        path = _expr(field)[len("json_extract(doc, "):-1]
+        return [f"EXISTS (SELECT 1 FROM json_each(doc, {path}) WHERE {' AND '.join(parts)})"], False
+    expr = expr or _expr(field)
+    if not _is_operator_dict(cond):
+        if cond is None:
+            return [f"{expr} IS NULL"], field == "_id"
+        if _pushable(cond) and not isinstance(cond, bool):
+            params.append(_sql_value(field, cond))
+            return [f"{expr} = ?"], True
+        return [], False
+    parts, exact = [], True
+    for op, arg in cond.items():
+        if op in _SQL_RANGE and _pushable(arg) and not isinstance(arg, bool):
+            parts.append(f"{expr} {_SQL_RANGE[op]} ?")
+            params.append(_sql_value(field, arg))
+        elif op in ("$eq", "$in"):
+            values = [arg] if op == "$eq" else list(arg)
+            if not all(_pushable(v) and not isinstance(v, bool) for v in values):
+                exact = False
+                continue
+            parts.append(f"{expr} IN ({', '.join('?' * len(values))})" if values else "0")
+            params.extend(_sql_value(field, v) for v in values)
+        elif op == "$regex" and not cond.get("$options") and _literal_prefix(arg) and field != "_id":
+            prefix = _literal_prefix(arg)
+            parts.append(f"{expr} >= ? AND {expr} < ?")
+            params.extend((prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+            exact = False
+        elif op != "$options":
+            exact = False
+    return parts, exact
+
+
+def _plan(query, multikey=()):
+    """(where_sql, params, exact): SQL that selects a superset of the matches, and
+    whether it selects exactly them."""
+    parts, params, exact = [], [], True
+    clauses = [query]
+    while clauses:
+        clause = clauses.pop()
+        for key, cond in clause.items():
+            if key == "$and":
+                clauses.extend(cond)
+            elif key.startswith("$"):
+                exact = False
+            else:
+                sql, field_exact = _field_sql(key, cond, params, multikey)
+                parts.extend(sql)
+                exact = exact and field_exact
+    return " AND ".join(f"({p})" for p in parts), params, exact
+
+
+def _sort_spec(key_or_list, direction=None):
+    if key_or_list is None:
+        return []
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return [(key, d) for key, d in key_or_list]
+
+
+# -- client, database, collections -----------------------------------------
+
+class Client:
+    """One SQLite file, shared by the threads (one connection each) and processes of a host."""
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._tables = set()
+        self._databases = {}
+        self._purged = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _ttl ("
+            " collection TEXT NOT NULL, field TEXT NOT NULL, seconds REAL NOT NULL,"
+            " PRIMARY KEY (collection, field))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _multikey ("
+            " collection TEXT NOT NULL, field TEXT NOT NULL, PRIMARY KEY (collection, field))"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        # connections must not cross a fork
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _table(self, name, ddl):
+        conn = self._conn()
+        if name not in self._tables:
+            for statement in ddl:
+                conn.execute(statement)
+            with self._lock:
+                self._tables.add(name)
+        return conn
+
+    @contextmanager
+    def _write(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get_database(self, name="zkp", **_options):
+        database = self._databases.get(name)
+        if database is None:
+            with self._lock:
+                database = self._databases.setdefault(name, Database(self, name))
+        return database
+
+    def __getitem__(self, name):
+        return self.get_database(name)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class Database:
+    """The collections of one Client. The file holds a single database; `name` is informational."""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def get_collection(self, name, **_options):
+        # read preferences and write concerns have no meaning for one local file
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections.setdefault(name, Collection(self, name))
+        return collection
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    def list_collection_names(self):
+        rows = self.client._conn().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE '\\_%' ESCAPE '\\'"
+        ).fetchall()
+        return [name for name, in rows]
+
+    def drop_collection(self, name):
+        self.get_collection(name).drop()
+
+
+class Cursor:
+    """Lazy result of Collection.find(); sort/limit/skip/batch_size before iterating."""
+
+    def __init__(self, collection, query, projection=None, sort=None, limit=0, skip=0, batch_size=0):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = _sort_spec(sort)
+        self._limit = limit
+        self._skip = skip
+        self._batch_size = batch_size
+        self._rows = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _sort_spec(key_or_list, direction)
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def batch_size(self, batch_size):
+        self._batch_size = batch_size
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._rows is None:
+            rows = self._collection._select(self._collection._conn(), self._query, self._sort,
+                                            self._limit, self._skip, self._batch_size)
+            self._rows = (_project(doc, self._projection) for _, doc in rows)
+        return next(self._rows)
+
+    def close(self):
+        if self._rows is not None:
+            self._rows.close()
+
+
+class Collection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self._table = _quote(name)
+
+    def __repr__(self):
+        return f"<sqlite collection {self.full_name}>"
+
+    def _conn(self):
+        return self.database.client._table(self.name, [
+            f"CREATE TABLE IF NOT EXISTS {self._table} (id TEXT PRIMARY KEY, doc TEXT NOT NULL)",
+        ])
+
+    def _multikey(self, conn):
+        return {field for field, in conn.execute("SELECT field FROM _multikey WHERE collection = ?", (self.name,))}
+
+    # reads
+
+    def _select(self, conn, query, sort=None, limit=0, skip=0, batch_size=0):
+        """Yield (key, doc) for the matching rows, in sort order."""
+        query = _canonical(query or {})
+        where, params, exact = _plan(query, self._multikey(conn))
+        sql = f"SELECT id, doc FROM {self._table}" + (f" WHERE {where}" if where else "")
+        if sort:
+            sql += " ORDER BY " + ", ".join(f"{_expr(f)} {'DESC' if d < 0 else 'ASC'}" for f, d in sort)
+        if exact and limit:
+            sql += f" LIMIT {int(limit)} OFFSET {int(skip)}"
+            skip = 0
+        cursor = conn.execute(sql, params)
+        returned = 0
+        while True:
+            rows = cursor.fetchmany(batch_size or FETCH_SIZE)
+            if not rows:
+                return
+            for key, text in rows:
+                doc = _loads(text)
+                if not exact and not matches(doc, query):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                yield key, doc
+                returned += 1
+                if limit and returned >= limit:
+                    cursor.close()
+                    return
+
+    def find(self, filter=None, projection=None, sort=None, limit=0, skip=0, batch_size=0, **_kwargs):
+        return Cursor(self, filter, projection, sort, limit, skip, batch_size)
+
+    def find_one(self, filter=None, projection=None, *args, sort=None, **_kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        return next(self.find(filter, projection, sort=sort, limit=1), None)
+
+    def count_documents(self, filter, limit=0, skip=0, **_kwargs):
+        conn = self._conn()
+        query = _canonical(filter)
+        where, params, exact = _plan(query, self._multikey(conn))
+        if exact and not limit and not skip:
+            return conn.execute(f"SELECT COUNT(*) FROM {self._table}" + (f" WHERE {where}" if where else ""),
+                                params).fetchone()[0]
+        return sum(1 for _ in self._select(conn, query, limit=limit, skip=skip))
+
+    def estimated_document_count(self, **_kwargs):
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def distinct(self, key, filter=None, **_kwargs):
+        values = []
+        for _, doc in self._select(self._conn(), filter):
+            for value in _expand(_lookup(doc, key.split("."))):
+                if not isinstance(value, list) and value not in values:
+                    values.append(value)
+        return values
+
+    # writes
+
+    def _note_arrays(self, conn, doc):
+        conn.executemany("INSERT OR IGNORE INTO _multikey (collection, field) VALUES (?, ?)",
+                         [(self.name, path) for path in _array_paths(doc)])
+
+    def _insert(self, conn, doc):
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()
+        self._note_arrays(conn, doc)
+        try:
+            conn.execute(f"INSERT INTO {self._table} (id, doc) VALUES (?, ?)", (_key(doc["_id"]), _dumps(doc)))
+        except sqlite3.IntegrityError as e:
+            raise self._duplicate(e, doc)
+        return doc["_id"]
+
+    def _duplicate(self, error, doc):
+        found = re.search(r"index '([^']+)'", str(error))
+        index = found.group(1).split(".", 1)[-1] if found else "_id_"
+        message = f"E11000 duplicate key error collection: {self.full_name} index: {index}"
+        return DuplicateKeyError(message, DUPLICATE_KEY, {"code": DUPLICATE_KEY, "errmsg": message, "op": doc})
+
+    def _replace(self, conn, key, doc):
+        self._note_arrays(conn, doc)
+        try:
+            conn.execute(f"UPDATE {self._table} SET doc = ? WHERE id = ?", (_dumps(doc), key))
+        except sqlite3.IntegrityError as e:
+            raise self._duplicate(e, doc)
+
+    def _update(self, conn, query, update, multi=False, upsert=False, sort=None):
+        """Apply one update; returns (raw_result, before, after) of the last document touched."""
+        matched = modified = 0
+        before = after = None
+        for key, doc in list(self._select(conn, query, sort=_sort_spec(sort), limit=0 if multi else 1)):
+            new = _loads(_dumps(_apply_update(doc, update, inserting=False)))
+            matched += 1
+            if new != doc:
+                self._replace(conn, key, new)
+                modified += 1
+            before, after = doc, new
+        raw = {"n": matched, "nModified": modified}
+        if not matched and upsert:
+            after = _upsert_doc(_canonical(query), update)
+            self._insert(conn, after)
+            after = _loads(_dumps(after))
+            raw = {"n": 1, "nModified": 0, "upserted": after["_id"]}
+        return raw, before, after
+
+    def _delete(self, conn, query, multi=False, sort=None):
+        query = _canonical(query)
+        where, params, exact = _plan(query, self._multikey(conn))
+        if multi and exact:
+            count = conn.execute(f"DELETE FROM {self._table}" + (f" WHERE {where}" if where else ""), params).rowcount
+            return count, None
+        rows = list(self._select(conn, query, sort=_sort_spec(sort), limit=0 if multi else 1))
+        conn.executemany(f"DELETE FROM {self._table} WHERE id = ?", [(key,) for key, _ in rows])
+        return len(rows), (rows[0][1] if rows else None)
+
+    def _after_write(self, conn):
+        client = self.database.client
+        now = time.monotonic()
+        if now - client._purged.get(self.name, 0.0) < TTL_PURGE_INTERVAL:
+            return
+        client._purged[self.name] = now
+        expiring = conn.execute("SELECT field, seconds FROM _ttl WHERE collection = ?", (self.name,)).fetchall()
+        for field, seconds in expiring:
+            # only date values expire, as with Mongo's TTL monitor
+            cutoff = _dumps(datetime.utcnow() - timedelta(seconds=seconds))
+            conn.execute(f"DELETE FROM {self._table} WHERE {_expr(field)} < ? AND {_expr(field)} >= ?",
+                         (cutoff, '{"$date":'))
+
+    @contextmanager
+    def _writing(self):
+        conn = self._conn()
+        with self.database.client._write(conn):
+            yield conn
+            self._after_write(conn)
+
+    def insert_one(self, document, **_kwargs):
+        with self._writing() as conn:
+            return InsertOneResult(self._insert(conn, document), True)
+
+    def insert_many(self, documents, ordered=True, **_kwargs):
+        documents = list(documents)
+        errors = []
+        with self._writing() as conn:
+            for i, doc in enumerate(documents):
+                try:
+                    self._insert(conn, doc)
+                except DuplicateKeyError as e:
+                    errors.append(dict(e.details, index=i))
+                    if ordered:
+                        break
+        if errors:
+            inserted = (errors[0]["index"] if ordered else len(documents) - len(errors))
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": inserted,
+                                  "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult([doc["_id"] for doc in documents], True)
+
+    def update_one(self, filter, update, upsert=False, **_kwargs):
+        with self._writing() as conn:
+            return UpdateResult(self._update(conn, filter, update, upsert=upsert)[0], True)
+
+    def update_many(self, filter, update, upsert=False, **_kwargs):
+        with self._writing() as conn:
+            return UpdateResult(self._update(conn, filter, update, multi=True, upsert=upsert)[0], True)
+
+    def replace_one(self, filter, replacement, upsert=False, **_kwargs):
+        return self.update_one(filter, replacement, upsert=upsert)
+
+    def delete_one(self, filter, **_kwargs):
+        with self._writing() as conn:
+            return DeleteResult({"n": self._delete(conn, filter)[0]}, True)
+
+    def delete_many(self, filter, **_kwargs):
+        with self._writing() as conn:
+            return DeleteResult({"n": self._delete(conn, filter, multi=True)[0]}, True)
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, **_kwargs):
+        with self._writing() as conn:
+            _, before, after = self._update(conn, filter, update, upsert=upsert, sort=sort)
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return _project(doc, projection) if doc is not None else None
+
+    def find_one_and_replace(self, filter, replacement, projection=None, sort=None, upsert=False,
+                             return_document=ReturnDocument.BEFORE, **_kwargs):
+        return self.find_one_and_update(filter, replacement, projection, sort, upsert, return_document)
+
+    def find_one_and_delete(self, filter, projection=None, sort=None, **_kwargs):
+        with self._writing() as conn:
+            _, doc = self._delete(conn, filter, sort=sort)
+        return _project(doc, projection) if doc is not None else None
+
+    def bulk_write(self, requests, ordered=True, **_kwargs):
+        result = {"writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        with self._writing() as conn:
+            for i, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        self._insert(conn, request._doc)
+                        result["nInserted"] += 1
+                    elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                        raw = self._update(conn, request._filter, request._doc,
+                                           multi=isinstance(request, UpdateMany), upsert=request._upsert)[0]
+                        if "upserted" in raw:
+                            result["nUpserted"] += 1
+                            result["upserted"].append({"index": i, "_id": raw["upserted"]})
+                        else:
+                            result["nMatched"] += raw["n"]
+                            result["nModified"] += raw["nModified"]
+                    elif isinstance(request, (DeleteOne, DeleteMany)):
+                        result["nRemoved"] += self._delete(conn, request._filter, multi=isinstance(request, DeleteMany))[0]
+                    else:
+                        raise NotImplementedError(f"bulk_write {type(request).__name__}")
+                except DuplicateKeyError as e:
+                    result["writeErrors"].append(dict(e.details, index=i))
+                    if ordered:
+                        break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # indexes
+
+    def create_index(self, keys, unique=False, sparse=False, expireAfterSeconds=None, name=None, **_kwargs):
+        keys = _sort_spec(keys, 1)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        columns = ", ".join(f"{_expr(field)} {'DESC' if direction == -1 else 'ASC'}" for field, direction in keys)
+        where = " AND ".join(f"{_expr(field)} IS NOT NULL" for field, _ in keys) if sparse else ""
+        conn = self._conn()
+        conn.execute(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS \"{self.name}.{name}\""
+            f" ON {self._table} ({columns})" + (f" WHERE {where}" if where else "")
+        )
+        if expireAfterSeconds is not None:
+            conn.execute(
+                "INSERT INTO _ttl (collection, field, seconds) VALUES (?, ?, ?)"
+                " ON CONFLICT (collection, field) DO UPDATE SET seconds = excluded.seconds",
+                (self.name, keys[0][0], float(expireAfterSeconds)),
+            )
+        return name
+
+    def drop(self, **_kwargs):
+        conn = self._conn()
+        conn.execute(f"DROP TABLE IF EXISTS {self._table}")
+        conn.execute("DELETE FROM _ttl WHERE collection = ?", (self.name,))
+        conn.execute("DELETE FROM _multikey WHERE collection = ?", (self.name,))
+        client = self.database.client
+        with client._lock:
+            client._tables.discard(self.name)
+
+
+# -- GridFS-like bucket -----------------------------------------------------
+
+class Bucket:
+    """The GridFSBucket subset utils/blobstore.py uses, as a files table and a chunks table."""
+
+    def __init__(self, db, bucket_name="fs", chunk_size_bytes=255 * 1024):
+        self._client = db.client
+        self.name = bucket_name
+        self.chunk_size = chunk_size_bytes
+        self._files = _quote(f"{bucket_name}_files")
+        self._chunks = _quote(f"{bucket_name}_chunks")
+
+    def _conn(self):
+        return self._client._table(self._files, [
+            f"CREATE TABLE IF NOT EXISTS {self._files} ("
+            " id TEXT PRIMARY KEY, filename TEXT, length INTEGER NOT NULL, chunk_size INTEGER NOT NULL,"
+            " upload_date TEXT NOT NULL, metadata TEXT)",
+            f"CREATE TABLE IF NOT EXISTS {self._chunks} ("
+            " files_id TEXT NOT NULL, n INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (files_id, n))"
+            " WITHOUT ROWID",
+        ])
+
+    def open_upload_stream_with_id(self, file_id, filename, metadata=None, **_kwargs):
+        return _Upload(self, file_id, filename, metadata)
+
+    def open_download_stream(self, file_id, **_kwargs):
+        row = self._conn().execute(f"SELECT length FROM {self._files} WHERE id = ?", (_key(file_id),)).fetchone()
+        if row is None:
+            raise NoFile(f"no file in bucket {self.name} with _id {file_id!r}")
+        return _Download(self, _key(file_id), row[0])
+
+    def delete(self, file_id, **_kwargs):
+        conn = self._conn()
+        with self._client._write(conn):
+            deleted = conn.execute(f"DELETE FROM {self._files} WHERE id = ?", (_key(file_id),)).rowcount
+            conn.execute(f"DELETE FROM {self._chunks} WHERE files_id = ?", (_key(file_id),))
+        if not deleted:
+            raise NoFile(f"no file in bucket {self.name} with _id {file_id!r}")
+
+
+class _Upload:
+    def __init__(self, bucket, file_id, filename, metadata):
+        self._bucket = bucket
+        self._key = _key(file_id)
+        self.filename = filename
+        self.metadata = metadata
+        self._buffer = bytearray()
+        self._n = 0
+        self._length = 0
+
+    def _put(self, data):
+        self._bucket._conn().execute(f"INSERT INTO {self._bucket._chunks} (files_id, n, data) VALUES (?, ?, ?)",
+                                     (self._key, self._n, bytes(data)))
+        self._n += 1
+
+    def write(self, data):
+        self._buffer += data
+        self._length += len(data)
+        size = self._bucket.chunk_size
+        while len(self._buffer) >= size:
+            self._put(self._buffer[:size])
+            del self._buffer[:size]
+
+    def close(self):
+        if self._buffer:
+            self._put(self._buffer)
+            self._buffer.clear()
+        bucket = self._bucket
+        bucket._conn().execute(
+            f"INSERT INTO {bucket._files} (id, filename, length, chunk_size, upload_date, metadata)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (self._key, self.filename, self._length, bucket.chunk_size,
+             _naive_ms(datetime.utcnow()).isoformat(), _dumps(self.metadata or {})),
+        )
+
+    def abort(self):
+        self._bucket._conn().execute(f"DELETE FROM {self._bucket._chunks} WHERE files_id = ?", (self._key,))
+
+
+class _Download:
+    def __init__(self, bucket, key, length):
+        self._bucket = bucket
+        self._key = key
+        self.length = length
+        self._n = 0
+        self._buffer = b""
+
+    def read(self, size=-1):
+        out = bytearray()
+        while size < 0 or len(out) < size:
+            if not self._buffer:
+                row = self._bucket._conn().execute(
+                    f"SELECT data FROM {self._bucket._chunks} WHERE files_id = ? AND n = ?", (self._key, self._n)
+                ).fetchone()
+                if row is None:
+                    break
+                self._buffer = row[0]
+                self._n += 1
+            take = len(self._buffer) if size < 0 else size - len(out)
+            out += self._buffer[:take]
+            self._buffer = self._buffer[take:]
+        return bytes(out)
+
+    def close(self):
+        self._buffer = b""
@@ -0,0 +1,176 @@
+"""
+Bulk user import from NDJSON.
+Exports: IMPORT_BATCH_SIZE, import_users
+
+Each input line is one registration record, the same JSON that
+/auth/register takes: {username, publicY, salt_kdf, kdf_params,
+encrypted_backup?, vault_blob?}. Records are validated in memory (required
+fields, and publicY must decode to a point on the curve) and then written
+IMPORT_BATCH_SIZE at a time with one unordered insert_many. There is no
+existence check: the unique username / username_norm indexes reject
+duplicates, whether the user was already in the database or appeared
+earlier in the same input. A batch whose insert_many fails outright (no
+per-document report, e.g. a lost connection) is rolled back and all of its
+lines are reported as errors. Each batch writes one IMPORT audit event
+instead of one REGISTER per user.
+"""
+
+import json
+import logging
+import os
+from binascii import unhexlify
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError
+
+from utils import blobstore
+from utils import schnorr
+from utils import user_repo
+from utils.db import users
+from utils.logger import log_event
+
+load_dotenv()
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+REQUIRED_FIELDS = ("username", "publicY", "salt_kdf", "kdf_params")
+DUPLICATE_KEY = 11000
+
+
+def _parse(line):
+    """Return (user_doc, None) for a valid record, else (None, error message)."""
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None, "Invalid JSON"
+    if not isinstance(data, dict):
+        return None, "Record must be a JSON object"
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            return None, f"Missing {field}"
+    username_norm = user_repo.normalize(data["username"])
+    if not username_norm:
+        return None, "Invalid username"
+    try:
+        schnorr.decode_point(unhexlify(data["publicY"]))
+    except (TypeError, ValueError):
+        return None, "Invalid publicY"
+
+    now = datetime.utcnow()
+    return {
+        "username": data["username"],
+        "username_norm": username_norm,
+        "publicY": data["publicY"],
+        "salt_kdf": data["salt_kdf"],
+        "kdf_params": data["kdf_params"],
+        "encrypted_backup": data.get("encrypted_backup"),
+        "vault_blob": data.get("vault_blob"),
+        "vault_version": 1 if data.get("vault_blob") else 0,
+        "created_at": now,
+        "updated_at": now,
+    }, None
+
+
+def _store_blobs(doc):
+    """Move large blobs to chunked storage, as /auth/register does. Returns the refs."""
+    refs = []
+    try:
+        for field in ("encrypted_backup", "vault_blob"):
+            inline, ref = blobstore.store_value(doc[field], metadata={"username_norm": doc["username_norm"], "field": field})
+            doc[field] = inline
+            if ref is not None:
+                doc[field + "_ref"] = ref
+                refs.append(ref)
+    except Exception:
+        for ref in refs:
+            blobstore.delete(ref)
+        raise
+    return refs
+
+
+def _insert(batch):
+    """insert_many one batch of (line_no, doc, refs). Yields a result per record."""
+    failed = {}
+    keep_blobs = False
+    try:
+        users.insert_many([doc for _, doc, _ in batch], ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            failed[err["index"]] = "Username already exists" if err.get("code") == DUPLICATE_KEY else err.get("errmsg")
+    except Exception as e:
+        # no per-document report: roll the whole batch back and fail every line
+        keep_blobs = not _roll_back([doc["_id"] for _, doc, _ in batch if "_id" in doc])
+        failed = dict.fromkeys(range(len(batch)), f"Database write failed: {e}")
+
+    for i, (line_no, doc, refs) in enumerate(batch):
+        if i in failed:
+            for ref in () if keep_blobs else refs:
+                blobstore.delete(ref)
+            yield {"line": line_no, "username": doc["username"], "status": "error", "message": failed[i]}
+        else:
+            user_repo.invalidate(doc["username_norm"])
+            yield {"line": line_no, "username": doc["username"], "status": "created"}
+
+
+def _roll_back(ids):
+    """Remove whatever part of a failed batch did land. Returns False if that
+    failed too: some of those users may exist, so their blobs are left alone
+    (an unreferenced blob is harmless, a dangling reference is not)."""
+    try:
+        users.delete_many({"_id": {"$in": ids}})
+        return True
+    except Exception as e:
+        logging.warning("user import: could not roll back %d users: %s", len(ids), e)
+        return False
+
+
+def import_users(lines, batch_size=IMPORT_BATCH_SIZE, source=None):
+    """Import NDJSON records from an iterable of lines (str or bytes).
+
+    Yields one result per non-blank line:
+    {"line", "username", "status": "created" | "error", "message"?}.
+    A rejected record is reported at once, the others when their batch is
+    written, so results are not strictly in line order. Memory use is bounded
+    by one batch, whatever the input size.
+    """
+    batch = []
+
+    def _flush():
+        created = 0
+        for result in _insert(batch):
+            created += result["status"] == "created"
+            yield result
+        log_event("IMPORT", details=f"Bulk import{f' from {source}' if source else ''}: "
+                                    f"{created} of {len(batch)} users created.")
+        batch.clear()
+
+    for line_no, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        if not line.strip():
+            continue
+        doc, error = _parse(line)
+        if doc is not None:
+            try:
+                refs = _store_blobs(doc)
+            except blobstore.BlobTooLarge as e:
+                doc, error = None, str(e)
+            except Exception as e:
+                doc, error = None, f"Blob storage failed: {e}"
+        if doc is None:
+            yield {"line": line_no, "username": _username_of(line), "status": "error", "message": error}
+            continue
+        batch.append((line_no, doc, refs))
+        if len(batch) >= batch_size:
+            yield from _flush()
+    if batch:
+        yield from _flush()
+
+
+def _username_of(line):
+    try:
+        username = json.loads(line).get("username")
+    except (ValueError, AttributeError):
+        return None
+    return username if isinstance(username, str) else None
@@ -0,0 +1,157 @@
+"""
+User lookups with per-endpoint projections.
+Exports: normalize, get_auth, get_auth_async, get_backup, exists, insert_user, invalidate,
+         warm, backfill_username_norm
+
+Every lookup is a single find_one on the unique username_norm index that
+fetches only the fields its endpoint needs, never vault_blob or other
+large fields. The login metadata (publicY, salt_kdf, kdf_params) is written
+once at registration, so get_auth keeps it in a bounded per-worker TTL
+cache together with the already-decoded public-key point. Write paths that
+touch those fields call invalidate(); USER_CACHE_TTL bounds how long another
+worker can keep serving an old copy. warm() fills the cache ahead of the
+first logins (gunicorn's master does it before forking, see utils/preload.py).
+"""
+
+import os
+from binascii import unhexlify
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils import adb, schnorr
+from utils.cache import Striped, TTLCache
+from utils.db import users
+
+load_dotenv()
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+AUTH_FIELDS = {"_id": 0, "username": 1, "username_norm": 1, "publicY": 1, "salt_kdf": 1, "kdf_params": 1}
+BACKUP_FIELDS = {"_id": 0, "encrypted_backup": 1, "encrypted_backup_ref": 1, "salt_kdf": 1, "kdf_params": 1}
+
+_auth_cache = Striped(lambda size: TTLCache(maxsize=size, ttl=USER_CACHE_TTL), USER_CACHE_SIZE)
+
+
+def normalize(username):
+    """Canonical form used for lookups (None for non-strings)."""
+    if not isinstance(username, str):
+        return None
+    return username.strip().lower()
+
+
+def _decode_key(public_y):
+    """Return (Y_bytes, Y_point); (None, None) if the stored key is malformed."""
+    try:
+        Y_bytes = unhexlify(public_y)
+        return Y_bytes, schnorr.decode_point(Y_bytes)
+    except (TypeError, ValueError):
+        return None, None
+
+
+def get_auth(username):
+    """Login metadata for a user, or None.
+    The returned dict is shared by the cache and must not be modified. Besides the
+    AUTH_FIELDS it carries Y_bytes and Y_point (None when publicY does not decode).
+    """
+    username_norm = normalize(username)
+    if not username_norm:
+        return None
+    auth = _auth_cache.get(username_norm)
+    if auth is not None:
+        return auth
+
+    doc = users.reading("auth").find_one({"username_norm": username_norm}, AUTH_FIELDS)
+    if doc is None:
+        return None
+    doc["Y_bytes"], doc["Y_point"] = _decode_key(doc.get("publicY"))
+    _auth_cache.set(username_norm, doc)
+    return doc
+
+
+async def get_auth_async(username):
+    """get_auth for the asyncio app (same cache)."""
+    username_norm = normalize(username)
+    if not username_norm:
+        return None
+    auth = _auth_cache.get(username_norm)
+    if auth is not None:
+        return auth
+
+    doc = await adb.users.find_one({"username_norm": username_norm}, AUTH_FIELDS)
+    if doc is None:
+        return None
+    doc["Y_bytes"], doc["Y_point"] = _decode_key(doc.get("publicY"))
+    _auth_cache.set(username_norm, doc)
+    return doc
+
+
+def warm(usernames, batch_size=1000):
+    """Load and decode the login metadata of `usernames` into the cache.
+    Returns how many users were found."""
+    names = [n for n in dict.fromkeys(normalize(u) for u in usernames) if n]
+    loaded = 0
+    for i in range(0, len(names), batch_size):
+        for doc in users.reading("auth").find({"username_norm": {"$in": names[i:i + batch_size]}}, AUTH_FIELDS):
+            doc["Y_bytes"], doc["Y_point"] = _decode_key(doc.get("publicY"))
+            _auth_cache.set(doc["username_norm"], doc)
+            loaded += 1
+    return loaded
+
+
+def get_backup(username):
+    """Encrypted key backup and KDF parameters for a user, or None."""
+    username_norm = normalize(username)
+    if not username_norm:
+        return None
+    return users.reading("auth").find_one({"username_norm": username_norm}, BACKUP_FIELDS)
+
+
+def exists(username_norm):
+    return users.find_one({"username_norm": username_norm}, {"_id": 1}) is not None
+
+
+def insert_user(user_doc):
+    users.insert_one(user_doc)
+    invalidate(user_doc["username_norm"])
+
+
+def invalidate(username_norm):
+    """Drop cached metadata after a write to publicY, salt_kdf or kdf_params."""
+    _auth_cache.pop(username_norm)
+
+
+def backfill_username_norm(batch_size=1000, log=print):
+    """Give every legacy user document a username_norm (one pass, safe to re-run).
+    Returns (updated, collisions). Collisions are legacy usernames whose normalized
+    form is already taken; they are logged and left for manual resolution.
+    """
+    updated = 0
+    collisions = []
+
+    def _flush(ops, names):
+        nonlocal updated
+        try:
+            updated += users.bulk_write(ops, ordered=False).modified_count
+        except BulkWriteError as e:
+            updated += e.details.get("nModified", 0)
+            for err in e.details.get("writeErrors", []):
+                collisions.append(names[err["index"]])
+                log(f"username_norm collision for {names[err['index']]!r}: {err.get('errmsg')}")
+
+    ops, names = [], []
+    for doc in users.find({"username_norm": {"$exists": False}}, {"username": 1}).batch_size(batch_size):
+        username_norm = normalize(doc.get("username"))
+        if not username_norm:
+            log(f"skipping user {doc['_id']}: no username")
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"username_norm": username_norm}}))
+        names.append(doc.get("username"))
+        if len(ops) >= batch_size:
+            _flush(ops, names)
+            ops, names = [], []
+    if ops:
+        _flush(ops, names)
+    return updated, collisions
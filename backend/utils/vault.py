@@ -0,0 +1,172 @@
+"""
+Versioned encrypted vault blobs.
+Exports: etag, matches, expected_version, read_vault, write_vault, write_vault_stream,
+         read_vault_async, write_vault_async, VaultConflict
+
+users.vault_version goes up by one on every write of vault_blob, so the
+version alone identifies the blob's content. It is sent as a strong
+ETag ("v<version>"):
+  - GET /vault answers If-None-Match with 304 and no body;
+  - writes carrying If-Match are applied only if the stored version still
+    matches, otherwise VaultConflict (HTTP 409) instead of a silent overwrite.
+Documents written before versioning carry no vault_version and count as version 0.
+read_vault_async and write_vault_async serve the asyncio app (asgi.py); chunked
+blobs are still stored and deleted through utils.blobstore, on a worker thread.
+"""
+
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from utils import adb, blobstore
+from utils.db import users
+
+_VAULT_FIELDS = {"vault_blob": 1, "vault_blob_ref": 1, "vault_version": 1}
+# find_one_and_update arguments of a commit: what it replaced, for _committed
+_COMMIT_OPTIONS = {"projection": {"vault_version": 1, "vault_blob_ref": 1}, "return_document": ReturnDocument.BEFORE}
+
+
+class VaultConflict(Exception):
+    """The stored vault changed since the version the client based its write on."""
+
+    def __init__(self, current_version):
+        super().__init__("Vault was modified by another client")
+        self.current_version = current_version
+
+
+def etag(version):
+    return f'"v{int(version or 0)}"'
+
+
+def _parse(header):
+    """Split an If-Match / If-None-Match value into its entity tags (weak prefix dropped)."""
+    tags = []
+    for part in (header or "").split(","):
+        part = part.strip()
+        if part.startswith("W/"):
+            part = part[2:]
+        if part:
+            tags.append(part)
+    return tags
+
+
+def matches(header, version):
+    """True if the conditional header names the given version (or is '*')."""
+    tags = _parse(header)
+    return "*" in tags or etag(version) in tags
+
+
+def expected_version(header):
+    """Version a client's If-Match refers to, None if absent or '*'.
+    Raises ValueError for a tag this server never issued.
+    """
+    tags = [t for t in _parse(header) if t != "*"]
+    if not tags:
+        return None
+    if len(tags) != 1 or not (tags[0].startswith('"v') and tags[0].endswith('"')):
+        raise ValueError("If-Match must name a single vault version")
+    return int(tags[0][2:-1])
+
+
+def read_vault(username_norm):
+    """Return (vault_blob, version, ref), or None if the user does not exist.
+    A blob kept in chunked storage comes back as (None, version, ref); stream it
+    with blobstore.open_stream(ref).
+    """
+    return _stored(users.reading("vault").find_one({"username_norm": username_norm}, _VAULT_FIELDS))
+
+
+def _stored(doc):
+    if doc is None:
+        return None
+    return doc.get("vault_blob"), doc.get("vault_version") or 0, doc.get("vault_blob_ref")
+
+
+def write_vault(username_norm, vault_blob, if_match=None):
+    """Store a new vault_blob and return its version (None if the user does not exist).
+    With `if_match` (an If-Match header value) the write only applies to that version,
+    else VaultConflict is raised. Blobs above BLOB_INLINE_MAX go to chunked storage.
+    """
+    expected = expected_version(if_match)
+    inline, ref = blobstore.store_value(vault_blob, metadata={"username_norm": username_norm, "field": "vault_blob"})
+    return _commit(username_norm, expected, inline, ref)
+
+
+def write_vault_stream(username_norm, chunks, content_encoding=None, if_match=None):
+    """Like write_vault, streaming the blob's JSON bytes straight into chunked storage."""
+    expected = expected_version(if_match)
+    ref = blobstore.store_stream(chunks, content_encoding,
+                                 metadata={"username_norm": username_norm, "field": "vault_blob"})
+    return _commit(username_norm, expected, None, ref)
+
+
+def _commit(username_norm, expected, inline, ref):
+    query, update = _commit_update(username_norm, expected, inline, ref)
+    try:
+        before = users.find_one_and_update(query, update, **_COMMIT_OPTIONS)
+    except Exception:
+        blobstore.delete(ref)
+        raise
+    version, unreachable = _committed(before, ref)
+    blobstore.delete(unreachable)
+    if version is not None or expected is None:
+        return version
+    return _conflict(users.find_one({"username_norm": username_norm}, {"vault_version": 1}))
+
+
+def _commit_update(username_norm, expected, inline, ref):
+    query = {"username_norm": username_norm}
+    if expected is not None:
+        # unversioned legacy documents are version 0
+        query["vault_version"] = expected if expected else {"$in": [0, None]}
+
+    update = {"$set": {"vault_blob": inline, "updated_at": datetime.utcnow()}, "$inc": {"vault_version": 1}}
+    if ref is not None:
+        update["$set"]["vault_blob_ref"] = ref
+    else:
+        update["$unset"] = {"vault_blob_ref": ""}
+    return query, update
+
+
+def _committed(before, ref):
+    """(new version, blob ref to delete) after the commit update matched `before`
+    (None: it matched nothing, and the blob just stored at `ref` is not needed)."""
+    if before is None:
+        return None, ref
+    # the replaced chunked blob is no longer reachable
+    return (before.get("vault_version") or 0) + 1, before.get("vault_blob_ref")
+
+
+def _conflict(current):
+    """None if the user is gone, else raise VaultConflict with its current version."""
+    if current is None:
+        return None
+    raise VaultConflict(current.get("vault_version") or 0)
+
+
+async def read_vault_async(username_norm):
+    """read_vault for the asyncio app (always from the primary)."""
+    return _stored(await adb.users.find_one({"username_norm": username_norm}, _VAULT_FIELDS))
+
+
+async def _delete_blob_async(ref):
+    if ref is not None:
+        await adb.run_blocking(blobstore.delete, ref)
+
+
+async def write_vault_async(username_norm, vault_blob, if_match=None):
+    """write_vault for the asyncio app: _commit's steps, awaiting each database call."""
+    expected = expected_version(if_match)
+    inline, ref = await adb.run_blocking(blobstore.store_value, vault_blob,
+                                         metadata={"username_norm": username_norm, "field": "vault_blob"})
+    query, update = _commit_update(username_norm, expected, inline, ref)
+    try:
+        before = await adb.users.find_one_and_update(query, update, **_COMMIT_OPTIONS)
+    except Exception:
+        await _delete_blob_async(ref)
+        raise
+    version, unreachable = _committed(before, ref)
+    await _delete_blob_async(unreachable)
+    if version is not None or expected is None:
+        return version
+    return _conflict(await adb.users.find_one({"username_norm": username_norm}, {"vault_version": 1}))
@@ -0,0 +1,232 @@
+"""
+Proof verification off the request thread.
+Exports: start, verify, verify_async, batch_verify, Overloaded, queue_depth
+
+The curve arithmetic is pure Python and holds the GIL for the whole scalar
+multiplication. Each gunicorn worker therefore hands it to its own small
+process pool (VERIFY_POOL_WORKERS processes, 0 runs it in-process). Admission
+is bounded: at most VERIFY_QUEUE_MAX proofs may be queued or running per
+worker. Anything beyond that is shed at once with Overloaded. A proof that
+has not been verified within VERIFY_DEADLINE seconds is abandoned the same
+way. The routes turn Overloaded into 503 with Retry-After, so latency stays
+bounded under a login burst instead of growing with the backlog.
+
+Shedding needs more proofs in flight per process than VERIFY_QUEUE_MAX, so
+it depends on the server. The asyncio app keeps many logins in flight on one
+event loop, and the default bound (64) is meant for it. A sync gunicorn
+worker has one request in flight, so it can never shed, and a pool would only
+add processes and IPC. gunicorn.conf.py therefore defaults these settings by
+worker class when they are left blank:
+  sync:    VERIFY_POOL_WORKERS=0 (verify inline; no admission control applies)
+  gthread: VERIFY_POOL_WORKERS=2, VERIFY_QUEUE_MAX=GUNICORN_THREADS // 2, so a
+           login burst can hold at most half a worker's threads
+
+verify_async is the same for the asyncio app (asgi.py). It awaits the pool
+job without blocking the event loop or a thread. With
+VERIFY_POOL_WORKERS=0 it verifies on the loop's default thread pool.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+from utils import schnorr, secp256k1
+from utils.metrics import Counter, Gauge, Histogram
+
+load_dotenv()
+
+# blank means the default for the server (see above)
+VERIFY_POOL_WORKERS = int(os.getenv("VERIFY_POOL_WORKERS") or "2")
+VERIFY_QUEUE_MAX = int(os.getenv("VERIFY_QUEUE_MAX") or "64")
+VERIFY_DEADLINE = float(os.getenv("VERIFY_DEADLINE", "2.0"))
+# seconds suggested to shed clients in Retry-After
+VERIFY_RETRY_AFTER = int(os.getenv("VERIFY_RETRY_AFTER", "1"))
+
+wait_seconds = Histogram("zkp_verify_wait_seconds", "Time a verification job waited for a pool process.")
+rejected_total = Counter("zkp_verify_rejected_total", "Verification jobs shed by admission control.",
+                         labelnames=("reason",))
+
+
+class Overloaded(Exception):
+    """The verification pool cannot take (or finish) this job in time."""
+
+    def __init__(self, reason, retry_after=VERIFY_RETRY_AFTER):
+        super().__init__(f"Verification capacity exceeded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _warm():
+    # build the fixed-base table once per pool process rather than on its first proof
+    secp256k1.comb_table()
+
+
+def _timed(fn, args, submitted):
+    # CLOCK_MONOTONIC is system-wide, so the parent's submit time is comparable here
+    return time.monotonic() - submitted, fn(*args)
+
+
+class _Pool:
+    """Lazily created per-process executor guarded by an admission semaphore."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._slots = None
+        self._in_flight = 0
+
+    def _ensure_started(self):
+        # (re)create after fork: a gunicorn worker must not share its parent's pool
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._executor = self._new_executor()
+            self._slots = threading.BoundedSemaphore(VERIFY_QUEUE_MAX)
+            self._in_flight = 0
+            self._pid = os.getpid()
+
+    @staticmethod
+    def _new_executor():
+        if VERIFY_POOL_WORKERS <= 0:
+            return None
+        # spawn: forking a worker that runs the audit and Mongo threads is not safe
+        executor = ProcessPoolExecutor(
+            max_workers=VERIFY_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm,
+        )
+        try:
+            # pay the interpreter start-up once here, not inside the first proof's deadline
+            executor.submit(_warm).result()
+        except Exception:
+            # e.g. a __main__ that cannot be re-imported by spawn; verify in-process instead
+            logging.warning("verification pool failed to start; verifying in-process", exc_info=True)
+            executor.shutdown(wait=False, cancel_futures=True)
+            return None
+        return executor
+
+    def depth(self):
+        return self._in_flight if self._pid == os.getpid() else 0
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def run(self, fn, *args):
+        self._ensure_started()
+        if not self._slots.acquire(blocking=False):
+            rejected_total.inc("queue_full")
+            raise Overloaded("queue_full")
+        with self._lock:
+            self._in_flight += 1
+
+        if self._executor is None:
+            try:
+                return fn(*args)
+            finally:
+                self._release()
+
+        try:
+            future = self._executor.submit(_timed, fn, args, time.monotonic())
+        except BrokenProcessPool:
+            self._release()
+            self._restart()
+            return fn(*args)
+        # the slot stays taken until the job really ends, even if we stop waiting
+        future.add_done_callback(self._release)
+        try:
+            waited, result = future.result(timeout=VERIFY_DEADLINE)
+        except FutureTimeout:
+            future.cancel()
+            rejected_total.inc("deadline")
+            raise Overloaded("deadline")
+        except BrokenProcessPool:
+            self._restart()
+            return fn(*args)
+        wait_seconds.observe(waited)
+        return result
+
+    async def run_async(self, fn, *args):
+        """run() for a coroutine: same admission control and deadline, awaited."""
+        self._ensure_started()
+        if not self._slots.acquire(blocking=False):
+            rejected_total.inc("queue_full")
+            raise Overloaded("queue_full")
+        with self._lock:
+            self._in_flight += 1
+
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            try:
+                return await loop.run_in_executor(None, fn, *args)
+            finally:
+                self._release()
+
+        try:
+            future = self._executor.submit(_timed, fn, args, time.monotonic())
+        except BrokenProcessPool:
+            self._release()
+            self._restart()
+            return await loop.run_in_executor(None, fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            # shield: on timeout the job keeps its slot until it really ends, as in run()
+            waited, result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), VERIFY_DEADLINE)
+        except asyncio.TimeoutError:
+            future.cancel()
+            rejected_total.inc("deadline")
+            raise Overloaded("deadline")
+        except BrokenProcessPool:
+            self._restart()
+            return await loop.run_in_executor(None, fn, *args)
+        wait_seconds.observe(waited)
+        return result
+
+    def _restart(self):
+        # a pool process died (e.g. OOM-killed); replace the executor and keep the slots
+        with self._lock:
+            executor, self._executor = self._executor, self._new_executor()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = _Pool()
+Gauge("zkp_verify_queue_depth", "Verification jobs queued or running in this worker's pool.", func=_pool.depth)
+
+
+def queue_depth():
+    return _pool.depth()
+
+
+def start():
+    """Start this process's pool now instead of on the first proof."""
+    _pool._ensure_started()
+
+
+def verify(Y, R, e, s):
+    """schnorr.verify in the pool. Raises Overloaded."""
+    return _pool.run(schnorr.verify, Y, R, e, s)
+
+
+async def verify_async(Y, R, e, s):
+    """verify() for the asyncio app. Raises Overloaded."""
+    return await _pool.run_async(schnorr.verify, Y, R, e, s)
+
+
+def batch_verify(items):
+    """schnorr.batch_verify in the pool (one job for the whole batch). Raises Overloaded."""
+    items = list(items)
+    if not items:
+        return []
+    return _pool.run(schnorr.batch_verify, items)
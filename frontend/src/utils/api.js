@@ -2,8 +2,21 @@
 const BASE_URL = (import.meta.env?.VITE_API_URL) || 'http://localhost:5000'
 const MAILER_URL = (import.meta.env?.VITE_MAILER_URL) || 'http://localhost:5050'
 
+// Replication position of this client's last request. Sent back so reads served
+// by a replica already include our own earlier writes (e.g. right after register).
+let readAfter = null;
+
+async function apiFetch(path, options = {}) {
+  const res = await fetch(`${BASE_URL}${path}`, {
+    ...options,
+    headers: { ...(options.headers || {}), ...(readAfter ? { 'X-Read-After': readAfter } : {}) }
+  });
+  readAfter = res.headers.get('X-Read-After') || readAfter;
+  return res;
+}
+
 export async function register(payload) {
-  const res = await fetch(`${BASE_URL}/auth/register`, {
+  const res = await apiFetch('/auth/register', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(payload)
@@ -12,7 +25,7 @@ export async function register(payload) {
 }
 
 export async function requestChallenge(username) {
-  const res = await fetch(`${BASE_URL}/auth/challenge`, {
+  const res = await apiFetch('/auth/challenge', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ username })
@@ -21,7 +34,31 @@ export async function requestChallenge(username) {
 }
 
 export async function verifyLogin(payload) {
-  const res = await fetch(`${BASE_URL}/auth/verify`, {
+  const res = await apiFetch('/auth/verify', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload)
+  });
+  return res.json();
+}
+
+// One-shot login: the epoch is cached until it rolls over, so a login is a
+// single POST /auth/login. serverOffset corrects a skewed device clock.
+let loginEpoch = null;
+
+export async function getLoginEpoch() {
+  const now = Date.now() / 1000;
+  if (!loginEpoch || now + loginEpoch.serverOffset >= loginEpoch.valid_until) {
+    const res = await apiFetch('/auth/epoch', { method: 'GET' });
+    const data = await res.json();
+    if (data.status !== 'success') return data;
+    loginEpoch = { ...data, serverOffset: data.server_time - now };
+  }
+  return { ...loginEpoch, ts: Math.floor(now + loginEpoch.serverOffset) };
+}
+
+export async function loginOneShot(payload) {
+  const res = await apiFetch('/auth/login', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(payload)
@@ -30,18 +67,23 @@ export async function verifyLogin(payload) {
 }
 
 //ENCRYPTED VAULT FUNCTIONS
+// ETag of the vault version this client last read or wrote; sent as If-Match
+// so a write based on a stale copy gets 409 instead of overwriting newer data.
+let vaultEtag = null;
+
 export async function getVault() {
   const sessionToken = localStorage.getItem('session_token');
   if (!sessionToken)
     return { status: 'error', message: 'Missing session token' };
 
-  const res = await fetch(`${BASE_URL}/vault`, {
+  const res = await apiFetch('/vault', {
     method: 'GET',
     headers: {
       'Content-Type': 'application/json',
       'Authorization': `Bearer ${sessionToken}`
     }
   });
+  vaultEtag = res.headers.get('ETag') || vaultEtag;
   return res.json();
 }
 
@@ -50,14 +92,16 @@ export async function updateVault(vault_blob) {
   if (!sessionToken)
     return { status: 'error', message: 'Missing session token' };
 
-  const res = await fetch(`${BASE_URL}/vault`, {
+  const res = await apiFetch('/vault', {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
-      'Authorization': `Bearer ${sessionToken}`
+      'Authorization': `Bearer ${sessionToken}`,
+      ...(vaultEtag ? { 'If-Match': vaultEtag } : {})
     },
     body: JSON.stringify({ vault_blob })
   });
+  if (res.ok) vaultEtag = res.headers.get('ETag') || vaultEtag;
   return res.json();
 }
 
@@ -66,7 +110,7 @@ export async function logout() {
   if (!sessionToken)
     return { status: 'error', message: 'Missing session token' };
 
-  const res = await fetch(`${BASE_URL}/auth/logout`, {
+  const res = await apiFetch('/auth/logout', {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
@@ -91,7 +135,7 @@ export async function sendSharesEmail({ recipients, fromEmail, username }) {
 
 // Save vault for a username without a session token (used after wallet setup)
 export async function saveVault(username, vault_blob) {
-  const res = await fetch(`${BASE_URL}/auth/save-vault`, {
+  const res = await apiFetch('/auth/save-vault', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ username, vault_blob })
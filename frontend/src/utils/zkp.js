@@ -94,3 +94,9 @@ export async function generateProof(x, serverChallenge) {
     c: c.toString(16),
   };
 }
+
+// Challenge string for a one-shot login (POST /auth/login), proved with
+// generateProof(x, loginChallenge(epoch, ts, username))
+export function loginChallenge(epoch, ts, username) {
+  return `${epoch}:${ts}:${username.trim().toLowerCase()}`;
+}